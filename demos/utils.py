@@ -85,21 +85,25 @@ def prep_zero():
     return  FTquantinuum_circuit
     
 
-def decoder_2d(syndrome_diff):
+def decoder_2d(syndrome_diff, bad_syndromes=None):
     """
     A 2D decoder that determines logical corrections. Due to symmetry, can be 
     used to decode stabilizer measurements of any Pauli type.
     
     Args:
         syndrom_diff: The change in syndromes compared to the last time.
+        bad_syndromes: Syndromes whose correction flips the logical qubit. Defaults
+            to the Steane code table; other codes can use
+            LookupTableDecoder.flip_table from src/Decoding.py.
     
     Returns:
         A bit representing whether a logical error has occurred.
     """
 
-    bad_syndromes = {[0, 1, 0], [0, 1, 1], [0, 0, 1]}
+    if bad_syndromes is None:
+        bad_syndromes = {(0, 1, 0), (0, 1, 1), (0, 0, 1)}
     
-    if syndrome_diff in bad_syndromes:
+    if tuple(syndrome_diff) in bad_syndromes:
         logical_error = 1
     else:
         logical_error = 0
@@ -107,31 +111,30 @@ def decoder_2d(syndrome_diff):
     return logical_error
 
 
-def decoder_flag_update(syndrome_diff, flag_diff):
+def decoder_flag_update(syndrome_diff, flag_diff, flag_table=None):
     """
     A lookup decoder used to modify corrections due hook errors indicated by changes 
     in flag and sydrome. 
     Args:
         syndrome diff: The change in syndromes compared to the last time.
         flag_diff: The change in flags compared to the last time.
+        flag_table: (flag, syndrome) pairs indicating hook faults. Defaults to the
+            Steane code table; other codes can use
+            LookupTableDecoder.flip_table(..., with_flagged=True) from src/Decoding.py.
     Returns:
         A bit representing whether the 2D decoder's correction should be changed due 
         to relationship between flags and syndromes.
     """
     # The following indicate hook faults have occured:
-    
-    # flag -> syndrome: 0 -> 1
-    if flag_diff == [1, 0, 0] and syndrome_diff == [0, 1, 0]: 
-        change_correction = 1
-        
-    # flag -> syndrome: 0 -> 2
-    elif flag_diff == [1, 0, 0] and syndrome_diff == [0, 0, 1]: 
+    if flag_table is None:
+        flag_table = {
+            ((1, 0, 0), (0, 1, 0)), # flag -> syndrome: 0 -> 1
+            ((1, 0, 0), (0, 0, 1)), # flag -> syndrome: 0 -> 2
+            ((0, 1, 1), (0, 0, 1)), # flag -> syndrome: 1,2 -> 2
+        }
+
+    if (tuple(flag_diff), tuple(syndrome_diff)) in flag_table:
         change_correction = 1
-        
-   # flag -> syndrome: 1,2 -> 2
-    elif flag_diff == [0, 1, 1] and syndrome_diff == [0, 0, 1]: 
-        change_correction = 1
-        
     else:
         change_correction = 0
     
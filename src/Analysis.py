@@ -4,10 +4,14 @@ from matplotlib import pyplot as plt
 
 from qiskit.visualization import plot_distribution, plot_histogram
 
+from ResultStore import ColumnarSweepStore, columns_from_data, histogram_indices
+from Counts import EncodedCounts
+from GF2 import popcount
+
 """
     Plot a three-dimensional bar chart comparing qubit count and circuit length to expectation value.
     Parameters:
-        - data: dict[n_qubits, dict[circuit_length, (result, counts)]]
+        - data: dict[n_qubits, dict[circuit_length, (result, counts)]], a ColumnarSweepStore, or columns as returned by ColumnarSweepStore.latest_columns
         - title: Plot title
         - save: If true, output plot is saved
         - filename: Filename to be saved as, if save is True
@@ -17,8 +21,7 @@ from qiskit.visualization import plot_distribution, plot_histogram
         - plt: A matplotlib plot object
 """
 def circuit_scaling_bar3d(data, title=None, save=False, filename=None, save_dir=None, show=False):
-    if not isinstance(data, dict):
-        raise ValueError("The 'data' parameter should be a dictionary of the form dict[n_qubits, dict[circuit_length, (result, counts)]].")
+    columns = sweep_columns(data)
 
     if title == None:
         title = "Circuit scaling bar chart"
@@ -26,18 +29,10 @@ def circuit_scaling_bar3d(data, title=None, save=False, filename=None, save_dir=
     if save:
         filename, save_dir = sanitize_save_parameters(filename, save_dir, default_filename="circuit_scaling_bar3d")
 
-    n_qubits_vals = []
-    circuit_length_vals = []
-    exp_vals = []
-    
-    for n_qubits, sub_data in data.items():
-        # @TODO - make this work better for data where not every qubit count has the same range of circuit lengths
-        for circuit_length, (result, counts) in sub_data.items():
-            n_qubits_vals.append(n_qubits)
-            circuit_length_vals.append(circuit_length)
-            
-            exp_val = calculate_exp_val(counts)
-            exp_vals.append(exp_val)
+    # @TODO - make this work better for data where not every qubit count has the same range of circuit lengths
+    n_qubits_vals = columns["n_qubits"]
+    circuit_length_vals = columns["circuit_length"]
+    exp_vals = column_exp_vals(columns)
 
     ax = plt.figure().add_subplot(projection='3d')
 
@@ -60,6 +55,34 @@ def circuit_scaling_bar3d(data, title=None, save=False, filename=None, save_dir=
 
     return plt
 
+# Columns of sweep data given as a dict (as returned by circuit_scaling_experiment), a ColumnarSweepStore or columns
+def sweep_columns(data):
+    if isinstance(data, ColumnarSweepStore):
+        return data.latest_columns()
+
+    if not isinstance(data, dict):
+        raise ValueError("The 'data' parameter should be a dictionary of the form dict[n_qubits, dict[circuit_length, (result, counts)]], a ColumnarSweepStore or its columns.")
+
+    return data if "hist_start" in data else columns_from_data(data)
+
+"""
+    Expectation value (mean number of 1s per shot) of every point of sweep columns, computed on the columns at once.
+    Parameters:
+        - columns: Columns as returned by sweep_columns
+    Returns:
+        - exp_vals: float array with the expectation value of each point, in the order of the point columns
+"""
+def column_exp_vals(columns):
+    rows = np.arange(len(columns["n_qubits"]))
+    hist_rows, record_of_row, word_indices, row_of_word = histogram_indices(columns, rows)
+
+    ones = np.bincount(row_of_word, weights=popcount(columns["outcome_words"][word_indices]), minlength=len(hist_rows))
+    frequencies = np.asarray(columns["frequency"][hist_rows], dtype=float)
+    shots = np.bincount(record_of_row, weights=frequencies, minlength=len(rows))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.bincount(record_of_row, weights=ones*frequencies, minlength=len(rows))/shots
+
 """
     Plot a scatterplot comparing QEC cycle count and fidelity
     Parameters:
@@ -90,22 +113,143 @@ def qec_cycle_efficiency_plot(qec_cycle_counts, fidelities=None, counts_list=Non
     raise NotImplementedError("Circuit length fidelity profiles are not fully implemented!")
 
 """
-    Computes expectation value from circuit measurement counts.
+    Computes the probability of a state from circuit measurement counts.
+    Parameters:
+        - state: Output bitstring, with or without spaces between registers
+        - counts: dict[output, frequency] or EncodedCounts
 """
 def calculate_state_probability(state, counts):
-    total_counts = sum(list(counts.values()))
+    if not isinstance(counts, EncodedCounts):
+        counts = EncodedCounts.from_counts(counts)
 
     # @TODO - generalize for superposition states
-    state_probability = counts[state]/total_counts
-
-    return state_probability
+    return counts.probability(state)
 
+"""
+    Computes expectation value (mean number of 1s per shot) from circuit measurement counts.
+    Parameters:
+        - counts: dict[output, frequency] or EncodedCounts
+"""
 def calculate_exp_val(counts):
-    total_counts = sum(list(counts.values())) 
+    if not isinstance(counts, EncodedCounts):
+        counts = EncodedCounts.from_counts(counts)
+
+    return counts.exp_val()
+
+"""
+    Per-shot values of a target quantity for the outputs of a counts dict, as used for adaptive sampling.
+    Parameters:
+        - counts: dict[output, frequency]
+        - target: "exp_val" (number of 1s in the output, as estimated by calculate_exp_val), ("state_probability", state),
+                  "logical_error_rate" or ("logical_error_rate", expected_output), or a callable mapping an output to its value
+        - circuit: LogicalCircuit which produced the counts, required for the logical error rate
+        - registers: Names of the registers the outputs cover if they were restricted to some registers (see Experiments.benchmark_noise),
+                     or None if they cover every register
+    Returns:
+        - values: float array with the value of each output
+        - frequencies: int array with the frequency of each output
+        - binary: True if the target is a probability, i.e. every value is 0 or 1
+"""
+def target_values(counts, target, circuit=None, registers=None):
+    outputs = list(counts.keys())
+    frequencies = np.array([counts[output] for output in outputs], dtype=np.int64)
+
+    name, argument = (target[0], target[1]) if isinstance(target, tuple) else (target, None)
+
+    if callable(target):
+        values = np.array([target(output) for output in outputs], dtype=float)
+        return values, frequencies, bool(np.all((values == 0) | (values == 1)))
+    elif name == "exp_val":
+        values = popcount(EncodedCounts.from_counts(counts).words).sum(axis=1, dtype=np.int64).astype(float)
+        return values, frequencies, False
+    elif name == "state_probability":
+        values = np.array([output.replace(" ", "") == argument.replace(" ", "") for output in outputs], dtype=float)
+        return values, frequencies, True
+    elif name == "logical_error_rate":
+        if circuit is None or not hasattr(circuit, "get_logical_outputs"):
+            raise ValueError("The logical error rate can only be estimated for counts of a LogicalCircuit, which must be provided.")
+
+        logical_outputs = circuit.get_logical_outputs(outputs, registers=registers)
+        expected_output = np.zeros(logical_outputs.shape[1], dtype=np.uint8) if argument is None else np.asarray(argument, dtype=np.uint8)
+        values = np.any(logical_outputs != expected_output, axis=1).astype(float)
+        return values, frequencies, True
+
+    raise ValueError(f"Unknown target {target}; expected 'exp_val', ('state_probability', state), 'logical_error_rate' or a callable.")
+
+"""
+    Sufficient statistics of a target quantity over the shots of a counts dict, which can be merged across batches of shots.
+    Parameters:
+        - counts, target, circuit, registers: As for target_values
+    Returns:
+        - tally: dict with the number of shots, the sum and the sum of squares of the per-shot values, and whether the target is binary
+"""
+def target_tally(counts, target, circuit=None, registers=None):
+    values, frequencies, binary = target_values(counts, target, circuit=circuit, registers=registers)
+
+    return {
+        "shots": int(frequencies.sum()),
+        "sum": float(np.dot(values, frequencies)),
+        "sum_sq": float(np.dot(values**2, frequencies)),
+        "binary": binary,
+    }
+
+def merge_tallies(tally, other):
+    if tally is None:
+        return dict(other)
+
+    return {
+        "shots": tally["shots"] + other["shots"],
+        "sum": tally["sum"] + other["sum"],
+        "sum_sq": tally["sum_sq"] + other["sum_sq"],
+        "binary": tally["binary"] and other["binary"],
+    }
+
+"""
+    Wilson score interval of a binomial proportion, which stays well-behaved for small numbers of successes.
+    Parameters:
+        - successes: Number of successes
+        - trials: Number of trials
+        - z: Quantile of the standard normal distribution, e.g. 1.96 for a 95% interval
+    Returns:
+        - lower, upper: Bounds of the interval
+"""
+def wilson_interval(successes, trials, z=1.96):
+    if trials == 0:
+        return 0.0, 1.0
+
+    p = successes/trials
+    denominator = 1 + z**2/trials
+    center = (p + z**2/(2*trials))/denominator
+    half_width = z/denominator*np.sqrt(p*(1-p)/trials + z**2/(4*trials**2))
+
+    return max(0.0, center-half_width), min(1.0, center+half_width)
+
+"""
+    Estimate and confidence interval of the target quantity of a tally.
+    Binary targets use the Wilson score interval and all other targets a normal interval with the sample variance.
+    Parameters:
+        - tally: Tally returned by target_tally or merge_tallies
+        - z: Quantile of the standard normal distribution, e.g. 1.96 for a 95% interval
+    Returns:
+        - estimate, lower, upper: Sample mean and bounds of its interval
+"""
+def tally_interval(tally, z=1.96):
+    n = tally["shots"]
+    if n == 0:
+        return np.nan, -np.inf, np.inf
+
+    estimate = tally["sum"]/n
+    if tally["binary"]:
+        lower, upper = wilson_interval(tally["sum"], n, z=z)
+        return estimate, lower, upper
+
+    if n < 2:
+        return estimate, -np.inf, np.inf
 
-    exp_val = sum([key.count("1") for key in counts])/total_counts
+    variance = max(tally["sum_sq"] - n*estimate**2, 0.0)/(n-1)
+    half_width = z*np.sqrt(variance/n)
 
-    return exp_val
+    return estimate, estimate-half_width, estimate+half_width
 
 def sanitize_save_parameters(filename, save_dir, default_filename="plot", default_save_dir="./"):
     if filename == None:
@@ -0,0 +1,144 @@
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+from types import MappingProxyType
+
+# Version of the on-disk cache format, to be increased whenever the layout of the cache files changes
+cache_format_version = 2
+
+# Hash of the sources of all modules next to this one, which generate the cached objects (codes, decoders, flag schedules, ...)
+# On-disk entries are keyed by it, so that objects built by any other version of the code are rebuilt instead of being reused
+_source_hash = None
+def source_hash():
+    global _source_hash
+    if _source_hash is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".py"):
+                with open(os.path.join(directory, filename), "rb") as f:
+                    digest.update(filename.encode() + b"\0" + f.read())
+        _source_hash = digest.hexdigest()
+
+    return _source_hash
+
+class CodeRegistry:
+    """
+    Process-wide cache of objects derived from a stabilizer code (encoding circuit, logical gates, decoders, ...),
+    keyed by the code label and stabilizer tableau so that they are only constructed once and shared by all circuits.
+    Persistent objects can also be stored in a cache directory, keyed by the code, the cache format version and the source hash.
+    The cache files are pickles, and loading a pickle can execute arbitrary code: the cache directory (including one given through
+    the LOGICAL_CODE_CACHE_DIR environment variable) must only be writable by trusted users.
+    """
+
+    def __init__(self, max_codes=16, cache_dir=None):
+        self.max_codes = max_codes
+        self.cache_dir = cache_dir
+        self._codes = OrderedDict()
+
+    @staticmethod
+    def key(label, stabilizer_tableau):
+        return (tuple(int(x) for x in label), tuple(stabilizer_tableau))
+
+    # Key of an on-disk entry, which also identifies the format and the code that generated it
+    @staticmethod
+    def _disk_key(key):
+        return (key, cache_format_version, source_hash())
+
+    def _cache_path(self, key, name):
+        digest = hashlib.sha256(repr(self._disk_key(key)).encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{digest}_{name}.pkl")
+
+    def _load(self, key, name):
+        if self.cache_dir is None:
+            return None
+
+        path = self._cache_path(key, name)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                stored_key, value = pickle.load(f)
+        except Exception:
+            # Corrupt or incompatible cache files are simply rebuilt
+            return None
+
+        return value if stored_key == self._disk_key(key) else None
+
+    def _store(self, key, name, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(key, name)
+
+        # Write to a temporary file first so that concurrent workers never read a partially written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self._disk_key(key), value), f)
+        os.replace(tmp_path, path)
+
+    """
+        Get an object derived from a code, constructing it with factory() on a cache miss.
+        Parameters:
+            - label: Code label (n, k, d)
+            - stabilizer_tableau: List of stabilizers as Pauli strings
+            - name: Name of the derived object, e.g. "code" or "decoder"
+            - factory: Callable without arguments which constructs the object
+            - persist: If true and a cache directory is configured, the object is also stored on disk for other processes
+        Returns:
+            - value: The shared object, which must not be modified by the caller
+    """
+    def get(self, label, stabilizer_tableau, name, factory, persist=False):
+        key = self.key(label, stabilizer_tableau)
+
+        if key in self._codes:
+            self._codes.move_to_end(key)
+        else:
+            self._codes[key] = {}
+            # Evict the least recently used codes
+            while self.max_codes is not None and len(self._codes) > self.max_codes:
+                self._codes.popitem(last=False)
+
+        entries = self._codes[key]
+        if name not in entries:
+            value = self._load(key, name) if persist else None
+            if value is None:
+                value = factory()
+                if persist and self.cache_dir is not None:
+                    self._store(key, name, value)
+
+            entries[name] = MappingProxyType(value) if isinstance(value, dict) else value
+
+        return entries[name]
+
+    def clear(self, include_disk=False):
+        self._codes.clear()
+
+        if include_disk and self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(".pkl"):
+                    os.remove(os.path.join(self.cache_dir, filename))
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, label_and_tableau):
+        return self.key(*label_and_tableau) in self._codes
+
+# The on-disk cache can also be enabled through the environment, so that worker processes warm-start from it
+code_registry = CodeRegistry(cache_dir=os.environ.get("LOGICAL_CODE_CACHE_DIR"))
+
+"""
+    Configure the process-wide code registry.
+    Parameters:
+        - max_codes: Maximum number of codes kept in memory before the least recently used code is evicted (None for unbounded)
+        - cache_dir: Directory for the on-disk cache, or None to disable it; as the cache holds pickles, it must only be writable by trusted users
+"""
+def configure_code_registry(max_codes=16, cache_dir=None):
+    code_registry.max_codes = max_codes
+    code_registry.cache_dir = cache_dir
+
+    while max_codes is not None and len(code_registry._codes) > max_codes:
+        code_registry._codes.popitem(last=False)
+
+    return code_registry
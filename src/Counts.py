@@ -0,0 +1,190 @@
+import numpy as np
+
+from Decoding import memory_to_array
+from GF2 import popcount
+
+# Integer-encoded measurement outcomes: outcome bitstrings are read as binary numbers, so that clbit i is bit i of the outcome,
+# and stored as little-endian 64-bit words (bit i of the outcome is bit i % 64 of word i // 64)
+
+def n_outcome_words(n_bits):
+    return np.maximum(1, -(-np.asarray(n_bits) // 64))
+
+# Packs an (n_outcomes, n_bits) bit array, where column i is clbit i, into an (n_outcomes, n_words) array of outcome words
+def pack_bits(bits):
+    bits = np.asarray(bits, dtype=np.uint8)
+    n_words = int(n_outcome_words(bits.shape[1]))
+    packed = np.zeros((bits.shape[0], 8*n_words), dtype=np.uint8)
+    packed[:, :-(-bits.shape[1] // 8)] = np.packbits(bits, axis=1, bitorder="little")
+
+    return packed.view("<u8").astype(np.uint64)
+
+# Inverse of pack_bits
+def unpack_bits(words, n_bits):
+    words = np.ascontiguousarray(words, dtype="<u8")
+    return np.unpackbits(words.view(np.uint8), axis=1, count=n_bits, bitorder="little")
+
+"""
+    Histogram of integer-encoded measurement outcomes, with vectorized register-aware marginalization and statistics.
+    Parameters:
+        - words: uint64 array of shape (n_outcomes, n_words) with the outcome words (see pack_bits)
+        - frequencies: int array with the frequency of each outcome, which need not be distinct
+        - registers: list of (name, width) of the classical registers in clbit order, i.e. the first register holds clbit 0
+"""
+class EncodedCounts:
+    def __init__(self, words, frequencies, registers):
+        self.words = np.asarray(words, dtype=np.uint64)
+        self.frequencies = np.asarray(frequencies, dtype=np.int64)
+        self.registers = [(name, int(width)) for name, width in registers]
+        self.n_bits = sum(width for _, width in self.registers)
+
+    """
+        Encode a counts dict, e.g. from result.get_counts().
+        Parameters:
+            - counts: dict[output, frequency], with spaces between the classical registers of the outputs
+            - register_names: Names of the classical registers in clbit order (e.g. [creg.name for creg in circuit.cregs]), or None
+        Returns:
+            - encoded: EncodedCounts
+    """
+    @classmethod
+    def from_counts(cls, counts, register_names=None):
+        outputs = list(counts.keys())
+        widths = [len(register) for register in outputs[0].split(" ")][::-1] if len(outputs) > 0 else []
+        if register_names is None:
+            register_names = [None] * len(widths)
+        elif len(register_names) != len(widths):
+            raise ValueError(f"Expected {len(widths)} register names for outputs such as '{outputs[0]}', got {len(register_names)}")
+
+        bits = memory_to_array(outputs) if len(outputs) > 0 else np.zeros((0, 0), dtype=np.uint8)
+        frequencies = np.fromiter(counts.values(), dtype=np.int64, count=len(outputs))
+
+        return cls(pack_bits(bits), frequencies, list(zip(register_names, widths)))
+
+    """
+        Encode per-shot outcomes, merging equal outcomes.
+        Parameters:
+            - bits: uint8 array of shape (n_shots, n_bits), where column i is clbit i (see Decoding.memory_to_array), or shot memory from result.get_memory()
+            - registers: list of (name, width) in clbit order, defaulting to a single unnamed register
+            - frequencies: Frequency of each row of bits, defaulting to one shot per row
+        Returns:
+            - encoded: EncodedCounts
+    """
+    @classmethod
+    def from_bits(cls, bits, registers=None, frequencies=None):
+        bits = memory_to_array(bits)
+        if registers is None:
+            registers = [(None, bits.shape[1])]
+        if frequencies is None:
+            frequencies = np.ones(bits.shape[0], dtype=np.int64)
+
+        return cls(pack_bits(bits), frequencies, registers).merged()
+
+    # Encodes the counts of a circuit from a Qiskit result, naming the outcome bits after the classical registers of the circuit
+    @classmethod
+    def from_result(cls, result, circuit):
+        return cls.from_counts(result.get_counts(circuit), register_names=[creg.name for creg in circuit.cregs])
+
+    @property
+    def shots(self):
+        return int(self.frequencies.sum())
+
+    # Distinct outcomes with their total frequencies
+    def merged(self):
+        if self.words.shape[1] == 1:
+            unique_words, inverse = np.unique(self.words[:, 0], return_inverse=True)
+            unique_words = unique_words[:, None]
+        else:
+            unique_words, inverse = np.unique(self.words, axis=0, return_inverse=True)
+
+        frequencies = np.bincount(inverse.reshape(-1), weights=self.frequencies, minlength=len(unique_words)).astype(np.int64)
+        return EncodedCounts(unique_words, frequencies, self.registers)
+
+    # Clbit indices of the given registers (by name) or clbits (by index), in the given order
+    def clbit_indices(self, selection):
+        starts = np.cumsum([0] + [width for _, width in self.registers])
+        names = [name for name, _ in self.registers]
+
+        indices = []
+        for item in selection:
+            if isinstance(item, str):
+                if item not in names:
+                    raise ValueError(f"Unknown classical register '{item}'")
+                r = names.index(item)
+                indices += list(range(starts[r], starts[r+1]))
+            else:
+                indices.append(int(item))
+
+        return np.array(indices, dtype=np.int64)
+
+    # Bits of every outcome as an (n_outcomes, n_clbits) uint8 array, for all clbits or the given registers/clbits
+    def bits(self, selection=None):
+        if selection is None:
+            return unpack_bits(self.words, self.n_bits)
+
+        clbits = self.clbit_indices(selection)
+        return ((self.words[:, clbits // 64] >> (clbits % 64).astype(np.uint64)) & np.uint64(1)).astype(np.uint8)
+
+    """
+        Marginal counts over a selection of registers or clbits.
+        Parameters:
+            - selection: list of register names, which are kept as registers, or of clbit indices, which form a single unnamed register (in the given order)
+        Returns:
+            - marginal: EncodedCounts with distinct outcomes
+    """
+    def marginal(self, selection):
+        if all(isinstance(item, str) for item in selection):
+            widths = dict(self.registers)
+            registers = [(name, widths.get(name, 0)) for name in selection]
+        else:
+            registers = [(None, len(selection))]
+
+        return EncodedCounts(pack_bits(self.bits(selection)), self.frequencies, registers).merged()
+
+    # Mean number of 1s per shot, over all clbits or the given registers/clbits
+    def exp_val(self, selection=None):
+        words = self.words if selection is None else pack_bits(self.bits(selection))
+        return float(np.dot(popcount(words).sum(axis=1, dtype=np.int64), self.frequencies) / self.shots)
+
+    # Expectation value of (-1)^(parity of the outcome), over all clbits or the given registers/clbits, e.g. of a Z-type Pauli observable
+    def parity(self, selection=None):
+        words = self.words if selection is None else pack_bits(self.bits(selection))
+        signs = 1 - 2*(popcount(words).sum(axis=1, dtype=np.int64) & 1)
+        return float(np.dot(signs, self.frequencies) / self.shots)
+
+    # Probability of an outcome, given as a bitstring (in the order of to_dict, spaces are ignored) or as an integer
+    def probability(self, state):
+        value = int(state.replace(" ", ""), 2) if isinstance(state, str) else int(state)
+        target = np.array([(value >> (64*j)) & 0xFFFFFFFFFFFFFFFF for j in range(self.words.shape[1])], dtype=np.uint64)
+        return float(self.frequencies[np.all(self.words == target, axis=1)].sum() / self.shots)
+
+    # Counts dict of the outcomes, with the registers separated by spaces as in result.get_counts()
+    def to_dict(self):
+        merged = self.merged()
+        characters = merged.bits()[:, ::-1] + np.uint8(ord("0"))
+
+        # Spaces are inserted between the registers, which appear in reverse clbit order
+        widths = [width for _, width in self.registers][::-1]
+        columns = np.split(characters, np.cumsum(widths)[:-1], axis=1)
+        spaces = np.full((len(characters), 1), ord(" "), dtype=np.uint8)
+        characters = np.concatenate([part for column in columns for part in (column, spaces)][:-1] or [characters], axis=1)
+
+        outputs = np.ascontiguousarray(characters).view(f"S{characters.shape[1]}").reshape(-1) if characters.shape[1] > 0 else [b""] * len(characters)
+        return {output.decode(): int(frequency) for output, frequency in zip(outputs, merged.frequencies)}
+
+"""
+    Integer-encode the outcomes of a counts dict (see EncodedCounts.from_counts).
+    Parameters:
+        - counts: dict[output, frequency]
+    Returns:
+        - words: uint64 array of shape (n_outcomes, n_words) with the outcome words
+        - frequencies: int64 array with the frequency of each outcome
+        - n_bits: Number of bits of the outcomes
+        - layout: Tuple with the width of each classical register, in the order of the bitstring
+"""
+def encode_counts(counts):
+    encoded = EncodedCounts.from_counts(counts)
+    return encoded.words, encoded.frequencies, encoded.n_bits, tuple(width for _, width in encoded.registers[::-1])
+
+# Inverse of encode_counts
+def decode_counts(words, frequencies, n_bits, layout):
+    words = np.asarray(words, dtype=np.uint64).reshape(-1, int(n_outcome_words(n_bits)))
+    return EncodedCounts(words, frequencies, [(None, width) for width in layout[::-1]]).to_dict()
@@ -0,0 +1,482 @@
+import itertools
+import numpy as np
+
+import GF2 as gf2
+from CodeRegistry import code_registry
+
+pauli_symplectic = {"I": (0, 0), "X": (1, 0), "Z": (0, 1), "Y": (1, 1)}
+
+# Converts a stabilizer tableau (list of Pauli strings) into a symplectic matrix [X | Z] of shape (m, 2n)
+def tableau_to_symplectic(stabilizer_tableau):
+    n = len(stabilizer_tableau[0])
+    S = np.zeros((len(stabilizer_tableau), 2*n), dtype=np.uint8)
+    for i, stabilizer in enumerate(stabilizer_tableau):
+        for j, pauli_j in enumerate(stabilizer):
+            S[i, j], S[i, n+j] = pauli_symplectic[pauli_j]
+
+    return S
+
+# Converts a Gottesman-style logical operator vector of shape (2, k, n) into symplectic rows [X | Z] of shape (k, 2n)
+def logical_vector_to_symplectic(logical_vector):
+    logical_vector = np.asarray(logical_vector).astype(np.uint8)
+    return np.concatenate([logical_vector[0], logical_vector[1]], axis=1)
+
+# Symplectic inner product(s) between Pauli operators in [X | Z] form, computed on packed rows by GF2.symplectic_product
+# The products have the shape of a @ b.T, e.g. a single product for two operators or one product per row for a matrix and an operator
+def symplectic_product(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    products = gf2.symplectic_product(gf2.pack_symplectic(a.reshape(-1, a.shape[-1])), gf2.pack_symplectic(b.reshape(-1, b.shape[-1])))
+    return products.reshape(a.shape[:-1] + b.shape[:-1])
+
+def pauli_weight(error):
+    n = len(error)//2
+    return int(np.count_nonzero(error[:n] | error[n:]))
+
+##############################################
+##### Fault propagation through circuits #####
+##############################################
+
+# Conjugates a symplectic Pauli vector (length 2N), or an array of Pauli vectors along the last axis, through a single Clifford gate, in place
+def _propagate_gate(pauli, name, qubits, N):
+    if name in ["h"]:
+        q = qubits[0]
+        pauli[..., [q, N+q]] = pauli[..., [N+q, q]]
+    elif name in ["s", "sdg"]:
+        q = qubits[0]
+        pauli[..., N+q] ^= pauli[..., q]
+    elif name in ["cx"]:
+        c, t = qubits
+        pauli[..., t] ^= pauli[..., c]
+        pauli[..., N+c] ^= pauli[..., N+t]
+    elif name in ["cz"]:
+        a, b = qubits
+        pauli[..., N+a] ^= pauli[..., b]
+        pauli[..., N+b] ^= pauli[..., a]
+    elif name in ["cy"]:
+        c, t = qubits
+        _propagate_gate(pauli, "sdg", [t], N)
+        _propagate_gate(pauli, "cx", [c, t], N)
+        _propagate_gate(pauli, "s", [t], N)
+    elif name in ["swap"]:
+        a, b = qubits
+        pauli[..., [a, b, N+a, N+b]] = pauli[..., [b, a, N+b, N+a]]
+    elif name in ["id", "x", "y", "z", "barrier"]:
+        pass
+    else:
+        raise ValueError(f"Fault propagation does not support operation '{name}'")
+
+def _circuit_operations(circuit):
+    return [(inst.operation.name, [circuit.find_bit(q).index for q in inst.qubits]) for inst in circuit.data]
+
+"""
+    Determine which stabilizer each ancilla of a syndrome extraction circuit measures, by back-propagating a Z measurement of each ancilla to the data qubits.
+    Parameters:
+        - circuit: Clifford QuantumCircuit acting on n data qubits followed by the ancilla qubits (which start in |0>)
+        - stabilizer_tableau: List of stabilizers as Pauli strings
+    Returns:
+        - measured_stabilizers: list with the index of the stabilizer measured by each ancilla (None for unused ancillas)
+"""
+def measured_stabilizers_from_circuit(circuit, stabilizer_tableau):
+    S = tableau_to_symplectic(stabilizer_tableau)
+    n = S.shape[1]//2
+    N = circuit.num_qubits
+    operations = _circuit_operations(circuit)
+
+    measured_stabilizers = []
+    for a in range(n, N):
+        pauli = np.zeros(2*N, dtype=np.uint8)
+        pauli[N+a] = 1
+        for name, qubits in reversed(operations):
+            _propagate_gate(pauli, name, qubits, N)
+
+        data_pauli = np.concatenate([pauli[:n], pauli[N:N+n]])
+        if not data_pauli.any():
+            measured_stabilizers.append(None)
+            continue
+
+        matches = [i for i in range(len(S)) if np.array_equal(S[i], data_pauli)]
+        if len(matches) == 0:
+            raise ValueError(f"Ancilla {a-n} of the extraction circuit does not measure a stabilizer of the tableau")
+        measured_stabilizers.append(matches[0])
+
+    return measured_stabilizers
+
+# Every Pauli fault on k qubits except the identity, in [X | Z] form, as in a depolarizing channel after a k-qubit gate
+def _pauli_faults(k):
+    return np.array(list(itertools.product([0, 1], repeat=2*k))[1:], dtype=np.uint8)
+
+"""
+    Propagate every Pauli fault after every gate of a circuit to the end of the circuit, all at once.
+    Faults are the non-identity Paulis on the qubits of each gate (3 after a single-qubit gate, 15 after a two-qubit gate), as in depolarizing noise.
+    Parameters:
+        - operations: list of (gate name, qubit indices) on n data qubits followed by the ancillas
+        - N, n: Total number of qubits and number of data qubits
+    Returns:
+        - ancilla_flips: uint8 array of shape (n_faults, N-n), the ancilla measurements (in the Z basis) flipped by each fault
+        - data_errors: uint8 array of shape (n_faults, 2n), the resulting data error of each fault in [X | Z] form
+"""
+def propagate_faults(operations, N, n):
+    starts, paulis = [], []
+    for g, (name, qubits) in enumerate(operations):
+        if name == "barrier":
+            continue
+
+        faults = _pauli_faults(len(qubits))
+        gate_paulis = np.zeros((len(faults), 2*N), dtype=np.uint8)
+        gate_paulis[:, qubits] = faults[:, :len(qubits)]
+        gate_paulis[:, [N + q for q in qubits]] = faults[:, len(qubits):]
+        starts += [g]*len(faults)
+        paulis.append(gate_paulis)
+
+    starts = np.array(starts, dtype=np.int64)
+    paulis = np.concatenate(paulis) if len(paulis) > 0 else np.zeros((0, 2*N), dtype=np.uint8)
+
+    # Faults are sorted by the gate after which they occur, so that the faults propagating through gate g form a prefix of the rows
+    for g, (name, qubits) in enumerate(operations):
+        n_active = np.searchsorted(starts, g)
+        if n_active > 0:
+            _propagate_gate(paulis[:n_active], name, qubits, N)
+
+    return paulis[:, n:N], np.concatenate([paulis[:, :n], paulis[:, N:N+n]], axis=1)
+
+"""
+    Enumerate the data errors caused by single faults inside consecutive syndrome extraction rounds, together with the measurements they flip.
+    A later round only runs if no measurement of the earlier rounds changed, so the data error of a fault which flips no measurement of its round
+    (e.g. a fault on a data qubit after its last coupling) is carried into the later rounds, where it flips the measurements of the stabilizers it anticommutes with.
+    Parameters:
+        - circuits: Clifford QuantumCircuits of the rounds, in the order they are performed, each acting on n data qubits followed by its ancillas
+        - n: Number of data qubits
+        - stabilizer_tableau: List of stabilizers as Pauli strings
+    Returns:
+        - hook_errors: list of (frozenset of stabilizer indices whose measurement flipped, data error in [X | Z] form)
+"""
+def hook_errors_from_rounds(circuits, n, stabilizer_tableau):
+    S = tableau_to_symplectic(stabilizer_tableau)
+
+    hook_errors = []
+    seen = set()
+    carried = np.zeros((0, 2*n), dtype=np.uint8)
+    for circuit in circuits:
+        measured_stabilizers = measured_stabilizers_from_circuit(circuit, stabilizer_tableau)
+        measuring = [a for a, s in enumerate(measured_stabilizers) if s is not None]
+        stabilizers = [measured_stabilizers[a] for a in measuring]
+
+        ancilla_flips, data_errors = propagate_faults(_circuit_operations(circuit), circuit.num_qubits, n)
+        flips = np.concatenate([ancilla_flips[:, measuring], symplectic_product(carried, S[stabilizers]).astype(np.uint8)])
+        errors = np.concatenate([data_errors, carried])
+
+        for row_flips, data_error in zip(flips, errors):
+            key = (frozenset(s for s, flip in zip(stabilizers, row_flips) if flip), data_error.tobytes())
+            if len(key[0]) > 0 and key not in seen:
+                seen.add(key)
+                hook_errors.append((key[0], data_error))
+
+        carried = np.unique(errors[~flips.any(axis=1)], axis=0)
+        carried = carried[carried.any(axis=1)]
+
+    return hook_errors
+
+#################################
+##### Lookup table decoding #####
+#################################
+
+"""
+    Minimize a set of bit patterns into a small sum of products (Quine-McCluskey prime implicants with a greedy cover).
+    Parameters:
+        - patterns: Iterable of tuples of 0/1 values, all of length n_bits
+        - n_bits: Number of bits per pattern
+    Returns:
+        - implicants: list of tuples of 0, 1 or None (don't care), whose union matches exactly the given patterns
+"""
+def minimize_patterns(patterns, n_bits):
+    patterns = set(tuple(int(b) for b in p) for p in patterns)
+    if len(patterns) == 0:
+        return []
+    if len(patterns) == 2**n_bits:
+        return [tuple([None]*n_bits)]
+
+    terms = set(patterns)
+    prime_implicants = set()
+    while len(terms) > 0:
+        merged = set()
+        used = set()
+        for a, b in itertools.combinations(terms, 2):
+            diff = [i for i in range(n_bits) if a[i] != b[i]]
+            if len(diff) == 1 and a[diff[0]] is not None and b[diff[0]] is not None:
+                merged.add(a[:diff[0]] + (None,) + a[diff[0]+1:])
+                used.update([a, b])
+        prime_implicants |= terms - used
+        terms = merged
+
+    def covers(implicant, pattern):
+        return all(i is None or i == p for i, p in zip(implicant, pattern))
+
+    # Greedily select the implicants covering the most uncovered patterns
+    implicants = []
+    uncovered = set(patterns)
+    while len(uncovered) > 0:
+        best = max(sorted(prime_implicants, key=str), key=lambda imp: sum(covers(imp, p) for p in uncovered))
+        implicants.append(best)
+        uncovered = {p for p in uncovered if not covers(best, p)}
+
+    return implicants
+
+class LookupTableDecoder:
+    """
+    Minimum-weight lookup table decoder for a stabilizer code, with optional flag-conditioned corrections
+    """
+
+    def __init__(self, stabilizer_tableau, logical_x_vector, logical_z_vector, hook_errors=None):
+        self.stabilizer_tableau = list(stabilizer_tableau)
+        self.S = tableau_to_symplectic(self.stabilizer_tableau)
+        self.n = self.S.shape[1]//2
+
+        # Only the first logical qubit is tracked, matching the two-bit Pauli frame of LogicalCircuit
+        self.logicals = [logical_vector_to_symplectic(logical_x_vector)[0], logical_vector_to_symplectic(logical_z_vector)[0]]
+
+        self.hook_errors = [] if hook_errors is None else hook_errors
+
+        self._corrections = {}
+        self._tables = {}
+
+    def syndrome(self, error, stabilizer_indices):
+        return tuple(int(b) for b in symplectic_product(self.S[list(stabilizer_indices)], error.reshape(1, -1)).ravel())
+
+    # Minimum-weight correction for every syndrome of the given stabilizer subset
+    def corrections(self, stabilizer_indices):
+        key = tuple(stabilizer_indices)
+        if key in self._corrections:
+            return self._corrections[key]
+
+        S = self.S[list(stabilizer_indices)]
+        n = self.n
+
+        # Single-qubit errors with distinct syndromes (pure Paulis first, so Y is only used when needed)
+        single_errors = []
+        for j in range(n):
+            found = set()
+            for pauli in ["X", "Z", "Y"]:
+                error = np.zeros(2*n, dtype=np.uint8)
+                error[j], error[n+j] = pauli_symplectic[pauli]
+                syndrome = self.syndrome(error, stabilizer_indices)
+                if any(syndrome) and syndrome not in found:
+                    found.add(syndrome)
+                    single_errors.append((j, int("".join(map(str, syndrome)), 2), error))
+
+        n_syndromes = 2**gf2.rank(S)
+        corrections = {tuple([0]*len(stabilizer_indices)): np.zeros(2*n, dtype=np.uint8)}
+        for weight in range(1, n+1):
+            if len(corrections) >= n_syndromes:
+                break
+            for combination in itertools.combinations(single_errors, weight):
+                if len({j for j, _, _ in combination}) < weight:
+                    continue
+
+                syndrome_int = 0
+                for _, s, _ in combination:
+                    syndrome_int ^= s
+                syndrome = tuple(int(b) for b in format(syndrome_int, f"0{len(stabilizer_indices)}b"))
+
+                if syndrome not in corrections:
+                    corrections[syndrome] = np.bitwise_or.reduce([e for _, _, e in combination])
+
+        self._corrections[key] = corrections
+        return corrections
+
+    # Syndromes (unflagged) or (flag, syndrome) pairs for which the Pauli frame bit pf_ind has to be flipped
+    def flip_table(self, stabilizer_indices, pf_ind, with_flagged=False):
+        key = (tuple(stabilizer_indices), pf_ind, with_flagged)
+        if key in self._tables:
+            return self._tables[key]
+
+        logical = self.logicals[pf_ind]
+        corrections = self.corrections(stabilizer_indices)
+        unflagged_flips = {s: int(symplectic_product(c, logical)) for s, c in corrections.items()}
+
+        if not with_flagged:
+            table = {s for s, flip in unflagged_flips.items() if flip}
+        else:
+            # For each flag pattern and syndrome, the lowest-weight hook error replaces the unflagged correction
+            hook_corrections = {}
+            for flips, error in self.hook_errors:
+                flag = tuple(int(s in flips) for s in stabilizer_indices)
+                if not any(flag):
+                    continue
+
+                syndrome = self.syndrome(error, stabilizer_indices)
+                if syndrome not in unflagged_flips:
+                    continue
+
+                if (flag, syndrome) not in hook_corrections or pauli_weight(error) < pauli_weight(hook_corrections[(flag, syndrome)]):
+                    hook_corrections[(flag, syndrome)] = error
+
+            table = {
+                (flag, syndrome) for (flag, syndrome), error in hook_corrections.items()
+                if int(symplectic_product(error, logical)) != unflagged_flips[syndrome]
+            }
+
+        self._tables[key] = table
+        return table
+
+    # Minimized decoding conditions for a stabilizer subset, as a list of (flag pattern, syndrome implicant) pairs,
+    # where the flag pattern is None for unflagged decoding
+    def decoding_conditions(self, stabilizer_indices, pf_ind, with_flagged=False):
+        table = self.flip_table(stabilizer_indices, pf_ind, with_flagged=with_flagged)
+        n_bits = len(stabilizer_indices)
+
+        if not with_flagged:
+            return [(None, implicant) for implicant in minimize_patterns(table, n_bits)]
+
+        conditions = []
+        for flag in sorted({flag for flag, _ in table}):
+            syndromes = [syndrome for f, syndrome in table if f == flag]
+            conditions += [(flag, implicant) for implicant in minimize_patterns(syndromes, n_bits)]
+
+        return conditions
+
+    # Flip tables as arrays indexed by the integer value of the syndrome (and flag) bits, most significant bit first
+    def flip_lookup(self, stabilizer_indices, pf_ind, with_flagged=False):
+        table = self.flip_table(stabilizer_indices, pf_ind, with_flagged=with_flagged)
+        n_bits = len(stabilizer_indices)
+
+        if not with_flagged:
+            lookup = np.zeros(2**n_bits, dtype=np.uint8)
+            for syndrome in table:
+                lookup[_bits_to_int(syndrome)] = 1
+        else:
+            lookup = np.zeros((2**n_bits, 2**n_bits), dtype=np.uint8)
+            for flag, syndrome in table:
+                lookup[_bits_to_int(flag), _bits_to_int(syndrome)] = 1
+
+        return lookup
+
+def _bits_to_int(bits):
+    return int("".join(str(int(b)) for b in bits), 2)
+
+# Vectorized conversion of an (n_shots, n_bits) bit array into integers, with the first column as most significant bit
+def _rows_to_int(bits):
+    return bits.astype(np.int64) @ (1 << np.arange(bits.shape[1]-1, -1, -1, dtype=np.int64))
+
+# Decoders are shared between all circuits using the same code
+"""
+    Get the (cached) lookup table decoder for a code.
+    Decoders are stored in the process-wide code registry, alongside the encoding circuit and logical gates of the code.
+    Parameters:
+        - label: Code label (n, k, d)
+        - stabilizer_tableau: List of stabilizers as Pauli strings
+        - logical_x_vector, logical_z_vector: Logical operator vectors, as produced by LogicalCircuit.generate_code
+        - hook_errors: Faults of the flagged extraction circuits, as produced by hook_errors_from_rounds, or a callable returning them (only evaluated if the decoder is not cached yet)
+    Returns:
+        - decoder: LookupTableDecoder
+"""
+def get_lookup_table_decoder(label, stabilizer_tableau, logical_x_vector, logical_z_vector, hook_errors=None):
+    def build_decoder():
+        return LookupTableDecoder(stabilizer_tableau, logical_x_vector, logical_z_vector, hook_errors=hook_errors() if callable(hook_errors) else hook_errors)
+
+    return code_registry.get(label, stabilizer_tableau, "decoder", build_decoder, persist=True)
+
+############################
+##### Offline decoding #####
+############################
+
+"""
+    Convert shot memory into a bit array.
+    Parameters:
+        - memory: list of bitstrings as returned by result.get_memory(), with registers separated by spaces
+    Returns:
+        - bits: uint8 array of shape (n_shots, n_clbits), where column i is the i-th clbit of the circuit
+"""
+def memory_to_array(memory):
+    if isinstance(memory, np.ndarray) and memory.dtype == np.uint8:
+        return memory
+
+    if len(memory) == 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+
+    stripped = [m.replace(" ", "") for m in memory]
+    bits = np.frombuffer("".join(stripped).encode(), dtype=np.uint8).reshape(len(stripped), -1) - ord("0")
+
+    # Bitstrings are little-endian (clbit 0 is the rightmost character)
+    return bits[:, ::-1]
+
+"""
+    Decode the raw shot memory of a LogicalCircuit constructed with offline_decoding=True.
+    The adaptive QEC protocol is replayed on all shots at once: a change in the first flagged round skips the second flagged round,
+    any flagged change triggers decoding of the unflagged rounds (with flag-conditioned hook corrections), and the final data
+    measurement is corrected with the Z-type syndrome (of CSS codes) and the tracked Pauli frame.
+    Parameters:
+        - logical_circuit: LogicalCircuit which produced the memory
+        - memory: list of bitstrings from result.get_memory(), or an (n_shots, n_clbits) uint8 array
+    Returns:
+        - outputs: uint8 array of shape (n_shots, n_logical_qubits) with the decoded logical measurement results
+"""
+def decode_memory(logical_circuit, memory):
+    lc = logical_circuit
+    bits = memory_to_array(memory)
+    n_shots = bits.shape[0]
+
+    decoder = lc.decoder
+    groups = [(lc.x_stabilizers, 0), (lc.z_stabilizers, 1)]
+    lookups = {pf_ind: decoder.flip_lookup(G, pf_ind) for G, pf_ind in groups}
+    flag_lookups = {pf_ind: decoder.flip_lookup(G, pf_ind, with_flagged=True) for G, pf_ind in groups}
+
+    outputs = np.zeros((n_shots, lc.n_logical_qubits), dtype=np.uint8)
+    prev_syndromes = []
+    pauli_frames = []
+
+    for q in range(lc.n_logical_qubits):
+        prev_syndrome = np.zeros((n_shots, lc.n_stabilizers), dtype=np.uint8)
+        pauli_frame = np.zeros((n_shots, 2), dtype=np.uint8)
+
+        for record in lc.offline_qec_records[q]:
+            flag_diff = np.zeros_like(prev_syndrome)
+
+            # First flagged round
+            stabilizers, clbits = record["flagged_1"]
+            flag_diff[:, stabilizers] = bits[:, clbits] ^ prev_syndrome[:, stabilizers]
+            triggered = flag_diff.any(axis=1)
+
+            # Second flagged round only counts for shots in which the first round saw no change
+            stabilizers, clbits = record["flagged_2"]
+            flag_diff[:, stabilizers] = np.where(triggered[:, None], flag_diff[:, stabilizers], bits[:, clbits] ^ prev_syndrome[:, stabilizers])
+            triggered = flag_diff.any(axis=1)
+
+            # Unflagged rounds only count for shots in which a flagged round saw a change
+            syndrome_diff = np.zeros_like(prev_syndrome)
+            for round_name in ["unflagged_x", "unflagged_z"]:
+                stabilizers, clbits = record[round_name]
+                syndrome_diff[:, stabilizers] = bits[:, clbits] ^ prev_syndrome[:, stabilizers]
+            syndrome_diff[~triggered] = 0
+
+            for G, pf_ind in groups:
+                s = _rows_to_int(syndrome_diff[:, G])
+                f = _rows_to_int(flag_diff[:, G])
+                pauli_frame[:, pf_ind] ^= (lookups[pf_ind][s] ^ flag_lookups[pf_ind][f, s]) & triggered
+
+            prev_syndrome ^= syndrome_diff
+
+        prev_syndromes.append(prev_syndrome)
+        pauli_frames.append(pauli_frame)
+
+    # Logical Z parity from the final data measurements, using the same representative of the logical operator as the decoder
+    logical_z_support = np.flatnonzero(np.asarray(lc.LogicalZVector[1][0]) == 1)
+    z_supports = [[i for i, p in enumerate(lc.stabilizer_tableau[z]) if p == "Z"] for z in lc.z_stabilizers]
+
+    for q, c, with_error_correction in lc.offline_measure_records:
+        final_clbits = [lc.find_bit(clbit).index for clbit in lc.final_measurement_cregs[q]]
+        data = bits[:, final_clbits]
+
+        output = data[:, logical_z_support].sum(axis=1) % 2
+
+        if with_error_correction:
+            # The final syndrome is only available for CSS codes, as in LogicalCircuit.measure
+            pauli_frame = pauli_frames[q][:, 1]
+            if lc.is_css:
+                final_syndrome = np.stack([data[:, support].sum(axis=1) % 2 for support in z_supports], axis=1).astype(np.uint8)
+                syndrome_diff = final_syndrome ^ prev_syndromes[q][:, lc.z_stabilizers]
+                pauli_frame = pauli_frame ^ lookups[1][_rows_to_int(syndrome_diff)]
+            output ^= pauli_frame
+
+        outputs[:, c] = output
+
+    return outputs
@@ -1,126 +1,541 @@
 import time
+import json
+import pickle
+import contextlib
 import itertools
+import importlib
 import numpy as np
 import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor as Pool
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor as Pool, wait, FIRST_COMPLETED
 
 from Logical import LogicalCircuit
-from NoiseModel import construct_noise_model
+from NoiseModel import construct_noise_model, noise_model_fingerprint
+from Simulation import select_simulation_method, aer_run_options, default_session
+from Resources import select_feasible_method, ResourceLimitError
+from ResultStore import open_result_store
+from Counts import EncodedCounts, pack_bits
+from Decoding import memory_to_array
+from Analysis import target_tally, merge_tallies, tally_interval
 from Benchmarks import *
 
-from qiskit import QuantumCircuit, transpile
-from qiskit_aer import AerSimulator
+from qiskit import QuantumCircuit
 from qiskit_aer.noise import NoiseModel
 
+# Half-width of the confidence interval of a tally, relative to its estimate if requested
+def _interval_error(tally, z=1.96, relative_precision=False):
+    estimate, lower, upper = tally_interval(tally, z=z)
+    half_width = (upper-lower)/2
+
+    if relative_precision:
+        return half_width/abs(estimate) if estimate != 0 else np.inf
+
+    return half_width
+
+# Number of further shots predicted to reach the precision from the 1/sqrt(shots) scaling of the interval,
+# with at least min_batch shots and at most doubling the shots taken so far; without a precision the shots are doubled
+def _next_batch(shots_taken, error, precision, min_batch):
+    max_batch = max(shots_taken, min_batch)
+    if precision is None or not np.isfinite(error):
+        return max_batch
+
+    needed = int(np.ceil(1.1*shots_taken*(error/precision)**2)) - shots_taken
+    return int(min(max(needed, min_batch), max_batch))
+
+# Names of the given classical registers (names or ClassicalRegisters) of a circuit in circuit order, or None to select all registers
+def _selected_registers(circuit, registers):
+    if registers is None:
+        return None
+
+    names = {creg if isinstance(creg, str) else creg.name for creg in registers}
+    circuit_names = [creg.name for creg in circuit.cregs]
+    if not names.issubset(circuit_names):
+        raise ValueError(f"Unknown classical registers {sorted(names - set(circuit_names))}; the circuit has registers {circuit_names}")
+
+    return [name for name in circuit_names if name in names]
+
+# Counts of a circuit restricted to the selected registers, with the spacing of result.get_counts()
+def _marginal_counts(counts, circuit, selected):
+    if selected is None or len(selected) == len(circuit.cregs):
+        return counts
+
+    return EncodedCounts.from_counts(counts, register_names=[creg.name for creg in circuit.cregs]).marginal(selected).to_dict()
+
+# Bit-packed outcomes of every shot over the registers which are not selected, from the shot memory of a circuit
+def _register_history(memory, circuit, selected):
+    bits = memory_to_array(memory)
+    starts = np.cumsum([0] + [len(creg) for creg in circuit.cregs])
+
+    registers, columns = [], []
+    for i, creg in enumerate(circuit.cregs):
+        if selected is None or creg.name not in selected:
+            registers.append((creg.name, len(creg)))
+            columns += range(starts[i], starts[i+1])
+
+    return EncodedCounts(pack_bits(bits[:, columns]), np.ones(bits.shape[0], dtype=np.int64), registers)
+
 # General function to benchmark a circuit using a noise model
-def benchmark_noise(circuit, noise_model=None, noise_params=None, method="statevector", shots=1024, optimization_level=0):
+# Method "automatic" routes Clifford circuits with Pauli noise to the stabilizer simulator and falls back to fallback_method otherwise
+# Simulators and transpiled circuits are reused through the given SimulationSession (by default one per process)
+# If a precision or a time budget is given, shots are run adaptively in batches (the first one of size shots) until the confidence interval
+# of the target quantity (see Analysis.target_values) is at most precision wide on either side, or max_shots or max_time is reached.
+# A precision requires max_shots or max_time, since e.g. a relative precision is never reached while the estimate is 0.
+# The returned counts then hold all shots, while the returned result is the one of the last batch.
+# If registers (names or ClassicalRegisters) are given, the returned counts only cover those registers, e.g. circuit.logical_output_registers()
+# of a LogicalCircuit, which keeps the counts small however many distinct syndrome histories occur; the target is still tallied on the full outputs.
+# If syndrome_history is set, the outcomes of the remaining registers (the syndrome history of a LogicalCircuit) are also returned
+# as an EncodedCounts with one bit-packed outcome per shot, in the order of the shots of the result (or batches).
+def benchmark_noise(circuit, noise_model=None, noise_params=None, method="automatic", shots=1024, optimization_level=0, fallback_method="statevector", session=None,
+                    target=None, precision=None, relative_precision=False, max_shots=None, max_time=None, z=1.96, registers=None, syndrome_history=False):
     if noise_model is None:
         if noise_params is not None:
             # If noise_params are provided but not a noise_model, then construct noise model based on the provided parameters
-            noise_model = construct_noise_model(circuit.num_qubits, **noise_params)
+            noise_model = construct_noise_model(n_qubits=circuit.num_qubits, **noise_params)
         else:
             # If a noise_model is not provided at all, then 
             raise ValueError("Either noise_model or noise_params must be provided")
     elif noise_params is not None:
         print("Both noise_model and noise_params were provided, defaulting to use the noise_model and ignoring noise_params. If you would like to use custom noise_params, pass noise_model=None.")
 
-    # Construct noisy simulator based on chosen method using noise model
-    noisy_sim = AerSimulator(method=method, noise_model=noise_model)
+    # The interval may never shrink below the precision (e.g. a relative precision while no failure has been observed), so shots must be bounded
+    if precision is not None and max_shots is None and max_time is None:
+        raise ValueError("A precision requires max_shots or max_time, as the precision may never be reached")
 
-    # Create a fully-coupled map since we don't care about non-fully-coupled hardware modalities
-    fully_coupled_map = itertools.product(range(circuit.num_qubits), range(circuit.num_qubits))
-    fully_coupled_map = [list(pair) for pair in fully_coupled_map]
+    if method == "automatic":
+        method, _ = select_simulation_method(circuit, noise_model=noise_model, fallback_method=fallback_method)
 
-    # Transpile circuit
+    if session is None:
+        session = default_session
+
+    # Construct (or reuse) noisy simulator based on chosen method using noise model
+    noisy_sim = session.simulator(method=method, noise_model=noise_model)
+
+    # Transpile circuit, reusing earlier transpilations of structurally identical circuits
     # Method defaults to optimization off to preserve form of benchmarking circuit and full QEC
-    circuit_transpiled = transpile(circuit, noisy_sim, coupling_map=fully_coupled_map, optimization_level=optimization_level)
-    result = noisy_sim.run(circuit_transpiled, shots=shots).result()
-    counts = result.get_counts(circuit_transpiled)
+    circuit_transpiled = session.transpile(circuit, noisy_sim, optimization_level=optimization_level)
+
+    selected = _selected_registers(circuit_transpiled, registers)
+    run_options = aer_run_options(circuit_transpiled, method)
+
+    if precision is None and max_time is None:
+        result = noisy_sim.run(circuit_transpiled, shots=shots, memory=syndrome_history, **run_options).result()
+        counts = _marginal_counts(result.get_counts(circuit_transpiled), circuit_transpiled, selected)
+
+        if syndrome_history:
+            return result, counts, _register_history(result.get_memory(circuit_transpiled), circuit_transpiled, selected)
+
+        return result, counts
+
+    if target is None:
+        target = "logical_error_rate" if isinstance(circuit, LogicalCircuit) else "exp_val"
+
+    start = time.perf_counter()
+    counts, tally, histories, batch = {}, None, [], shots if max_shots is None else min(shots, max_shots)
+    while batch > 0:
+        result = noisy_sim.run(circuit_transpiled, shots=batch, memory=syndrome_history, **run_options).result()
+        batch_counts = result.get_counts(circuit_transpiled)
+        tally = merge_tallies(tally, target_tally(batch_counts, target, circuit=circuit))
+
+        for output, frequency in _marginal_counts(batch_counts, circuit_transpiled, selected).items():
+            counts[output] = counts.get(output, 0) + frequency
+        if syndrome_history:
+            histories.append(_register_history(result.get_memory(circuit_transpiled), circuit_transpiled, selected))
+
+        error = _interval_error(tally, z=z, relative_precision=relative_precision)
+        if precision is not None and error <= precision:
+            break
+        if max_time is not None and time.perf_counter()-start >= max_time:
+            break
+
+        batch = _next_batch(tally["shots"], error, precision, shots)
+        if max_shots is not None:
+            batch = min(batch, max_shots - tally["shots"])
+
+    if syndrome_history:
+        history = EncodedCounts(np.concatenate([h.words for h in histories]), np.concatenate([h.frequencies for h in histories]), histories[0].registers)
+        return result, counts, history
 
     return result, counts
 
-def _experiment_core(circuit, noise_model, n_qubits, circuit_length, method, shots):
+def _experiment_core(circuit, noise_model, n_qubits, circuit_length, method, shots, keep_result=False, target=None, registers=None):
+    start = time.perf_counter()
     result, counts = benchmark_noise(circuit, noise_model=noise_model, method=method, shots=shots)
-    
-    return n_qubits, circuit_length, result, counts
+    stop = time.perf_counter()
+
+    # The target quantity is tallied where the circuit is available, so that only the tally is needed for adaptive allocation
+    # As in benchmark_noise, it is tallied on the full outputs, before the counts are restricted to the selected registers
+    tally = target_tally(counts, target, circuit=circuit) if target is not None else None
+    counts = _marginal_counts(counts, circuit, _selected_registers(circuit, registers))
+
+    # Results hold the full simulator output and are only sent back when requested
+    return n_qubits, circuit_length, result if keep_result else None, counts, stop-start, tally, method
+
+# Resolves a factory given as an importable "module:attribute" reference, as used to hand factories to worker processes
+def _resolve_factory(factory):
+    if isinstance(factory, str):
+        module_name, _, attribute = factory.partition(":")
+        factory = getattr(importlib.import_module(module_name), attribute)
+
+    return factory
+
+def _as_circuit_factory(circuit_factory):
+    circuit_factory = _resolve_factory(circuit_factory)
+    if isinstance(circuit_factory, QuantumCircuit):
+        return lambda n_qubits, circuit_length: circuit_factory
+
+    return circuit_factory
+
+def _as_noise_model_factory(noise_model_factory):
+    noise_model_factory = _resolve_factory(noise_model_factory)
+    if isinstance(noise_model_factory, NoiseModel):
+        return lambda n_qubits: noise_model_factory
+
+    return noise_model_factory
+
+# State of a sweep worker process, set up once per worker by _init_sweep_worker
+_sweep_worker_state = {}
+
+# Maximum number of noise models kept by a sweep worker, of which the least recently used one is evicted first
+max_worker_noise_models = 8
+
+def _init_sweep_worker(circuit_factory, noise_model_factory, resource_limits=None):
+    _sweep_worker_state["circuit_factory"] = _as_circuit_factory(circuit_factory)
+    _sweep_worker_state["noise_model_factory"] = _as_noise_model_factory(noise_model_factory)
+    # Limits passed to Resources.select_feasible_method for every point, or None to run every point with the requested method
+    _sweep_worker_state["resource_limits"] = resource_limits
+    # Noise models only depend on the qubit count and are reused for all circuit lengths handled by this worker
+    _sweep_worker_state["noise_models"] = OrderedDict()
+
+# Sets up the sweep worker state in this process for a sequential sweep, and clears it afterwards so that no factories or noise models are kept alive
+@contextlib.contextmanager
+def _sequential_sweep_worker(circuit_factory, noise_model_factory, resource_limits=None):
+    _init_sweep_worker(circuit_factory, noise_model_factory, resource_limits)
+    try:
+        yield None
+    finally:
+        _sweep_worker_state.clear()
+
+# Noise model of a qubit count from the cache of the worker, built on first use
+def _worker_noise_model(n_qubits):
+    noise_models = _sweep_worker_state["noise_models"]
+    if n_qubits in noise_models:
+        noise_models.move_to_end(n_qubits)
+        return noise_models[n_qubits]
+
+    noise_model = _sweep_worker_state["noise_model_factory"](n_qubits=n_qubits)
+    noise_models[n_qubits] = noise_model
+    while len(noise_models) > max_worker_noise_models:
+        noise_models.popitem(last=False)
+
+    return noise_model
+
+# Builds, transpiles and benchmarks a single sweep point inside a worker process, from its parameters only
+def _sweep_worker(n_qubits, circuit_length, method, shots, keep_result=False, target=None, registers=None):
+    try:
+        noise_model = _worker_noise_model(n_qubits)
+        circuit = _sweep_worker_state["circuit_factory"](n_qubits=n_qubits, circuit_length=circuit_length)
+
+        # Points which the requested method cannot run within the limits are rerouted to a feasible method, or skipped if there is none
+        if _sweep_worker_state["resource_limits"] is not None:
+            method, _ = select_feasible_method(circuit, noise_model, method=method, shots=shots, **_sweep_worker_state["resource_limits"])
+
+        # "logical" reports only the registers of the logical outputs of LogicalCircuits, and all registers of other circuits
+        if registers == "logical":
+            registers = circuit.logical_output_registers() if isinstance(circuit, LogicalCircuit) else None
+
+        return _experiment_core(circuit, noise_model, n_qubits, circuit_length, method, shots, keep_result, target, registers)
+    except Exception as e:
+        return n_qubits, circuit_length, None, e, None, None, method
+
+# Settings of a sweep which a stored point must have been run with to be resumed, in their JSON form as read back from a results store
+def _sweep_config(method, shots, target, registers, noise_fingerprint):
+    if callable(target):
+        target = f"{target.__module__}.{target.__qualname__}"
+    if registers is not None and registers != "logical":
+        registers = [creg if isinstance(creg, str) else creg.name for creg in registers]
+
+    return json.loads(json.dumps({"method": method, "shots": shots, "target": target, "registers": registers, "noise_model": noise_fingerprint}))
+
+def _sweep_record(n_qubits, circuit_length, counts, time_taken, method, shots, tally=None, config=None):
+    record = {"n_qubits": n_qubits, "circuit_length": circuit_length, "method": method, "shots": shots}
+    if config is not None:
+        record["config"] = config
+
+    if isinstance(counts, ResourceLimitError):
+        record.update({"status": "skipped", "error": str(counts)})
+    elif isinstance(counts, Exception):
+        record.update({"status": "error", "error": f"{type(counts).__name__}: {counts}"})
+    else:
+        record.update({"status": "ok", "counts": dict(counts), "time_taken": time_taken})
+        if tally is not None:
+            record["tally"] = tally
+
+    return record
+
+"""
+    Benchmark circuits over a grid of qubit counts and circuit lengths.
+    Worker processes only receive the parameters of each point and build, transpile and simulate it locally.
+    Points are streamed: each finished point is written to the results store (if provided) as soon as it completes,
+    failing points are recorded and skipped instead of aborting the sweep, and a sweep can be resumed from its results store.
+    If a precision, shot budget or time budget is given, every point is first run with shots shots, after which further batches are
+    allocated greedily to the points whose target quantity has the widest confidence interval, which minimises the worst-case error
+    across the sweep, until every point reaches the precision or a budget is exhausted.
+    Parameters:
+        - circuit_factory: QuantumCircuit/LogicalCircuit, callable taking n_qubits and circuit_length, or importable "module:function" reference to one
+        - noise_model_factory: NoiseModel, callable taking n_qubits, or importable "module:function" reference to one
+          With multiprocessing, both factories are sent to the worker processes and must be picklable: module-level functions or references,
+          not lambdas or closures (which also fail under the "spawn" start method used on macOS and Windows)
+        - min_n_qubits, max_n_qubits, min_circuit_length, max_circuit_length: Inclusive ranges of the sweep
+        - method: Aer simulation method, or "automatic"
+        - shots: Number of shots per point, or of the first batch of each point in adaptive mode
+        - with_mp: If true, points are run in parallel across all CPUs
+        - results_path: Path of an append-only results store (see ResultStore.open_result_store): a JSON lines file (*.jsonl) or a columnar store directory,
+                        or None to only keep results in memory
+        - resume: If true, points which are already stored successfully in results_path are skipped (and refined in adaptive mode), provided that they
+                  were run with the same method, shots, target, registers and noise model (see NoiseModel.noise_model_fingerprint); other points are run again
+        - keep_results: If true, the full Qiskit Result of every point is kept in memory (otherwise only the counts)
+        - max_pending: Maximum number of points in flight at once when using multiprocessing (defaults to twice the CPU count)
+        - target: Target quantity of adaptive mode as accepted by Analysis.target_values, defaulting to "exp_val" (must be picklable when using multiprocessing)
+        - precision: Half-width of the confidence interval of the target at which a point is not refined any further, which requires shot_budget or max_time
+        - relative_precision: If true, precision is relative to the estimate of the target (e.g. for small logical error rates)
+        - shot_budget: Maximum total number of shots run by this call across all points
+        - max_time: Time in seconds after which no further batches are started
+        - z: Quantile of the standard normal distribution setting the confidence level, e.g. 1.96 for 95% intervals
+        - check_resources: If true, the resources of every point are estimated before simulating it (see Resources.estimate_resources),
+                           points which the requested method cannot run are rerouted to the fastest feasible method ("automatic" always uses it),
+                           and points which no method can run are recorded as skipped
+        - memory_limit: Maximum simulator memory in bytes of a point when checking resources, defaulting to half of the physical memory
+        - max_runtime: Maximum predicted runtime in seconds of a point (or adaptive batch) when checking resources
+        - cost_model: Cost model of the runtime predictions when checking resources, e.g. from Resources.calibrate_cost_model
+                      (defaults to the example Resources.aer_cost_model, measured on a development machine)
+        - registers: Names of the classical registers which are kept in the counts (see benchmark_noise), or "logical" to only keep
+                     the logical output registers of LogicalCircuits (see LogicalCircuit.logical_output_registers), or None to keep all registers
+    Returns:
+        - all_data: dict[n_qubits, dict[circuit_length, (result, counts)]], where result is None unless keep_results is set
+                    (in adaptive mode, counts hold all shots of a point and result is the one of its last batch)
+"""
+def circuit_scaling_experiment(
+        circuit_factory,
+        noise_model_factory,
+        min_n_qubits=1,
+        max_n_qubits=50,
+        min_circuit_length=1,
+        max_circuit_length=50,
+        method="automatic",
+        shots=1024,
+        with_mp=True,
+        results_path=None,
+        resume=True,
+        keep_results=False,
+        max_pending=None,
+        target=None,
+        precision=None,
+        relative_precision=False,
+        shot_budget=None,
+        max_time=None,
+        z=1.96,
+        check_resources=False,
+        memory_limit=None,
+        max_runtime=None,
+        cost_model=None,
+        registers=None,
+    ):
+    circuit_factory, noise_model_factory = _resolve_factory(circuit_factory), _resolve_factory(noise_model_factory)
 
-# @TODO - implement experiments
-def circuit_scaling_experiment(circuit_factory, noise_model_factory, min_n_qubits=1, max_n_qubits=50, min_circuit_length=1, max_circuit_length=50, method="statevector", shots=1024, with_mp=True):
     if isinstance(circuit_factory, QuantumCircuit) or isinstance(circuit_factory, LogicalCircuit):
         if max_n_qubits != min_n_qubits+1:
             print("A constant circuit has been provided as the circuit factory, but a non-trivial range of qubit counts and/or circuit lengths has also been provided, so the fixed input will not be scaled. If you would like for the number of qubits to be scaled, please provide a callable which takes in as an argument the number of qubits, n_qubits. If you would like for the circuit length to be scaled, please provide a callable which takes in as an argument the circuit length, circuit_length.")
-        
-        circuit = lambda n_qubits, circuit_length: circuit_factory
-    elif callable(circuit_factory):
-        circuit = circuit_factory
-    else:
+    elif not callable(circuit_factory):
         raise ValueError("Please provide a QuantumCircuit/LogicalCircuit object or a method for constructing QuantumCircuits/LogicalCircuits.")
     
     if isinstance(noise_model_factory, NoiseModel):
         if max_n_qubits != min_n_qubits+1:
             print("A constant noise model has been provided as the noise model factory, but a non-trivial range of qubit counts has also been provided. The number of qubits will not be scaled; if you would like for the number of qubits to be scaled, please provide a callable which takes in as an argument the number of qubits, n_qubits.")
-        
-        noise_model = lambda n_qubits: noise_model_factory
-    elif callable(noise_model_factory):
-        noise_model = noise_model_factory
-    else:
+    elif not callable(noise_model_factory):
         raise ValueError("Please provide a NoiseModel object or a method for constructing NoiseModels.")
 
+    if precision is not None and shot_budget is None and max_time is None:
+        raise ValueError("A precision requires shot_budget or max_time, as the precision may never be reached")
+
+    adaptive = precision is not None or shot_budget is not None or max_time is not None
+    if adaptive and target is None:
+        target = "exp_val"
+    elif not adaptive:
+        target = None
+
+    store = open_result_store(results_path) if results_path is not None else None
+
     # Form a dict of dicts with the first layer (n_qubits) initialized to make later access faster
-    all_data = dict(zip(range(min_n_qubits, max_n_qubits+1), [{}]*(max_n_qubits+1-min_n_qubits)))
+    all_data = {n_qubits: {} for n_qubits in range(min_n_qubits, max_n_qubits+1)}
+
+    # Shots, time and target tally accumulated per point, which adaptive mode merges over all batches of a point
+    point_shots, point_times, tallies = {}, {}, {}
+
+    # Every stored record holds the settings of its point, computed once per qubit count
+    point_configs = {}
+    def point_config(n_qubits):
+        if n_qubits not in point_configs:
+            noise_model = _as_noise_model_factory(noise_model_factory)(n_qubits=n_qubits)
+            point_configs[n_qubits] = _sweep_config(method, shots, target, registers, noise_model_fingerprint(noise_model))
+
+        return point_configs[n_qubits]
+
+    completed_points = set()
+    stale_points = 0
+    if store is not None and resume:
+        for (n_qubits, circuit_length), record in sorted(store.latest_records().items()):
+            if record.get("status") == "ok" and n_qubits in all_data and min_circuit_length <= circuit_length <= max_circuit_length:
+                # Points run with other settings are run again rather than mixed into this sweep
+                if record.get("config") != point_config(n_qubits):
+                    stale_points += 1
+                    continue
+
+                all_data[n_qubits][circuit_length] = None, record["counts"]
+                completed_points.add((n_qubits, circuit_length))
+
+                point_shots[(n_qubits, circuit_length)] = record["shots"]
+                point_times[(n_qubits, circuit_length)] = record["time_taken"]
+                if adaptive and "tally" in record:
+                    tallies[(n_qubits, circuit_length)] = record["tally"]
+
+    points = [
+        (n_qubits, circuit_length)
+        for (n_qubits, circuit_length) in itertools.product(range(min_n_qubits, max_n_qubits+1), range(min_circuit_length, max_circuit_length+1))
+        if (n_qubits, circuit_length) not in completed_points
+    ]
+    if len(completed_points) > 0:
+        print(f"Resuming experiment with {len(completed_points)} points loaded from {results_path}")
+    if stale_points > 0:
+        print(f"{stale_points} points stored in {results_path} were run with a different method, shots, target, registers or noise model and will be run again")
+
+    failed_points = []
+    skipped_points = []
+    def collect(n_qubits, circuit_length, result, counts, time_taken, tally, point_method):
+        point = (n_qubits, circuit_length)
+        refining = point in point_shots
+
+        if isinstance(counts, Exception) and refining:
+            # A failed refinement keeps the counts gathered so far and only stops refining the point
+            tallies.pop(point, None)
+            print(f"Refining point (n_qubits={n_qubits}, circuit_length={circuit_length}) failed with {type(counts).__name__}: {counts}")
+            return
+
+        if refining:
+            previous_counts = all_data[n_qubits][circuit_length][1]
+            counts = {output: previous_counts.get(output, 0) + counts.get(output, 0) for output in set(previous_counts) | set(counts)}
+            time_taken += point_times[point]
+            tally = merge_tallies(tallies[point], tally) if point in tallies and tally is not None else None
+
+        total_shots = shots if isinstance(counts, Exception) else sum(counts.values())
+        record = _sweep_record(n_qubits, circuit_length, counts, time_taken, point_method, total_shots, tally, point_config(n_qubits) if store is not None else None)
+        if store is not None:
+            store.append(record)
+
+        if record["status"] == "ok":
+            all_data[n_qubits][circuit_length] = result, counts
+            point_shots[point], point_times[point] = total_shots, time_taken
+            if tally is not None:
+                tallies[point] = tally
+        elif record["status"] == "skipped":
+            skipped_points.append((n_qubits, circuit_length, record["error"]))
+            print(f"Point (n_qubits={n_qubits}, circuit_length={circuit_length}) skipped: {record['error']}")
+        else:
+            failed_points.append((n_qubits, circuit_length, record["error"]))
+            print(f"Point (n_qubits={n_qubits}, circuit_length={circuit_length}) failed with {record['error']}")
+
+    start = time.perf_counter()
+
+    cpu_count = mp.cpu_count()
+    max_pending = max_pending or 2*cpu_count
 
+    resource_limits = {"memory_limit": memory_limit, "max_runtime": max_runtime, "cost_model": cost_model} if check_resources else None
+
+    # Factories are sent to each worker once, and workers build, transpile and simulate points from their parameters alone
     if with_mp:
-        exp_inputs_list = [
-            (
-                circuit(n_qubits=n_qubits, circuit_length=circuit_length), noise_model(n_qubits=n_qubits), n_qubits, circuit_length, method, shots
-            )
-            for (n_qubits, circuit_length) in itertools.product(range(min_n_qubits, max_n_qubits+1), range(min_circuit_length, max_circuit_length+1))
-        ]
-    
-        cpu_count = mp.cpu_count()#*16
-        batch_size = max(int(np.ceil((max_n_qubits+1-min_n_qubits)*(max_circuit_length+1-min_circuit_length)/cpu_count)), 1)
-        print(f"Applying mulitprocessing to {len(exp_inputs_list)} samples in batches of maximum size {batch_size} across {cpu_count} CPUs")
-    
-        start = time.perf_counter()
-        
-        with Pool(cpu_count) as pool:
-            results = pool.map(
-                _experiment_core,
-                *[list(exp_inputs) for exp_inputs in zip(*exp_inputs_list)],
-                chunksize=batch_size
-            )
-            
-            # Unzip results
-            for result in results:
-                all_data[result[0]][result[1]] = result[2], result[3]
-            
-        stop = time.perf_counter()
+        for name, factory in [("circuit_factory", circuit_factory), ("noise_model_factory", noise_model_factory)]:
+            try:
+                pickle.dumps(factory)
+            except Exception as e:
+                raise ValueError(f"{name} must be picklable to be sent to worker processes, e.g. a module-level function or a \"module:function\" reference, or use with_mp=False") from e
+
+        print(f"Applying mulitprocessing to {len(points)} samples with at most {max_pending} in flight across {cpu_count} CPUs")
+        pool_context = Pool(cpu_count, initializer=_init_sweep_worker, initargs=(circuit_factory, noise_model_factory, resource_limits))
     else:
-        start = time.perf_counter()
-        
-        for n_qubits in range(min_n_qubits, max_n_qubits+1):
-            sub_data = {}
-        
-            # We need a new noise model for each qubit count
-            noise_model_n = noise_model(n_qubits=n_qubits)
-        
-            for circuit_length in range(min_circuit_length, max_circuit_length+1):
-                # Construct circuit and benchmark noise
-                circuit_nl = circuit(n_qubits=n_qubits, circuit_length=circuit_length)
-                result, counts = benchmark_noise(circuit_nl, noise_model=noise_model_n, method=method, shots=shots)
-                
-                # Save expectation values
-                sub_data[circuit_length] = result, counts
-    
-                del circuit_nl
-    
-            del noise_model_n
-        
-            all_data[n_qubits] = sub_data
-        
-        stop = time.perf_counter()
-    
+        pool_context = _sequential_sweep_worker(circuit_factory, noise_model_factory, resource_limits)
+
+    with pool_context as pool:
+        # Runs (n_qubits, circuit_length, shots) tasks and yields the output of each as soon as it completes
+        def execute(tasks):
+            if pool is None:
+                for n_qubits, circuit_length, task_shots in tasks:
+                    yield _sweep_worker(n_qubits, circuit_length, method, task_shots, keep_results, target, registers)
+                return
+
+            pending = {}
+            task_iter = iter(tasks)
+            exhausted = False
+
+            while not exhausted or len(pending) > 0:
+                # Only a bounded number of points is in flight at any time
+                while not exhausted and len(pending) < max_pending:
+                    task = next(task_iter, None)
+                    if task is None:
+                        exhausted = True
+                        break
+
+                    n_qubits, circuit_length, task_shots = task
+                    pending[pool.submit(_sweep_worker, n_qubits, circuit_length, method, task_shots, keep_results, target, registers)] = task
+
+                if len(pending) == 0:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    n_qubits, circuit_length, _ = pending.pop(future)
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        yield n_qubits, circuit_length, None, e, None, None, method
+
+        shots_spent = 0
+        def budgeted(tasks):
+            nonlocal shots_spent
+            for n_qubits, circuit_length, task_shots in tasks:
+                if shot_budget is not None:
+                    task_shots = min(task_shots, shot_budget - shots_spent)
+                if task_shots <= 0 or (max_time is not None and time.perf_counter()-start >= max_time):
+                    return
+
+                shots_spent += task_shots
+                yield n_qubits, circuit_length, task_shots
+
+        for output in execute(budgeted((n_qubits, circuit_length, shots) for n_qubits, circuit_length in points)):
+            collect(*output)
+
+        # Adaptive refinement: each round gives further batches to the points with the widest intervals, as many as can run at once
+        while adaptive:
+            errors = {point: _interval_error(tally, z=z, relative_precision=relative_precision) for point, tally in tallies.items()}
+            candidates = sorted((point for point, error in errors.items() if precision is None or error > precision), key=lambda point: -errors[point])
+            if len(candidates) == 0:
+                break
+
+            spent_before = shots_spent
+            round_tasks = [(*point, _next_batch(tallies[point]["shots"], errors[point], precision, shots)) for point in candidates[:max_pending if pool is not None else 1]]
+            for output in execute(budgeted(round_tasks)):
+                collect(*output)
+
+            if shots_spent == spent_before:
+                break
+
+    stop = time.perf_counter()
+
     print(f"Completed experiment in {stop-start} seconds")
-    
-    return all_data
+    if len(failed_points) > 0:
+        print(f"{len(failed_points)} points failed" + (f" and will be retried when resuming from {results_path}" if store is not None else ""))
+    if len(skipped_points) > 0:
+        print(f"{len(skipped_points)} points were skipped as no simulation method can run them within the resource limits")
+    if adaptive and len(tallies) > 0:
+        worst_point, worst_error = max(((point, _interval_error(tally, z=z, relative_precision=relative_precision)) for point, tally in tallies.items()), key=lambda item: item[1])
+        print(f"Ran {shots_spent} shots adaptively; the widest interval is at (n_qubits={worst_point[0]}, circuit_length={worst_point[1]}) with half-width {worst_error:.3g}" + (" (relative)" if relative_precision else ""))
 
+    return all_data
@@ -0,0 +1,326 @@
+import numpy as np
+
+from CodeRegistry import code_registry
+from Decoding import LookupTableDecoder, tableau_to_symplectic, symplectic_product, pauli_symplectic, propagate_faults, _propagate_gate, _rows_to_int
+
+# Every stabilizer of a flagged round is measured by its own ancilla, which at the same time flags the hook errors of the other ancillas:
+#   - ancillas of stabilizers with X or Y support are prepared in |+> and control the Paulis of their stabilizer (cx, cy, cz onto the data)
+#   - ancillas of Z-type stabilizers stay in |0> and are the target of cx gates from the data, as in the flagged Steane circuits
+# Couplings of two ancillas to a data qubit on which their Paulis anticommute do not commute, and every reordering of such a pair is compensated
+# by a controlled Z between the two ancillas (written in the frame of each ancilla, i.e. a cx if one of them is a Z-type ancilla).
+# These ancilla-ancilla gates, and optional pairs of them, propagate the faults of one ancilla into the measurement of another, which flags them.
+# Faults are all Paulis after every gate (see Decoding.propagate_faults), and a fault which flips no ancilla of its round leaves a data error that is
+# carried into the later rounds, so every round is synthesized knowing the circuits of the rounds before it.
+# Schedules are only checked against single faults, which matches the lookup table decoder and the QEC cycle of LogicalCircuit: together they are
+# fault-tolerant for distance-3 codes only, so codes of larger distance are not given flagged schedules (see get_flag_schedules).
+# The number of ancillas is not searched over either: every round uses one ancilla per stabilizer, as the unflagged rounds do, and some codes
+# have no fault-tolerant schedule of this form (e.g. the [[5,1,3]] code, whose rounds are then measured unflagged).
+
+def _ancilla_gate(i, j, bare, n):
+    if bare[i]:
+        return ("cx", [n+j, n+i])
+    if bare[j]:
+        return ("cx", [n+i, n+j])
+    return ("cz", [n+i, n+j])
+
+def _circuit_depth(operations):
+    levels = {}
+    for _, qubits in operations:
+        level = max(levels.get(q, 0) for q in qubits) + 1
+        for q in qubits:
+            levels[q] = level
+
+    return max(levels.values(), default=0)
+
+# Stabilizer measured by each ancilla (back-propagated Z measurements), or None if the outcome is not a deterministic stabilizer measurement
+def _measured_stabilizers(operations, N, n, S):
+    paulis = np.zeros((N-n, 2*N), dtype=np.uint8)
+    paulis[np.arange(N-n), N + np.arange(n, N)] = 1
+    for name, qubits in reversed(operations):
+        _propagate_gate(paulis, name, qubits, N)
+
+    # Ancillas start in |0>, so any remaining X component on the ancillas randomizes the outcome
+    if paulis[:, n:N].any():
+        return None
+
+    data_paulis = np.concatenate([paulis[:, :n], paulis[:, N:N+n]], axis=1)
+    measured = []
+    for data_pauli in data_paulis:
+        matches = np.flatnonzero((S == data_pauli).all(axis=1))
+        measured.append(int(matches[0]) if len(matches) > 0 else None)
+
+    return measured
+
+"""
+    Count the single faults of a flagged round which the lookup table decoder of LogicalCircuit does not correct.
+    A flagged round triggers the unflagged rounds as soon as any stabilizer measurement changes, after which every Pauli frame bit is decoded
+    from the unflagged syndrome of its stabilizer group together with the flags (changed measurements of the flagged rounds) of that group.
+    Faults of the round are therefore only correctable if all faults and incoming single-qubit data errors with the same flags and syndrome
+    have the same logical effect, and those without flags have the logical effect of the unflagged correction.
+    Parameters:
+        - flips: uint8 array of shape (n_events, m), the stabilizer measurements of the round changed by each event
+        - errors: uint8 array of shape (n_events, 2n), the data error of each event
+        - round_stabilizers: Stabilizer indices corresponding to the columns of flips
+        - decoder: LookupTableDecoder of the code (only its unflagged corrections are used)
+        - decoding_groups: list of (stabilizer indices, Pauli frame index) decoded separately, as in LogicalCircuit.apply_decoding
+    Returns:
+        - violations: Number of (event, decoding group) pairs which are decoded to the wrong logical state
+"""
+def count_flag_violations(flips, errors, round_stabilizers, decoder, decoding_groups):
+    violations = 0
+
+    # Syndromes and logical flips of all decoding groups, from a single product with their stacked stabilizers and logical operators
+    offsets = np.cumsum([0] + [len(G) for G, _ in decoding_groups])
+    products = symplectic_product(errors, np.concatenate([decoder.S[list(G)] for G, _ in decoding_groups] + [np.array([decoder.logicals[pf_ind] for _, pf_ind in decoding_groups])]))
+
+    for g, (G, pf_ind) in enumerate(decoding_groups):
+        unflagged_flips = decoder.flip_lookup(G, pf_ind)
+
+        columns = [round_stabilizers.index(s) for s in G if s in round_stabilizers]
+        flag_bits = np.zeros((len(flips), len(G)), dtype=np.uint8)
+        flag_bits[:, [k for k, s in enumerate(G) if s in round_stabilizers]] = flips[:, columns]
+        flags = _rows_to_int(flag_bits)
+        syndromes = _rows_to_int(products[:, offsets[g]:offsets[g+1]])
+        logical_flips = products[:, offsets[-1] + g]
+
+        unflagged = flags == 0
+        violations += int(np.count_nonzero(unflagged_flips[syndromes[unflagged]] != logical_flips[unflagged]))
+
+        # Events sharing flags and syndrome receive the same correction, so only the majority can be corrected
+        _, keys = np.unique(flags[~unflagged] * 2**len(G) + syndromes[~unflagged], return_inverse=True)
+        ones = np.bincount(keys, weights=logical_flips[~unflagged], minlength=keys.max(initial=-1) + 1)
+        totals = np.bincount(keys, minlength=len(ones))
+        violations += int(np.minimum(ones, totals - ones).sum())
+
+    return violations
+
+# Data errors entering a flagged round, with the measurements of the round they flip:
+#   - single-qubit errors from before the cycle, unless an earlier round already detected them
+#   - carried errors, left by the faults of earlier rounds which flipped none of their measurements (see undetected_errors)
+def _incoming_errors(S, n, round_stabilizers, preceding_stabilizers, carried_errors=None):
+    errors = np.zeros((3*n, 2*n), dtype=np.uint8)
+    for j in range(n):
+        for f, fault in enumerate(["X", "Y", "Z"]):
+            errors[3*j + f, j], errors[3*j + f, n+j] = pauli_symplectic[fault]
+
+    undetected = ~symplectic_product(errors, S[list(preceding_stabilizers)]).astype(bool).any(axis=1) if len(preceding_stabilizers) > 0 else np.ones(3*n, dtype=bool)
+    errors = errors[undetected]
+    if carried_errors is not None:
+        errors = np.concatenate([errors, carried_errors])
+
+    return symplectic_product(errors, S[list(round_stabilizers)]).astype(np.uint8), errors
+
+"""
+    Data errors which the faults of a synthesized round leave without flipping any of its measurements, and which therefore reach the next round.
+    Parameters:
+        - schedule: Schedule of the round, as returned by synthesize_flagged_circuit
+        - n: Number of data qubits
+        - carried_errors: Errors carried into the round from earlier rounds, which are passed on if the round does not detect them either
+        - S: Symplectic matrix of the stabilizers
+    Returns:
+        - carried_errors: uint8 array of shape (n_errors, 2n) with the distinct non-trivial undetected data errors
+"""
+def undetected_errors(schedule, n, S, carried_errors=None):
+    operations = schedule["operations"]
+    ancilla_flips, errors = propagate_faults(operations, n + len(schedule["measured_stabilizers"]), n)
+    errors = errors[~ancilla_flips.any(axis=1)]
+
+    if carried_errors is not None and len(carried_errors) > 0:
+        detected = symplectic_product(carried_errors, S[schedule["measured_stabilizers"]]).astype(bool).any(axis=1)
+        errors = np.concatenate([errors, carried_errors[~detected]])
+
+    errors = np.unique(errors, axis=0)
+    return errors[errors.any(axis=1)]
+
+# Operations of a candidate schedule, on the data qubits followed by the ancillas (ancilla i is qubit n+i)
+#   - orders: Coupling order of the data qubits of every ancilla, which are packed into layers serving the ancillas with the most remaining couplings first
+#   - compensation_times: Time of the compensating ancilla-ancilla gate of every pair of ancillas, only emitted if the pair needs one
+#   - flag_pairs: list of (i, j, t1, t2) additional pairs of ancilla-ancilla gates, which cancel in the absence of faults
+def _schedule_operations(orders, compensation_times, flag_pairs, supports, bare, anticommuting, n):
+    m = len(orders)
+    remaining = [list(order) for order in orders]
+    coupling_layer = {}
+    layers = []
+    while any(remaining):
+        busy = set()
+        layer = []
+        for i in sorted(range(m), key=lambda i: -len(remaining[i])):
+            for k, d in enumerate(remaining[i]):
+                if d not in busy:
+                    busy.add(d)
+                    layer.append((i, d))
+                    coupling_layer[(i, d)] = len(layers)
+                    del remaining[i][k]
+                    break
+        layers.append(layer)
+
+    # Gates at time t + 0.5 are emitted after coupling layer t, where t = -1 is right after the preparation of the ancillas
+    ancilla_gates = []
+    for (i, j), shared in anticommuting.items():
+        if sum(coupling_layer[(j, d)] < coupling_layer[(i, d)] for d in shared) % 2 == 1:
+            ancilla_gates.append((min(compensation_times[(i, j)], len(layers) - 1) + 0.5, _ancilla_gate(i, j, bare, n)))
+
+    for i, j, t1, t2 in flag_pairs:
+        ancilla_gates.append((min(t1, len(layers) - 1) + 0.5, _ancilla_gate(i, j, bare, n)))
+        ancilla_gates.append((min(t2, len(layers) - 1) + 0.5, _ancilla_gate(i, j, bare, n)))
+
+    timed_operations = [(-1, ("h", [n+i])) for i in range(m) if not bare[i]]
+    timed_operations += [(len(layers), ("h", [n+i])) for i in range(m) if not bare[i]]
+    timed_operations += ancilla_gates
+    for t, layer in enumerate(layers):
+        for i, d in layer:
+            p = supports[i][d]
+            timed_operations.append((t, ("cx", [d, n+i]) if bare[i] else (f"c{p.lower()}", [n+i, d])))
+
+    return [operation for _, operation in sorted(timed_operations, key=lambda timed_operation: timed_operation[0])]
+
+"""
+    Synthesize a flagged syndrome extraction circuit for a group of stabilizers, with one ancilla per stabilizer and no separate flag qubits,
+    which is tolerant to a single fault. The schedule is found by a seeded local search over the coupling order of every ancilla and the times of the ancilla-ancilla gates
+    (adding further pairs of ancilla-ancilla gates only if needed), minimizing the number of undecodable single faults (see count_flag_violations),
+    then the depth and then the number of gates. Every candidate must measure the stabilizers deterministically.
+    The search takes seconds per code, which is why get_flag_schedules persists its results in the code registry.
+    Parameters:
+        - stabilizer_tableau: List of stabilizers as Pauli strings
+        - stabilizer_indices: Stabilizers measured by the round, one per ancilla
+        - decoder: LookupTableDecoder of the code
+        - decoding_groups: list of (stabilizer indices, Pauli frame index) as in count_flag_violations
+        - preceding_stabilizers: Stabilizers measured by earlier flagged rounds, which already detect some incoming data errors
+        - carried_errors: Data errors left undetected by the faults of earlier flagged rounds (see undetected_errors), or None
+        - n_restarts: Maximum number of random starting schedules for every number of additional ancilla-ancilla gate pairs
+        - n_steps: Number of local search steps per starting schedule
+        - n_refinements: Number of further starting schedules tried after the first fault-tolerant schedule is found
+        - max_flag_pairs: Maximum number of additional pairs of ancilla-ancilla gates
+        - seed: Seed of the search, which makes the synthesized circuits reproducible
+    Returns:
+        - schedule: dict with the circuit "operations" as (gate name, qubit indices) on the data qubits followed by the ancillas,
+          the "measured_stabilizers" of each ancilla and the circuit "depth", or None if no fault-tolerant schedule was found
+"""
+def synthesize_flagged_circuit(stabilizer_tableau, stabilizer_indices, decoder, decoding_groups, preceding_stabilizers=(), carried_errors=None, n_restarts=20, n_steps=300, n_refinements=2, max_flag_pairs=2, seed=0):
+    rng = np.random.default_rng(seed)
+    S = tableau_to_symplectic(stabilizer_tableau)
+    n = len(stabilizer_tableau[0])
+    m = len(stabilizer_indices)
+    N = n + m
+
+    supports = [{d: p for d, p in enumerate(stabilizer_tableau[s]) if p != "I"} for s in stabilizer_indices]
+    bare = [all(p == "Z" for p in support.values()) for support in supports]
+    incoming_flips, incoming_errors = _incoming_errors(S, n, stabilizer_indices, preceding_stabilizers, carried_errors)
+
+    # Data qubits on which two ancillas couple with anticommuting Paulis
+    anticommuting = {
+        (i, j): [d for d in supports[i] if d in supports[j] and supports[i][d] != supports[j][d]]
+        for i in range(m) for j in range(i+1, m)
+    }
+    anticommuting = {pair: shared for pair, shared in anticommuting.items() if len(shared) > 0}
+    flag_candidates = [(i, j) for i in range(m) for j in range(i+1, m) if not (bare[i] and bare[j])]
+    max_time = max(len(support) for support in supports) + m
+
+    # Many candidates (e.g. differing only in the time of an unneeded compensation) give the same circuit, which is only scored once
+    scores = {}
+    def evaluate(candidate):
+        operations = _schedule_operations(*candidate, supports, bare, anticommuting, n)
+        key = tuple((name, tuple(qubits)) for name, qubits in operations)
+        if key not in scores:
+            if _measured_stabilizers(operations, N, n, S) != list(stabilizer_indices):
+                scores[key] = (np.inf,)
+            else:
+                ancilla_flips, errors = propagate_faults(operations, N, n)
+                violations = count_flag_violations(np.concatenate([ancilla_flips, incoming_flips]), np.concatenate([errors, incoming_errors]), list(stabilizer_indices), decoder, decoding_groups)
+                scores[key] = (violations, _circuit_depth(operations), len(operations))
+
+        return scores[key], operations
+
+    def mutate(candidate, n_flag_pairs):
+        orders, compensation_times, flag_pairs = [list(order) for order in candidate[0]], dict(candidate[1]), list(candidate[2])
+        move = rng.integers(4 if n_flag_pairs > 0 and len(flag_candidates) > 0 else 2)
+
+        if move == 0 or (move == 1 and len(compensation_times) == 0):
+            order = orders[rng.integers(m)]
+            if len(order) > 1:
+                a, b = rng.choice(len(order), size=2, replace=False)
+                order[a], order[b] = order[b], order[a]
+        elif move == 1:
+            pairs = list(compensation_times)
+            compensation_times[pairs[rng.integers(len(pairs))]] = int(rng.integers(-1, max_time))
+        elif move == 2 and len(flag_pairs) < n_flag_pairs:
+            i, j = flag_candidates[rng.integers(len(flag_candidates))]
+            flag_pairs.append((i, j, int(rng.integers(-1, max_time)), int(rng.integers(-1, max_time))))
+        elif len(flag_pairs) > 0:
+            del flag_pairs[rng.integers(len(flag_pairs))]
+
+        return orders, compensation_times, flag_pairs
+
+    # Additional ancilla-ancilla gate pairs are only allowed if the schedules without them are not fault-tolerant,
+    # and once a fault-tolerant schedule is found a few more starting schedules are tried to reduce its depth
+    best = None
+    for n_flag_pairs in range(max_flag_pairs + 1):
+        remaining_restarts = n_restarts
+        while remaining_restarts > 0:
+            remaining_restarts -= 1
+            candidate = (
+                [[int(d) for d in rng.permutation(list(support))] for support in supports],
+                {pair: int(rng.integers(-1, max_time)) for pair in anticommuting},
+                [],
+            )
+            score, operations = evaluate(candidate)
+
+            for _ in range(n_steps):
+                new_candidate = mutate(candidate, n_flag_pairs)
+                new_score, new_operations = evaluate(new_candidate)
+                if new_score <= score:
+                    candidate, score, operations = new_candidate, new_score, new_operations
+
+            if score[0] == 0 and (best is None or score < best[0]):
+                if best is None:
+                    remaining_restarts = min(remaining_restarts, n_refinements)
+                best = (score, operations)
+
+        if best is not None:
+            break
+
+    if best is None:
+        return None
+
+    (_, depth, _), operations = best
+    return {"operations": operations, "measured_stabilizers": list(stabilizer_indices), "depth": depth}
+
+"""
+    Get the (cached) flagged extraction schedules of a code, synthesized once per code and shared by all circuits through the code registry.
+    The flagged rounds are measured one after another, and the faults of a round are decoded together with the errors left by the preceding rounds.
+    Only single faults are considered, so only codes of distance at most 3 get flagged schedules, and larger codes are measured unflagged.
+    Parameters:
+        - label: Code label (n, k, d)
+        - stabilizer_tableau: List of stabilizers as Pauli strings
+        - stabilizer_groups: Stabilizers measured in each flagged round
+        - logical_x_vector, logical_z_vector: Logical operator vectors, as produced by LogicalCircuit.generate_code
+        - decoding_groups: Stabilizers and Pauli frame index decoded together, e.g. [(x_stabilizers, 0), (z_stabilizers, 1)]
+        - n_ancillas: Number of ancillas available per logical qubit, larger rounds are not synthesized
+    Returns:
+        - schedules: List with the schedule of each round (see synthesize_flagged_circuit), or None if the round has to be measured unflagged
+"""
+def get_flag_schedules(label, stabilizer_tableau, stabilizer_groups, logical_x_vector, logical_z_vector, decoding_groups, n_ancillas):
+    # A single-fault-tolerant schedule does not tolerate the (d-1)/2 faults which a code of distance d > 3 should
+    if label[2] > 3:
+        return [None for _ in stabilizer_groups]
+
+    def build_schedules():
+        decoder = LookupTableDecoder(stabilizer_tableau, logical_x_vector, logical_z_vector)
+        S = tableau_to_symplectic(stabilizer_tableau)
+        schedules = []
+        carried_errors = None
+        for r, stabilizer_indices in enumerate(stabilizer_groups):
+            if len(stabilizer_indices) > n_ancillas:
+                schedules.append(None)
+                continue
+
+            preceding_stabilizers = [s for group in stabilizer_groups[:r] for s in group]
+            schedule = synthesize_flagged_circuit(stabilizer_tableau, stabilizer_indices, decoder, decoding_groups, preceding_stabilizers=preceding_stabilizers, carried_errors=carried_errors)
+            schedules.append(schedule)
+            if schedule is not None:
+                carried_errors = undetected_errors(schedule, len(stabilizer_tableau[0]), S, carried_errors)
+
+        return schedules
+
+    groups = "_".join("-".join(str(s) for s in group) for group in stabilizer_groups)
+    return code_registry.get(label, stabilizer_tableau, f"flag_schedules_{groups}", build_schedules, persist=True)
@@ -0,0 +1,144 @@
+import numpy as np
+
+# Linear algebra over GF(2) on bit-packed rows: column j of a matrix is stored in bit j%64 of word j//64 of its row,
+# so that row operations act on 64 columns at a time and are vectorized over all rows.
+
+WORD_BITS = 64
+
+def n_words(n_cols):
+    return max(1, (n_cols + WORD_BITS - 1)//WORD_BITS)
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words):
+        return np.bitwise_count(words)
+else:
+    def popcount(words):
+        words = np.ascontiguousarray(words, dtype="<u8")
+        bits = np.unpackbits(words.view(np.uint8).reshape(*words.shape, 8), axis=-1)
+        return bits.sum(axis=-1)
+
+"""
+    Pack a binary matrix into rows of uint64 words.
+    Parameters:
+        - matrix: array of shape (m, n_cols) with entries 0/1
+    Returns:
+        - packed: uint64 array of shape (m, n_words(n_cols))
+"""
+def pack_rows(matrix):
+    matrix = np.atleast_2d(np.asarray(matrix) % 2).astype(np.uint8)
+    m, n_cols = matrix.shape
+
+    padded = np.zeros((m, n_words(n_cols)*WORD_BITS), dtype=np.uint8)
+    padded[:, :n_cols] = matrix
+    return np.packbits(padded, axis=1, bitorder="little").view("<u8").astype(np.uint64)
+
+"""
+    Unpack rows of uint64 words into a binary matrix.
+    Parameters:
+        - packed: uint64 array of shape (m, n_words)
+        - n_cols: Number of columns of the matrix
+    Returns:
+        - matrix: uint8 array of shape (m, n_cols)
+"""
+def unpack_rows(packed, n_cols):
+    packed = np.ascontiguousarray(np.atleast_2d(packed), dtype="<u8")
+    bits = np.unpackbits(packed.view(np.uint8), axis=1, bitorder="little")
+    return bits[:, :n_cols]
+
+"""
+    Pack symplectic Pauli rows [X | Z] of shape (m, 2n), with the X and Z halves each padded to whole words.
+    Column j of the Z half is therefore bit z_offset(n) + j of the packed row.
+"""
+def pack_symplectic(S):
+    S = np.atleast_2d(S)
+    n = S.shape[1]//2
+    return np.concatenate([pack_rows(S[:, :n]), pack_rows(S[:, n:])], axis=1)
+
+def unpack_symplectic(packed, n):
+    w = n_words(n)
+    return np.concatenate([unpack_rows(packed[:, :w], n), unpack_rows(packed[:, w:], n)], axis=1)
+
+def z_offset(n):
+    return n_words(n)*WORD_BITS
+
+"""
+    Gauss-Jordan elimination of packed rows, in place.
+    Parameters:
+        - packed: uint64 array of shape (m, n_words), modified in place
+        - columns: Bit positions to eliminate, in order (default: all columns)
+        - start_row: Only rows from start_row onwards take part in the elimination
+    Returns:
+        - pivot_columns: list with the pivot column of each reduced row, i.e. row start_row + i has its pivot at pivot_columns[i]
+"""
+def row_reduce(packed, columns=None, start_row=0):
+    m = packed.shape[0]
+    if columns is None:
+        columns = range(packed.shape[1]*WORD_BITS)
+
+    pivot_columns = []
+    row = start_row
+    for col in columns:
+        if row >= m:
+            break
+
+        word, bit = divmod(col, WORD_BITS)
+        mask = np.uint64(1) << np.uint64(bit)
+
+        candidates = np.flatnonzero(packed[row:, word] & mask)
+        if candidates.size == 0:
+            continue
+
+        pivot_row = row + candidates[0]
+        if pivot_row != row:
+            packed[[row, pivot_row]] = packed[[pivot_row, row]]
+
+        # Flip all other rows with a 1 in the pivot column at once
+        flip = start_row + np.flatnonzero(packed[start_row:, word] & mask)
+        flip = flip[flip != row]
+        packed[flip] ^= packed[row]
+
+        pivot_columns.append(col)
+        row += 1
+
+    return pivot_columns
+
+def rank(matrix):
+    return len(row_reduce(pack_rows(matrix)))
+
+"""
+    Basis of the right nullspace {x : M x = 0} of a binary matrix.
+    Parameters:
+        - matrix: array of shape (m, n_cols) with entries 0/1
+    Returns:
+        - basis: uint8 array of shape (n_cols - rank, n_cols)
+"""
+def nullspace(matrix):
+    matrix = np.atleast_2d(matrix)
+    n_cols = matrix.shape[1]
+
+    packed = pack_rows(matrix)
+    pivot_columns = row_reduce(packed, range(n_cols))
+    reduced = unpack_rows(packed[:len(pivot_columns)], n_cols)
+
+    free_columns = [c for c in range(n_cols) if c not in set(pivot_columns)]
+    basis = np.zeros((len(free_columns), n_cols), dtype=np.uint8)
+    for i, f in enumerate(free_columns):
+        basis[i, f] = 1
+        basis[i, pivot_columns] = reduced[:, f]
+
+    return basis
+
+"""
+    Symplectic inner products between packed Pauli operators, as produced by pack_symplectic.
+    Parameters:
+        - a: uint64 array of shape (m_a, 2*n_words)
+        - b: uint64 array of shape (m_b, 2*n_words)
+    Returns:
+        - products: uint8 array of shape (m_a, m_b), 1 where the operators anticommute
+"""
+def symplectic_product(a, b):
+    a, b = np.atleast_2d(a), np.atleast_2d(b)
+    w = a.shape[1]//2
+
+    overlap = (a[:, None, :w] & b[None, :, w:]) ^ (a[:, None, w:] & b[None, :, :w])
+    return (popcount(overlap).sum(axis=-1) % 2).astype(np.uint8)
@@ -1,12 +1,43 @@
-import sys
 import copy
 import numpy as np
 
 from qiskit import QuantumRegister, AncillaRegister, ClassicalRegister, QuantumCircuit
-from qiskit.circuit import CircuitInstruction, Bit, Measure
-from qiskit.circuit.library import HGate
+from qiskit.circuit import CircuitInstruction, Measure, Store
+from qiskit.circuit.library import HGate, CXGate, CYGate, CZGate
 from qiskit.circuit.classical import expr
-from qiskit.quantum_info import Pauli, Clifford
+from qiskit.quantum_info import StabilizerState, Pauli
+from qiskit.synthesis import synth_circuit_from_stabilizers
+
+from CodeRegistry import code_registry
+from Scheduling import asap_layers, schedule_instructions
+import GF2 as gf2
+from Decoding import tableau_to_symplectic, get_lookup_table_decoder, measured_stabilizers_from_circuit, hook_errors_from_rounds, memory_to_array, decode_memory
+from FlagSynthesis import get_flag_schedules
+from Counts import EncodedCounts
+
+# Native controlled Paulis used to measure stabilizers, shared singleton gates which are never copied
+controlled_paulis = {"X": CXGate(), "Y": CYGate(), "Z": CZGate()}
+# Gates of the synthesized flagged extraction schedules (see FlagSynthesis)
+schedule_gates = {"h": HGate(), "cx": CXGate(), "cy": CYGate(), "cz": CZGate()}
+
+# Circuit of exp(-i pi/4 P) for the Pauli P with X part x and Z part z, which is the S gate (up to a global phase) on the single-qubit Z and, applied to a
+# logical operator that commutes with all stabilizers, the corresponding logical rotation: P is rotated onto Z of its last qubit by basis changes and a CX ladder
+def pauli_rotation_circuit(x, z):
+    support = [q for q in range(len(x)) if x[q] or z[q]]
+    basis_change = QuantumCircuit(len(x))
+    for q in support:
+        if x[q] and z[q]:
+            basis_change.sdg(q)
+        if x[q]:
+            basis_change.h(q)
+    for a, b in zip(support, support[1:]):
+        basis_change.cx(a, b)
+
+    circuit = basis_change.copy()
+    circuit.s(support[-1])
+    circuit.compose(basis_change.inverse(), inplace=True)
+
+    return circuit
 
 class LogicalCircuit(QuantumCircuit):
     def __init__(
@@ -15,11 +46,16 @@ class LogicalCircuit(QuantumCircuit):
             label,
             stabilizer_tableau,
             name: str | None = None,
+            offline_decoding: bool = False,
+            n_ancilla_blocks: int | None = None,
         ):
 
         # Quantum error correcting code preparation
         self.n_logical_qubits = n_logical_qubits
 
+        # If true, QEC cycles only record raw syndrome measurements and all decoding is done after sampling (see Decoding.decode_memory)
+        self.offline_decoding = offline_decoding
+
         self.stabilizer_tableau = stabilizer_tableau
         self.n_stabilizers = len(self.stabilizer_tableau)
         self.n_physical_qubits = len(self.stabilizer_tableau[0])
@@ -27,20 +63,30 @@ class LogicalCircuit(QuantumCircuit):
         self.n, self.k, self.d = label
         assert self.n == self.n_physical_qubits, f"Code label n ({self.n}) does not match individual stabilizer length ({self.n_physical_qubits})."
 
+        # Stabilizers are grouped before the code is constructed, which reuses the X/Z grouping to detect self-dual CSS codes
+        self.flagged_stabilizers_1 = []
+        self.flagged_stabilizers_2 = []
+        self.x_stabilizers = []
+        self.z_stabilizers = []
+        self.group_stabilizers()
+
         self.generate_code()
 
         # Auxiliary data preparation
         self.n_ancilla_qubits = self.n_stabilizers//2
         self.n_measure_qubits = self.n_ancilla_qubits
 
-        self.flagged_stabilizers_1 = []
-        self.flagged_stabilizers_2 = []
-        self.x_stabilizers = []
-        self.z_stabilizers = []
+        # Ancillas are allocated in blocks of n_ancilla_qubits, by default one block per logical qubit
+        # With fewer blocks, logical qubits share a pool of ancilla blocks which are reset and reused: the circuit is narrower,
+        # but syndrome extractions of logical qubits sharing a block are scheduled one after another, so QEC cycles are deeper
+        if n_ancilla_blocks is not None and n_ancilla_blocks < 1:
+            raise ValueError(f"Number of ancilla blocks must be at least 1, got {n_ancilla_blocks}")
+        self.n_ancilla_blocks = n_ancilla_blocks
 
         self.logical_qregs = []
+        # Ancilla block of every logical qubit, where logical qubit i uses block i % n_ancilla_blocks of the pool
         self.ancilla_qregs = []
-        self.logical_op_qregs = []
+        self.ancilla_pool = []
         self.enc_verif_cregs = []
         self.curr_syndrome_cregs = []
         self.prev_syndrome_cregs = []
@@ -50,44 +96,82 @@ class LogicalCircuit(QuantumCircuit):
         self.final_measurement_cregs = []
         self.output_creg = ClassicalRegister(self.n_logical_qubits, name="output")
 
+        # Records of the raw syndrome measurements and final measurements used for offline decoding
+        self.offline_qec_records = []
+        self.offline_measure_records = []
+
+        self._controlled_logical_x_gate = None
+
+        # Spans (phase, start, stop) of the top-level instructions emitted by each phase of the circuit, used for resource estimation
+        self.phase_spans = []
+
         # The underlying QuantumCircuit is generated by calling super()
         super().__init__(name=name)
         self.add_logical_qubits(self.n_logical_qubits)
         super().add_register(self.output_creg)
-        self.group_stabilizers()
+        self.build_decoder()
 
-        # @TODO - find alternative, possibly by implementing upstream
-        # Create setter qreg for purpose of setting classical bits dynamically
-        self.cbit_setter_qreg = QuantumRegister(2, name="qsetter")
-        self.add_register(self.cbit_setter_qreg)
-        super().x(self.cbit_setter_qreg[1])
-
-    # @TODO - this completely ignores QEC (besides encoding), do we want to have some sort of default QEC behavior?
-    #       - alternatively, we let the user configure_qec_cycles and/or inject_qec_cycles
+    # Compiles a physical circuit into a LogicalCircuit with one logical qubit per physical qubit (see compile_physical_circuit)
+    # QEC is only performed if a qec_cycle_interval is given, otherwise the user may configure or inject QEC cycles afterwards
     @classmethod
-    def from_physical_circuit(cls, physical_circuit, label, stabilizer_tableau, name=None):
-        logical_circuit = cls(physical_circuit.num_qubits, label, stabilizer_tableau, name)
-
-        # @TODO - expose the options that encode takes to the user of from_physical_circuit
-        logical_circuit.encode(range(physical_circuit.num_qubits), max_iterations=3)
+    def from_physical_circuit(cls, physical_circuit, label, stabilizer_tableau, name=None, qec_cycle_interval=None, max_iterations=3, n_ancilla_blocks=None):
+        logical_circuit = cls(physical_circuit.num_qubits, label, stabilizer_tableau, name, n_ancilla_blocks=n_ancilla_blocks)
 
-        for i in range(physical_circuit.depth()):
-            circuit_instruction = physical_circuit.data[i]
-
-            logical_circuit.append(circuit_instruction)
+        logical_circuit.encode(range(physical_circuit.num_qubits), max_iterations=max_iterations)
+        logical_circuit.compile_physical_circuit(physical_circuit, qec_cycle_interval=qec_cycle_interval)
 
         return logical_circuit
 
+    """
+        Appends the logical counterparts of the instructions of a physical circuit, where physical qubit i is mapped to logical qubit i
+        and physical clbit j to bit j of the output register.
+        The instructions are streamed once, with bit indices resolved through a lookup built once per circuit and no copies of the instructions.
+        Parameters:
+            - physical_circuit: QuantumCircuit made of operations with a logical counterpart (see _apply_logical_operation)
+            - qec_cycle_interval: If given, a QEC cycle is performed on all logical qubits whenever another logical layer would exceed this many layers since the last cycle
+            - with_error_correction: Whether logical measurements apply the final correction
+    """
+    def compile_physical_circuit(self, physical_circuit, qec_cycle_interval=None, with_error_correction=True):
+        if physical_circuit.num_qubits > self.n_logical_qubits:
+            raise ValueError(f"Physical circuit has {physical_circuit.num_qubits} qubits, but the LogicalCircuit only has {self.n_logical_qubits} logical qubits")
+
+        if qec_cycle_interval is not None and qec_cycle_interval < 1:
+            raise ValueError("The QEC cycle interval must be at least one logical layer")
+
+        qubit_indices = {qubit: i for i, qubit in enumerate(physical_circuit.qubits)}
+        clbit_indices = {clbit: i for i, clbit in enumerate(physical_circuit.clbits)}
+
+        # Logical layer of each logical qubit since the last QEC cycle
+        layers = [0] * self.n_logical_qubits
+
+        for circuit_instruction in physical_circuit.data:
+            operation = circuit_instruction.operation
+            qubits = [qubit_indices[qubit] for qubit in circuit_instruction.qubits]
+            clbits = [clbit_indices[clbit] for clbit in circuit_instruction.clbits]
+
+            if qec_cycle_interval is not None and len(qubits) > 0 and operation.name not in ["barrier", "id"]:
+                layer = max(layers[q] for q in qubits) + 1
+                if layer > qec_cycle_interval:
+                    self.perform_qec_cycle(schedule=False)
+                    layers = [0] * self.n_logical_qubits
+                    layer = 1
+
+                for q in qubits:
+                    layers[q] = layer
+
+            self._apply_logical_operation(operation, qubits, clbits, with_error_correction=with_error_correction)
+
     def add_logical_qubits(self, logical_qubit_count):
         current_logical_qubit_count = len(self.logical_qregs)
 
         for i in range(current_logical_qubit_count, current_logical_qubit_count + logical_qubit_count):
             # Physical qubits for logical qubit
             logical_qreg_i = QuantumRegister(self.n_physical_qubits, name=f"qlog{i}")
-            # Ancilla qubits needed for measurements
-            ancilla_qreg_i = AncillaRegister(self.n_ancilla_qubits, name=f"qanc{i}")
-            # Ancilla qubits needed for logical operations
-            logical_op_qreg_i = AncillaRegister(1, name=f"qlogical_op{i}")
+            # Ancilla qubits needed for measurements, which are shared with other logical qubits once the pool is full
+            new_ancilla_block = self.n_ancilla_blocks is None or len(self.ancilla_pool) < self.n_ancilla_blocks
+            if new_ancilla_block:
+                self.ancilla_pool.append(AncillaRegister(self.n_ancilla_qubits, name=f"qanc{len(self.ancilla_pool)}"))
+            ancilla_qreg_i = self.ancilla_pool[i % len(self.ancilla_pool)]
             # Classical bits needed for encoding verification
             enc_verif_creg_i = ClassicalRegister(1, name=f"cenc_verif{i}")
             # Classical bits needed for measurements
@@ -106,7 +190,6 @@ class LogicalCircuit(QuantumCircuit):
             # Add new registers to storage lists
             self.logical_qregs.append(logical_qreg_i)
             self.ancilla_qregs.append(ancilla_qreg_i)
-            self.logical_op_qregs.append(logical_op_qreg_i)
             self.enc_verif_cregs.append(enc_verif_creg_i)
             self.curr_syndrome_cregs.append(curr_syndrome_creg_i)
             self.prev_syndrome_cregs.append(prev_syndrome_creg_i)
@@ -114,11 +197,12 @@ class LogicalCircuit(QuantumCircuit):
             self.unflagged_syndrome_diff_cregs.append(unflagged_syndrome_diff_creg_i)
             self.pauli_frame_cregs.append(pauli_frame_creg_i)
             self.final_measurement_cregs.append(final_measurement_creg_i)
+            self.offline_qec_records.append([])
 
             # Add new registers to quantum circuit
             super().add_register(logical_qreg_i)
-            super().add_register(ancilla_qreg_i)
-            super().add_register(logical_op_qreg_i)
+            if new_ancilla_block:
+                super().add_register(ancilla_qreg_i)
             super().add_register(enc_verif_creg_i)
             super().add_register(curr_syndrome_creg_i)
             super().add_register(prev_syndrome_creg_i)
@@ -135,99 +219,94 @@ class LogicalCircuit(QuantumCircuit):
         # @TODO - determine how stabilizers are generally selected for flagged measurements
         #       - the below is a heuristic which happens to work for the Steane code and potentially all CSS codes, but maybe not all stabilizer codes in general
 
-        # Take the middle k stabilizers
+        # Take the middle k stabilizers, which mixes the X and Z stabilizers of CSS codes in both rounds, and the remaining stabilizers
         k = self.n_stabilizers//2
-        self.flagged_stabilizers_1 = [s for s in range(self.n_stabilizers) if s < k - k//2 - 1 or s > k + k//2 - 1]
-        self.flagged_stabilizers_2 = list(set(range(self.n_stabilizers)) - set(self.flagged_stabilizers_1))
+        start = k - (k+1)//2
+        self.flagged_stabilizers_2 = list(range(start, start + k))
+        self.flagged_stabilizers_1 = [s for s in range(self.n_stabilizers) if s not in self.flagged_stabilizers_2]
+
+        # Stabilizers with X (Z) support detect Z (X) errors, where Y counts as both
+        packed = gf2.pack_symplectic(tableau_to_symplectic(self.stabilizer_tableau))
+        w = gf2.n_words(self.n_physical_qubits)
+        self.x_stabilizers += np.flatnonzero(packed[:, :w].any(axis=1)).tolist()
+        self.z_stabilizers += np.flatnonzero(packed[:, w:].any(axis=1)).tolist()
+
+        # The code is CSS if every stabilizer is either X-type or Z-type
+        self.is_css = set(self.x_stabilizers).isdisjoint(self.z_stabilizers)
+
+    # Builds the lookup table decoder for the code, including flag-conditioned corrections derived from the faults of the flagged extraction circuits
+    def build_decoder(self):
+        # Flagged extraction schedules are synthesized once per code, and rounds without a fault-tolerant schedule are measured unflagged
+        self.flag_schedules = get_flag_schedules(
+            (self.n, self.k, self.d), self.stabilizer_tableau, [self.flagged_stabilizers_1, self.flagged_stabilizers_2],
+            self.LogicalXVector, self.LogicalZVector, [(self.x_stabilizers, 0), (self.z_stabilizers, 1)], self.n_ancilla_qubits,
+        )
+
+        # Flagged rounds which do not fit on the ancilla register cannot be analysed, and contribute no flag-conditioned corrections
+        self.flagged_extraction_circuits = []
+        self.flagged_measured_stabilizers = []
+        for flag_round, stabilizer_indices in enumerate([self.flagged_stabilizers_1, self.flagged_stabilizers_2]):
+            if len(stabilizer_indices) > self.n_ancilla_qubits:
+                self.flagged_measured_stabilizers.append(stabilizer_indices)
+                continue
 
-        for i in range(self.n_stabilizers):
-            if 'X' in self.stabilizer_tableau[i]:
-                self.x_stabilizers.append(i)
-            if 'Z' in self.stabilizer_tableau[i]:
-                self.z_stabilizers.append(i)
+            circuit = self.extraction_template(stabilizer_indices, flag_round=flag_round)
+            self.flagged_extraction_circuits.append(circuit)
+            # Stabilizer measured by each ancilla, which need not match the order of the flagged stabilizer group
+            self.flagged_measured_stabilizers.append(measured_stabilizers_from_circuit(circuit, self.stabilizer_tableau))
 
-    # Function which generates encoding circuit and logical operators for a given tableau
-    def generate_code(self):
-        m = len(self.stabilizer_tableau)
+        def hook_errors():
+            return hook_errors_from_rounds(self.flagged_extraction_circuits, self.n_physical_qubits, self.stabilizer_tableau)
 
-        # Step 1: Assemble generator matrix
-        G = np.zeros((2, m, self.n))
-        for i, stabilizer in enumerate(self.stabilizer_tableau):
-            for j, pauli_j in enumerate(stabilizer):
-                if pauli_j == "X":
-                    G[0, i, j] = 1
-                elif pauli_j == "Z":
-                    G[1, i, j] = 1
-                elif pauli_j == "Y":
-                    G[:, i, j] = 1
-
-        # Step 2: Perform Gaussian reduction in base 2
-        row = 0
-        for col in range(self.n):
-            pivot_row = None
-            for i in range(row, m):
-                if G[0, i, col] == 1:
-                    pivot_row = i
-                    break
+        self.decoder = get_lookup_table_decoder((self.n, self.k, self.d), self.stabilizer_tableau, self.LogicalXVector, self.LogicalZVector, hook_errors=hook_errors)
 
-            if pivot_row is None:
-                continue
+    # Fetches the encoding circuit and logical operators for the code from the code registry, constructing them on first use
+    def generate_code(self):
+        code = code_registry.get((self.n, self.k, self.d), self.stabilizer_tableau, "code", self.construct_code, persist=True)
 
-            G[:, [row, pivot_row]] = G[:, [pivot_row, row]]
-
-            # Flip any other rows with a "1" in the same column
-            for i in range(m):
-                if i != row and G[0, i, col] == 1:
-                    G[:, i] = G[:, i].astype(int) ^ G[:, row].astype(int)
-                    # G[0, i] = G[0, i].astype(int) ^ G[0, row].astype(int)
-                    # G[1, i] = G[1, i].astype(int) ^ G[1, row].astype(int)
-
-            # Move to the next row, if we haven't reached the end of the matrix
-            row += 1
-            if row >= m:
-                break
-
-        r = np.linalg.matrix_rank(G[0])
-
-        E = np.copy(G[:, r:, r:])
-        row = 0
-        for col in range(self.n-r):
-            pivot_row = None
-            for i in range(row, m-r):
-                if E[1, i, col] == 1:
-                    pivot_row = i
-                    break
+        # The cached gates and arrays are shared between all circuits using the same code and must not be modified
+        for name, value in code.items():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            setattr(self, name, value)
 
-            if pivot_row is None:
-                continue
+    # Function which generates encoding circuit and logical operators for a given tableau
+    def construct_code(self):
+        m = len(self.stabilizer_tableau)
 
-            E[:, [row, pivot_row]] = E[:, [pivot_row, row]]
-            G[:, [r+row, r+pivot_row]] = G[:, [r+pivot_row, r+row]]
+        # Step 1: Assemble generator matrix as bit-packed symplectic rows [X | Z]
+        symplectic = tableau_to_symplectic(self.stabilizer_tableau)
+        packed = gf2.pack_symplectic(symplectic)
 
-            # Flip any other rows with a "1" in the same column
-            for i in range(m-r):
-                if i != row and E[1, i, col] == 1:
-                    E[:, i] = E[:, i].astype(int) ^ E[:, row].astype(int)
-                    G[:, r+i] = G[:, r+i].astype(int) ^ G[:, r+row].astype(int)
+        # The standard form requires the X pivots in the first r columns and the Z pivots in the next m-r columns,
+        # so the qubits are permuted accordingly (qubit perm[j] of the code is column j of the standard form)
+        x_pivots = gf2.row_reduce(packed, range(self.n))
+        r = len(x_pivots)
+        other_columns = [j for j in range(self.n) if j not in x_pivots]
+        z_pivots = [col - gf2.z_offset(self.n) for col in gf2.row_reduce(packed, [gf2.z_offset(self.n) + j for j in other_columns], start_row=r)]
+        perm = x_pivots + z_pivots + [j for j in other_columns if j not in z_pivots]
 
-            # Move to the next row, if we haven't reached the end of the matrix
-            row += 1
-            if row >= m:
-                break
+        packed = gf2.pack_symplectic(symplectic[:, perm + [self.n + j for j in perm]])
 
+        # Step 2: Perform Gaussian reduction in base 2, first on the X part of all rows and then on the Z part of the remaining rows
+        r = len(gf2.row_reduce(packed, range(self.n)))
+        gf2.row_reduce(packed, range(gf2.z_offset(self.n) + r, gf2.z_offset(self.n) + self.n), start_row=r)
 
-        self.G = G
+        S = gf2.unpack_symplectic(packed, self.n).astype(int)
+        # G is in the columns of the standard form
+        self.G = np.stack([S[:, :self.n], S[:, self.n:]])
 
         # Step 3: Construct logical operators using Pauli vector representations due to Gottesmann (1997)
-        r = np.linalg.matrix_rank(self.G[0])
         A_2 = self.G[0, 0:r, m:self.n] # r x k
         C_1 = self.G[1, 0:r, r:m] # r x m-r
         C_2 = self.G[1, 0:r, m:self.n] # r x k
         E_2 = self.G[1, r:m, m:self.n] # m-r x k
 
-        self.LogicalXVector = np.block([
-            [[np.zeros((self.k, r)), E_2.T,                        np.eye(self.k, self.k)    ]],
-            [[E_2.T @ C_1.T + C_2.T,      np.zeros((self.k, m-r)), np.zeros((self.k, self.k))]]
+        # Logical operators are constructed in the columns of the standard form and mapped back to the qubits of the code
+        self.LogicalXVector = np.zeros((2, self.k, self.n), dtype=int)
+        self.LogicalXVector[:, :, perm] = np.block([
+            [[np.zeros((self.k, r), dtype=int), E_2.T,                              np.eye(self.k, self.k, dtype=int)    ]],
+            [[(E_2.T @ C_1.T + C_2.T) % 2,      np.zeros((self.k, m-r), dtype=int), np.zeros((self.k, self.k), dtype=int)]]
         ])
 
         # Create Logical X circuit corresponding to X's and Z's at 1's in Pauli vector
@@ -243,9 +322,10 @@ class LogicalCircuit(QuantumCircuit):
                     LogicalXCircuit.z(q)
         self.LogicalXGate = LogicalXCircuit.to_gate(label="$X_L$")
 
-        self.LogicalZVector = np.block([
-            [[np.zeros((self.k, r)), np.zeros((self.k, m-r)), np.zeros((self.k, self.k))]],
-            [[A_2.T,                 np.zeros((self.k, m-r)), np.eye(self.k, self.k)    ]]
+        self.LogicalZVector = np.zeros((2, self.k, self.n), dtype=int)
+        self.LogicalZVector[:, :, perm] = np.block([
+            [[np.zeros((self.k, r), dtype=int), np.zeros((self.k, m-r), dtype=int), np.zeros((self.k, self.k), dtype=int)]],
+            [[A_2.T,                            np.zeros((self.k, m-r), dtype=int), np.eye(self.k, self.k, dtype=int)    ]]
         ])
 
         # Create Logical Z circuit corresponding to X's and Z's at 1's in Pauli vector
@@ -264,49 +344,112 @@ class LogicalCircuit(QuantumCircuit):
         LogicalYCircuit = LogicalXCircuit.compose(LogicalZCircuit)
         self.LogicalYGate = LogicalYCircuit.to_gate(label="$Y_L$")
 
-        # Create Logical H circuit using Childs and Wiebe's linear combination of unitaries method
-        LogicalHCircuit_LCU = QuantumCircuit(self.n + 1)
-        LogicalHCircuit_LCU.h(self.n)
-
-        LogicalHCircuit_LCU.append(self.LogicalXGate.control(1), [self.n, *list(range(self.n))])
-
-        LogicalHCircuit_LCU.x(self.n)
-        LogicalHCircuit_LCU.append(self.LogicalZGate.control(1), [self.n, *list(range(self.n))])
-        LogicalHCircuit_LCU.x(self.n)
-
-        LogicalHCircuit_LCU.h(self.n)
-        self.LogicalHGate_LCU = LogicalHCircuit_LCU.to_gate(label="$H_L$")
-
-        # @TODO - Logical S
+        # Transversal CX between the physical qubits of two code blocks, which is a fault-tolerant logical CX for CSS codes (see cx)
+        TransversalCXCircuit = QuantumCircuit(2*self.n)
+        for q in range(self.n):
+            TransversalCXCircuit.cx(q, self.n + q)
+        self.TransversalCXGate = TransversalCXCircuit.to_gate(label="$CX_L$")
 
-        # @TODO - Logical CX
-
-        # Step 4: Apply the respective stabilizers
+        # Step 4: Apply the respective stabilizers (in the columns of the standard form, acting on the permuted qubits)
         encoding_circuit = QuantumCircuit(self.n)
         for i in range(self.k):
             for j in range(r, self.n-self.k):
-                if self.LogicalXVector[0, i, j]:
-                    encoding_circuit.cx(self.n-self.k+i, j)
+                if self.LogicalXVector[0, i, perm[j]]:
+                    encoding_circuit.cx(perm[self.n-self.k+i], perm[j])
 
         for i in range(r):
-            encoding_circuit.h(i)
+            encoding_circuit.h(perm[i])
             for j in range(self.n):
                 if i != j:
-                    if self.G[0, i, j]:
-                        encoding_circuit.cx(i, j)
+                    if self.G[0, i, j] and self.G[1, i, j]:
+                        encoding_circuit.cy(perm[i], perm[j])
+                    elif self.G[0, i, j]:
+                        encoding_circuit.cx(perm[i], perm[j])
                     elif self.G[1, i, j]:
-                        encoding_circuit.cz(i, j)
-                    elif self.G[0, i, j] and self.G[1, i, j]:
-                        encoding_circuit.cx(i, j)
-                        encoding_circuit.cz(i, j)
+                        encoding_circuit.cz(perm[i], perm[j])
+
+        # The standard form drops the signs of products of stabilizers with Y components, so for codes which are not CSS (e.g. the [[5,1,3]] code)
+        # the circuit above may prepare a state of another syndrome; the encoded |0> is then synthesized from the stabilizers and logical Z operators,
+        # which suffices as the encoding gate is only applied to reset qubits (see encode)
+        logical_zs = ["".join("IXZY"[x + 2*z] for x, z in zip(self.LogicalZVector[0, i], self.LogicalZVector[1, i])) for i in range(self.k)]
+        encoded_paulis = [Pauli(pauli[::-1]) for pauli in list(self.stabilizer_tableau) + logical_zs]
+        encoded_state = StabilizerState(encoding_circuit)
+        if any(encoded_state.expectation_value(pauli) != 1 for pauli in encoded_paulis):
+            encoding_circuit = synth_circuit_from_stabilizers([pauli.to_label() for pauli in encoded_paulis])
 
         self.encoding_gate = encoding_circuit.to_gate(label="$U_{enc}$")
 
+        # Logical S and H of every logical qubit from rotations about its logical operators, which works for any stabilizer code:
+        # S ~ exp(-i pi/4 Z_L) and H ~ S exp(-i pi/4 X_L) S
+        LogicalSCircuit = QuantumCircuit(self.n)
+        LogicalHCircuit = QuantumCircuit(self.n)
+        for i in range(self.k):
+            z_rotation = pauli_rotation_circuit(self.LogicalZVector[0, i], self.LogicalZVector[1, i])
+            x_rotation = pauli_rotation_circuit(self.LogicalXVector[0, i], self.LogicalXVector[1, i])
+            LogicalSCircuit.compose(z_rotation, inplace=True)
+            LogicalHCircuit.compose(z_rotation, inplace=True)
+            LogicalHCircuit.compose(x_rotation, inplace=True)
+            LogicalHCircuit.compose(z_rotation, inplace=True)
+
+        # Self-dual CSS codes (X and Z stabilizers with the same supports) may instead have transversal, fault-tolerant H and S gates,
+        # which are used if they act on the code space exactly as the rotations, checked on the encoded |0> and |+> states
+        x_rows = symplectic[self.x_stabilizers, :self.n]
+        z_rows = symplectic[self.z_stabilizers, self.n:]
+        is_self_dual = self.is_css and gf2.rank(x_rows) == gf2.rank(z_rows) == gf2.rank(np.concatenate([x_rows, z_rows]))
+
+        encoded_zero = QuantumCircuit(self.n)
+        encoded_zero.append(encoding_circuit, range(self.n))
+        encoded_plus = encoded_zero.compose(LogicalHCircuit)
+
+        def acts_as(candidate, reference):
+            return all(
+                StabilizerState(state.compose(candidate)).equiv(StabilizerState(state.compose(reference)))
+                for state in [encoded_zero, encoded_plus]
+            )
+
+        if is_self_dual and self.k == 1:
+            candidate = QuantumCircuit(self.n)
+            candidate.h(range(self.n))
+            if acts_as(candidate, LogicalHCircuit):
+                LogicalHCircuit = candidate
+
+            # Depending on the weight of the logical operators, transversal S or Sdg implements the logical S
+            for gate_name in ["s", "sdg"]:
+                candidate = QuantumCircuit(self.n)
+                getattr(candidate, gate_name)(range(self.n))
+                if acts_as(candidate, LogicalSCircuit):
+                    LogicalSCircuit = candidate
+                    break
+
+        self.LogicalHGate = LogicalHCircuit.to_gate(label="$H_L$")
+        self.LogicalSGate = LogicalSCircuit.to_gate(label="$S_L$")
+
+        return {
+            "G": self.G,
+            "LogicalXVector": self.LogicalXVector,
+            "LogicalZVector": self.LogicalZVector,
+            "LogicalXGate": self.LogicalXGate,
+            "LogicalZGate": self.LogicalZGate,
+            "LogicalYGate": self.LogicalYGate,
+            "LogicalHGate": self.LogicalHGate,
+            "LogicalSGate": self.LogicalSGate,
+            "TransversalCXGate": self.TransversalCXGate,
+            "encoding_gate": self.encoding_gate,
+        }
+
+    # Records that the top-level instructions appended since start belong to the given phase
+    # Instructions emitted inside control flow scopes are attributed to the phase of the enclosing control flow operation
+    def _record_phase(self, phase, start):
+        if len(self.data) > start:
+            self.phase_spans.append((phase, start, len(self.data)))
+
     # Encodes logical qubits for a given number of iterations
     def encode(self, *qubits, max_iterations=1, initial_states=None):
         """
         Prepare logical qubit(s) in the specified initial state
         """
+        start = len(self.data)
+
         if self.encoding_gate is None:
             raise RuntimeError("LogicalCircuit code has not been properly constructed (missing encoding gate)")
 
@@ -333,10 +476,8 @@ class LogicalCircuit(QuantumCircuit):
             # Initial encoding
             super().append(self.encoding_gate, self.logical_qregs[q])
 
-            # CNOT from physical qubits to ancilla(e)
-            super().cx(self.logical_qregs[q][1], self.ancilla_qregs[q][0])
-            super().cx(self.logical_qregs[q][3], self.ancilla_qregs[q][0])
-            super().cx(self.logical_qregs[q][5], self.ancilla_qregs[q][0])
+            # Logical Z parity onto the ancilla, which is 1 if the encoding produced a logical error
+            self._append_encoding_check(q)
 
             # Measure ancilla(e)
             # super().measure(self.ancilla_qregs[q][0], self.enc_verif_cregs[q][0])
@@ -350,10 +491,8 @@ class LogicalCircuit(QuantumCircuit):
                     # Initial encoding
                     super().append(self.encoding_gate, self.logical_qregs[q])
 
-                    # CNOT from (Z1 Z3 Z5) to ancilla
-                    super().cx(self.logical_qregs[q][1], self.ancilla_qregs[q][0])
-                    super().cx(self.logical_qregs[q][3], self.ancilla_qregs[q][0])
-                    super().cx(self.logical_qregs[q][5], self.ancilla_qregs[q][0])
+                    # Logical Z parity onto the ancilla
+                    self._append_encoding_check(q)
 
                     # Measure ancilla
                     # super().measure(self.ancilla_qregs[q][0], self.enc_verif_cregs[q][0])
@@ -368,59 +507,137 @@ class LogicalCircuit(QuantumCircuit):
             elif init_state != 0:
                 raise ValueError("Initial state should be either 0 or 1 (arbitrary statevectors not yet supported)!")
 
+        self._record_phase("encode", start)
+
         return True
 
+    # Couples the logical Z operator of a logical qubit (the representative used by measure) to its first ancilla, whose measurement verifies the encoding
+    # Z-type operators (e.g. Z1 Z3 Z5 of the Steane code) are measured with CNOTs onto the ancilla, and others with controlled Paulis from an ancilla in |+>
+    def _append_encoding_check(self, q):
+        x_part, z_part = self.LogicalZVector[0][0], self.LogicalZVector[1][0]
+        ancilla = self.ancilla_qregs[q][0]
+
+        if not x_part.any():
+            for x in np.flatnonzero(z_part):
+                super().cx(self.logical_qregs[q][int(x)], ancilla)
+            return
+
+        super().h(ancilla)
+        for x in np.flatnonzero(x_part | z_part):
+            pauli = "Y" if x_part[x] and z_part[x] else ("X" if x_part[x] else "Z")
+            super().append(controlled_paulis[pauli], [ancilla, self.logical_qregs[q][int(x)]], copy=False)
+        super().h(ancilla)
+
     # Reset all ancillas associated with specified logical qubits
     def reset_ancillas(self, logical_qubit_indices=None):
         if logical_qubit_indices is None or len(logical_qubit_indices) == 0:
             logical_qubit_indices = list(range(self.n_logical_qubits))
 
-        for q in logical_qubit_indices:
-            self.reset(self.ancilla_qregs[q])
+        for ancilla_qreg in self._ancilla_blocks(logical_qubit_indices):
+            self.reset(ancilla_qreg)
 
-    def steane_flagged_circuit1(self, logical_qubit_indices):
+    # Distinct ancilla blocks used by the specified logical qubits
+    def _ancilla_blocks(self, logical_qubit_indices):
+        blocks = []
         for q in logical_qubit_indices:
-            super().barrier()
-            super().h(self.ancilla_qregs[q][0])
-            super().cx(self.ancilla_qregs[q][0], self.logical_qregs[q][3])
-            super().cx(self.logical_qregs[q][2], self.ancilla_qregs[q][2])
-            super().cx(self.logical_qregs[q][5], self.ancilla_qregs[q][1])
-            super().cx(self.ancilla_qregs[q][0], self.ancilla_qregs[q][1])
-            super().cx(self.ancilla_qregs[q][0], self.logical_qregs[q][0])
-            super().cx(self.logical_qregs[q][3], self.ancilla_qregs[q][2])
-            super().cx(self.logical_qregs[q][4], self.ancilla_qregs[q][1])
-            super().cx(self.ancilla_qregs[q][0], self.logical_qregs[q][1])
-            super().cx(self.logical_qregs[q][6], self.ancilla_qregs[q][2])
-            super().cx(self.logical_qregs[q][2], self.ancilla_qregs[q][1])
-            super().cx(self.ancilla_qregs[q][0], self.ancilla_qregs[q][2])
-            super().cx(self.ancilla_qregs[q][0], self.logical_qregs[q][2])
-            super().cx(self.logical_qregs[q][5], self.ancilla_qregs[q][2])
-            super().cx(self.logical_qregs[q][1], self.ancilla_qregs[q][1])
-            super().h(self.ancilla_qregs[q][0])
-            super().barrier()
-
-    def steane_flagged_circuit2(self, logical_qubit_indices):
+            if not any(self.ancilla_qregs[q] is block for block in blocks):
+                blocks.append(self.ancilla_qregs[q])
+        return blocks
+
+    # Splits logical qubits into waves in which no two logical qubits share an ancilla block, so that each wave can be extracted in parallel
+    # Without a shared ancilla pool all logical qubits form a single wave
+    def _ancilla_waves(self, logical_qubit_indices):
+        waves = []
         for q in logical_qubit_indices:
-            super().barrier()
-            super().h(self.ancilla_qregs[q][1])
-            super().h(self.ancilla_qregs[q][2])
-            super().cx(self.logical_qregs[q][3], self.ancilla_qregs[q][0])
-            super().cx(self.ancilla_qregs[q][2], self.logical_qregs[q][2])
-            super().cx(self.ancilla_qregs[q][1], self.logical_qregs[q][5])
-            super().cx(self.ancilla_qregs[q][1], self.ancilla_qregs[q][0])
-            super().cx(self.logical_qregs[q][0], self.ancilla_qregs[q][0])
-            super().cx(self.ancilla_qregs[q][2], self.logical_qregs[q][3])
-            super().cx(self.ancilla_qregs[q][1], self.logical_qregs[q][4])
-            super().cx(self.logical_qregs[q][1], self.ancilla_qregs[q][0])
-            super().cx(self.ancilla_qregs[q][2], self.logical_qregs[q][6])
-            super().cx(self.ancilla_qregs[q][1], self.logical_qregs[q][2])
-            super().cx(self.ancilla_qregs[q][2], self.ancilla_qregs[q][0])
-            super().cx(self.logical_qregs[q][2], self.ancilla_qregs[q][0])
-            super().cx(self.ancilla_qregs[q][2], self.logical_qregs[q][5])
-            super().cx(self.ancilla_qregs[q][1], self.logical_qregs[q][1])
-            super().h(self.ancilla_qregs[q][1])
-            super().h(self.ancilla_qregs[q][2])
-            super().barrier()
+            for wave in waves:
+                if all(self.ancilla_qregs[p] is not self.ancilla_qregs[q] for p in wave):
+                    wave.append(q)
+                    break
+            else:
+                waves.append([q])
+        return waves
+
+    # Builds a syndrome extraction circuit acting on the physical qubits (0, ..., n-1) and ancillas (n, ...) of one logical qubit
+    #   - flag_round=0 or flag_round=1 gives the synthesized flagged circuit of the round (see FlagSynthesis), if the code has one
+    #   - otherwise the specified stabilizers are measured with native controlled Paulis (cx, cy, cz), one ancilla per stabilizer
+    def syndrome_extraction_circuit(self, stabilizer_indices=None, flag_round=None):
+        if stabilizer_indices is None or len(stabilizer_indices) == 0:
+            stabilizer_indices = list(range(self.n_stabilizers))
+
+        schedule = self.flag_schedules[flag_round] if flag_round is not None else None
+        if schedule is None and len(stabilizer_indices) > self.n_ancilla_qubits:
+            raise ValueError(f"Cannot measure {len(stabilizer_indices)} stabilizers with {self.n_ancilla_qubits} ancilla qubits")
+
+        circuit = QuantumCircuit(self.n_physical_qubits + self.n_ancilla_qubits)
+        d = list(range(self.n_physical_qubits))
+        a = list(range(self.n_physical_qubits, self.n_physical_qubits + self.n_ancilla_qubits))
+
+        if schedule is not None:
+            for name, qubits in schedule["operations"]:
+                circuit.append(schedule_gates[name], qubits, copy=False)
+        else:
+            for s, stabilizer_index in enumerate(stabilizer_indices):
+                stabilizer = self.stabilizer_tableau[stabilizer_index]
+                circuit.h(a[s])
+                for p in range(self.n_physical_qubits):
+                    if stabilizer[p] != 'I':
+                        circuit.append(controlled_paulis[stabilizer[p]], [a[s], d[p]], copy=False)
+                circuit.h(a[s])
+        return circuit
+
+    """
+        Precompiled syndrome extraction circuit for one or more logical qubits, built once per code and shared by all circuits through the code registry.
+        The layers of the extraction circuit are interleaved across the blocks, so that the extraction of every block runs in parallel.
+        Parameters:
+            - stabilizer_indices: Stabilizers to measure (see syndrome_extraction_circuit), ignored if the flagged round has a synthesized circuit
+            - flag_round: 0 or 1 for the flagged rounds, otherwise None
+            - n_blocks: Number of logical qubits the template acts on
+        Returns:
+            - template: QuantumCircuit on n_blocks consecutive blocks of physical qubits and ancillas (see _block_qubits), which must not be modified
+    """
+    def extraction_template(self, stabilizer_indices=None, flag_round=None, n_blocks=1):
+        if stabilizer_indices is None or len(stabilizer_indices) == 0:
+            stabilizer_indices = list(range(self.n_stabilizers))
+
+        measured = "-".join(str(s) for s in stabilizer_indices)
+        if flag_round is not None and self.flag_schedules[flag_round] is not None:
+            measured = f"flag{flag_round}_{measured}"
+
+        def build_template():
+            circuit = self.syndrome_extraction_circuit(stabilizer_indices, flag_round=flag_round)
+            width = circuit.num_qubits
+            template = QuantumCircuit(n_blocks*width)
+            for layer in asap_layers(circuit):
+                for b in range(n_blocks):
+                    for operation, qargs, _ in layer:
+                        template._append(CircuitInstruction(operation, [template.qubits[b*width + i] for i in qargs]))
+
+            return template
+
+        return code_registry.get((self.n, self.k, self.d), self.stabilizer_tableau, f"extraction_{measured}_x{n_blocks}", build_template)
+
+    # Physical and ancilla qubits of the specified logical qubits, in the qubit order of syndrome_extraction_circuit for each block
+    def _block_qubits(self, logical_qubit_indices):
+        return [self.logical_qregs[q][:] + self.ancilla_qregs[q][:] for q in logical_qubit_indices]
+
+    # Composes the precompiled extraction template of the specified stabilizers onto the physical qubits and ancillas of one or more logical qubits
+    def _compose_extraction_circuit(self, logical_qubit_indices, stabilizer_indices=None, flag_round=None):
+        if not hasattr(logical_qubit_indices, "__iter__"):
+            logical_qubit_indices = [logical_qubit_indices]
+
+        template = self.extraction_template(stabilizer_indices, flag_round=flag_round, n_blocks=len(logical_qubit_indices))
+        qubits = [qubit for qubits in self._block_qubits(logical_qubit_indices) for qubit in qubits]
+        self.compose(template, qubits=qubits, inplace=True, copy=False)
+
+    # Applies the extraction circuit of a flagged round (or of a batch of its stabilizers) to all specified logical qubits at once, with barriers only on the qubits involved
+    def flagged_circuit(self, flag_round, logical_qubit_indices, stabilizer_indices=None):
+        if stabilizer_indices is None:
+            stabilizer_indices = [self.flagged_stabilizers_1, self.flagged_stabilizers_2][flag_round]
+        involved_qubits = [qubit for qubits in self._block_qubits(logical_qubit_indices) for qubit in qubits]
+
+        super().barrier(*involved_qubits)
+        self._compose_extraction_circuit(logical_qubit_indices, stabilizer_indices=stabilizer_indices, flag_round=flag_round)
+        super().barrier(*involved_qubits)
 
     # Measure specified specifiers to the circuit as controlled Pauli operators
     def measure_stabilizers(self, logical_qubit_indices=None, stabilizer_indices=None):
@@ -430,111 +647,213 @@ class LogicalCircuit(QuantumCircuit):
         if stabilizer_indices is None or len(logical_qubit_indices) == 0:
             stabilizer_indices = list(range(self.n_stabilizers))
 
-        for q in logical_qubit_indices:
-            for s, stabilizer_index in enumerate(stabilizer_indices):
+        self._compose_extraction_circuit(logical_qubit_indices, stabilizer_indices=stabilizer_indices)
 
-                stabilizer = self.stabilizer_tableau[stabilizer_index]
-                super().h(self.ancilla_qregs[q][s])
-                for p in range(self.n_physical_qubits):
-                    stabilizer_pauli = Pauli(stabilizer[p])
-                    if stabilizer[p] != 'I':
-                        CPauliInstruction = stabilizer_pauli.to_instruction().control(1)
-                        super().append(CPauliInstruction, [self.ancilla_qregs[q][s], self.logical_qregs[q][p]])
-                super().h(self.ancilla_qregs[q][s])
 
+    # Stabilizers of a round as (extracted stabilizers, measured stabilizer of each ancilla) batches which fit on the ancillas of a logical qubit
+    # A round with a synthesized flagged circuit is a single batch, while other rounds (e.g. the unflagged rounds of the Shor code,
+    # which has more Z-type stabilizers than ancillas) are measured a batch at a time, resetting the ancillas in between
+    def _extraction_batches(self, stabilizer_indices, flag_round=None):
+        if flag_round is not None and self.flag_schedules[flag_round] is not None:
+            return [(stabilizer_indices, self.flagged_measured_stabilizers[flag_round])]
+
+        batches = [list(stabilizer_indices[i:i + self.n_ancilla_qubits]) for i in range(0, len(stabilizer_indices), self.n_ancilla_qubits)]
+        return [(batch, batch) for batch in batches]
 
     # Measure flagged or unflagged syndrome differences for specified logical qubits and stabilizers
-    def measure_syndrome_diff(self, logical_qubit_indices=None, stabilizer_indices=None, flagged=False, steane_flag_1=False, steane_flag_2=False):
+    #   - flag_round=0 or flag_round=1 measures the stabilizers of the flagged round, with its synthesized flagged circuit if the code has one
+    def measure_syndrome_diff(self, logical_qubit_indices=None, stabilizer_indices=None, flagged=False, flag_round=None):
         if logical_qubit_indices is None or len(logical_qubit_indices) == 0:
             logical_qubit_indices = list(range(self.n_logical_qubits))
 
         if stabilizer_indices is None or len(stabilizer_indices) == 0:
             stabilizer_indices = list(range(self.n_stabilizers))
 
-        for q in logical_qubit_indices:
-            syndrome_diff_creg = self.flagged_syndrome_diff_cregs[q] if flagged else self.unflagged_syndrome_diff_cregs[q]
+        # Apply the stabilizers of all logical qubits in parallel, one wave of logical qubits at a time if they share ancillas
+        for wave in self._ancilla_waves(logical_qubit_indices):
+            for batch, measured_stabilizers in self._extraction_batches(stabilizer_indices, flag_round=flag_round):
+                if flag_round is not None:
+                    self.flagged_circuit(flag_round, wave, stabilizer_indices=batch)
+                else:
+                    self.measure_stabilizers(logical_qubit_indices=wave, stabilizer_indices=batch)
 
-            # Apply and measure stabilizers for the desired syndrome
-            if steane_flag_1:
-                self.steane_flagged_circuit1(logical_qubit_indices)
-            elif steane_flag_2:
-                self.steane_flagged_circuit2(logical_qubit_indices)
-            else:
-                self.measure_stabilizers(logical_qubit_indices=[q], stabilizer_indices=stabilizer_indices)
-            for n in range(self.n_ancilla_qubits):
-                # super().measure(self.ancilla_qregs[q][n], self.curr_syndrome_cregs[q][n])
-                super().append(Measure(), [self.ancilla_qregs[q][n]], [self.curr_syndrome_cregs[q][n]], copy=False)
+                for q in wave:
+                    for n in range(len(measured_stabilizers)):
+                        # super().measure(self.ancilla_qregs[q][n], self.curr_syndrome_cregs[q][n])
+                        super().append(Measure(), [self.ancilla_qregs[q][n]], [self.curr_syndrome_cregs[q][n]], copy=False)
 
-            # Determine the syndrome difference
-            for n in range(len(stabilizer_indices)):
-                with self.if_test(self.cbit_xor([self.curr_syndrome_cregs[q][n], self.prev_syndrome_cregs[q][stabilizer_indices[n]]])) as _else:
-                    self.set_cbit(syndrome_diff_creg[stabilizer_indices[n]], 1)
-                with _else:
-                    self.set_cbit(syndrome_diff_creg[stabilizer_indices[n]], 0)
+                # Determine the syndrome difference
+                for q in wave:
+                    syndrome_diff_creg = self.flagged_syndrome_diff_cregs[q] if flagged else self.unflagged_syndrome_diff_cregs[q]
+                    for n in range(len(measured_stabilizers)):
+                        self.set_cbit(syndrome_diff_creg[measured_stabilizers[n]], self.cbit_xor([self.curr_syndrome_cregs[q][n], self.prev_syndrome_cregs[q][measured_stabilizers[n]]]))
 
-        self.reset_ancillas(logical_qubit_indices=logical_qubit_indices)
+                self.reset_ancillas(logical_qubit_indices=wave)
 
     # @TODO - allow configuration of QEC cycling
     def configure_qec_cycle(self, **config):
         raise NotImplementedError("QEC cycle configuration has not yet been implemented.")
 
-    def perform_qec_cycle(self, logical_qubit_indices=None):
-        #Use hardcoded flagged circuits for steane code
-        use_steane_flagged_circuits = True if (self.n, self.k, self.d) == (7,1,3) else False
-
+    """
+        Performs a QEC cycle on the specified logical qubits, which are scheduled in parallel:
+        every round is emitted for all logical qubits at once, layer by layer, and barriers only act on the qubits of the round,
+        so that the depth of a cycle does not grow with the number of logical qubits.
+        Parameters:
+            - logical_qubit_indices: Logical qubits to correct, defaulting to all
+            - durations: Instruction durations used for the returned schedule, as in Scheduling.default_durations
+            - schedule: If false, the schedule is not computed, which saves time when emitting many cycles
+        Returns:
+            - schedule: dict with the depth and duration of the critical path of the cycle (taking the longest branch of every conditional round), or None
+    """
+    def perform_qec_cycle(self, logical_qubit_indices=None, durations=None, schedule=True):
         if logical_qubit_indices is None or len(logical_qubit_indices) == 0:
             logical_qubit_indices = list(range(self.n_logical_qubits))
 
-        for q in logical_qubit_indices:
-            super().reset(self.ancilla_qregs[q])
+        start = len(self.data)
+
+        if self.offline_decoding:
+            self.perform_offline_qec_cycle(logical_qubit_indices)
+        else:
+            for ancilla_qreg in self._ancilla_blocks(logical_qubit_indices):
+                super().reset(ancilla_qreg)
 
             # Perform first flagged syndrome measurements
-            self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.flagged_stabilizers_1, flagged=True, steane_flag_1=use_steane_flagged_circuits)
+            self.measure_syndrome_diff(logical_qubit_indices=logical_qubit_indices, stabilizer_indices=self.flagged_stabilizers_1, flagged=True, flag_round=0)
 
             # If no change in syndrome, perform second flagged syndrome measurement
-            with self.if_test(expr.equal(self.flagged_syndrome_diff_cregs[q], 0)):
-                self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.flagged_stabilizers_2, flagged=True, steane_flag_2=use_steane_flagged_circuits)
+            # The conditional rounds of different logical qubits act on disjoint qubits and clbits, and therefore also run in parallel
+            for q in logical_qubit_indices:
+                with self.if_test(expr.equal(self.flagged_syndrome_diff_cregs[q], 0)):
+                    self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.flagged_stabilizers_2, flagged=True, flag_round=1)
+
+            self._record_phase("flagged_cycle", start)
+            unflagged_start = len(self.data)
 
             # If change in syndrome, perform unflagged syndrome measurement, decode, and correct
-            with self.if_test(expr.not_equal(self.flagged_syndrome_diff_cregs[q], 0)):
-                self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.x_stabilizers, flagged=False)
-                self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.z_stabilizers, flagged=False)
-
-                self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.x_stabilizers, with_flagged=False)
-                self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.z_stabilizers, with_flagged=False)
-                self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.x_stabilizers, with_flagged=True)
-                self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.z_stabilizers, with_flagged=True)
-
-                # Update previous syndrome
-                for n in range(self.n_stabilizers):
-                    with self.if_test(expr.lift(self.unflagged_syndrome_diff_cregs[q][n])):
-                        self.cbit_not(self.prev_syndrome_cregs[q][n])
-
-    # @TODO - determine appropriate syndrome decoding mappings dynamically
-    def apply_decoding(self, logical_qubit_indices, stabilizer_indices, with_flagged):
+            for q in logical_qubit_indices:
+                with self.if_test(expr.not_equal(self.flagged_syndrome_diff_cregs[q], 0)):
+                    self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.x_stabilizers, flagged=False)
+                    self.measure_syndrome_diff(logical_qubit_indices=[q], stabilizer_indices=self.z_stabilizers, flagged=False)
+
+                    self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.x_stabilizers, with_flagged=False, pf_ind=0)
+                    self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.z_stabilizers, with_flagged=False, pf_ind=1)
+                    self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.x_stabilizers, with_flagged=True, pf_ind=0)
+                    self.apply_decoding(logical_qubit_indices=[q], stabilizer_indices=self.z_stabilizers, with_flagged=True, pf_ind=1)
+
+                    # Update previous syndrome
+                    for n in range(self.n_stabilizers):
+                        self.cbit_not(self.prev_syndrome_cregs[q][n], condition=self.unflagged_syndrome_diff_cregs[q][n])
+
+            self._record_phase("unflagged_cycle", unflagged_start)
+
+        if not schedule:
+            return None
+
+        depth, duration = schedule_instructions(self.data[start:], durations=durations)
+        return {"depth": depth, "duration": duration}
+
+    """
+        Performs a number of QEC cycles on the specified logical qubits.
+        By default a single cycle is emitted as the body of a for loop, so that the size of the circuit and the cost of building and
+        transpiling it do not grow with the number of rounds. The classical state of the protocol (previous syndromes and Pauli frames)
+        lives in the same registers in every iteration, so the loop behaves exactly like the unrolled cycles.
+        Offline decoding measures every round into fresh registers and is therefore always unrolled.
+        Parameters:
+            - rounds: Number of QEC cycles
+            - logical_qubit_indices: Logical qubits to correct, defaulting to all
+            - loop: If false, the cycles are unrolled, e.g. for backends which do not support for loops
+            - durations: Instruction durations used for the returned schedule, as in Scheduling.default_durations
+            - schedule: If false, the schedule is not computed
+        Returns:
+            - schedule: dict with the depth and duration of the critical path of all cycles, or None
+    """
+    def perform_qec_cycles(self, rounds, logical_qubit_indices=None, loop=True, durations=None, schedule=True):
+        if rounds < 0:
+            raise ValueError(f"Number of QEC rounds must be non-negative, got {rounds}")
+
+        start = len(self.data)
+
+        if not loop or self.offline_decoding or rounds < 2:
+            for _ in range(rounds):
+                self.perform_qec_cycle(logical_qubit_indices, schedule=False)
+        else:
+            # Phases recorded inside the loop body are not top-level instructions, so the loop is recorded as a whole
+            with self.for_loop(range(rounds)):
+                self.perform_qec_cycle(logical_qubit_indices, schedule=False)
+            self._record_phase("qec_cycles", start)
+
+        if not schedule:
+            return None
+
+        depth, duration = schedule_instructions(self.data[start:], durations=durations)
+        return {"depth": depth, "duration": duration}
+
+    # Measures a syndrome extraction round of all specified logical qubits in parallel into fresh classical registers, without any classical processing
+    def measure_syndrome_offline(self, logical_qubit_indices, round_name, stabilizer_indices, flag_round=None):
+        if flag_round is not None:
+            measured_stabilizers = self.flagged_measured_stabilizers[flag_round]
+        else:
+            measured_stabilizers = stabilizer_indices
+
+        syndrome_cregs = {}
         for q in logical_qubit_indices:
-            syn_diff = [self.unflagged_syndrome_diff_cregs[q][x] for x in stabilizer_indices]
-            # Determines index of pauli frame to be modified
+            cycle = len(self.offline_qec_records[q])
+            syndrome_cregs[q] = ClassicalRegister(len(measured_stabilizers), name=f"c{round_name}{q}_{cycle}")
+            super().add_register(syndrome_cregs[q])
+
+        for wave in self._ancilla_waves(logical_qubit_indices):
+            offset = 0
+            for batch, batch_measured in self._extraction_batches(stabilizer_indices, flag_round=flag_round):
+                self._compose_extraction_circuit(wave, stabilizer_indices=batch, flag_round=flag_round)
+                for q in wave:
+                    for n in range(len(batch_measured)):
+                        super().append(Measure(), [self.ancilla_qregs[q][n]], [syndrome_cregs[q][offset + n]], copy=False)
+                    super().reset(self.ancilla_qregs[q])
+                offset += len(batch_measured)
+
+        return {q: (measured_stabilizers, [self.find_bit(clbit).index for clbit in syndrome_cregs[q]]) for q in logical_qubit_indices}
+
+    # Non-adaptive QEC cycle: every round is always performed and the adaptive protocol is replayed by the offline decoder
+    def perform_offline_qec_cycle(self, logical_qubit_indices):
+        start = len(self.data)
+        for ancilla_qreg in self._ancilla_blocks(logical_qubit_indices):
+            super().reset(ancilla_qreg)
+
+        rounds = {
+            "flagged_1": self.measure_syndrome_offline(logical_qubit_indices, "flagged_1_", self.flagged_stabilizers_1, flag_round=0),
+            "flagged_2": self.measure_syndrome_offline(logical_qubit_indices, "flagged_2_", self.flagged_stabilizers_2, flag_round=1),
+        }
+        self._record_phase("flagged_cycle", start)
+
+        unflagged_start = len(self.data)
+        rounds["unflagged_x"] = self.measure_syndrome_offline(logical_qubit_indices, "unflagged_x_", self.x_stabilizers)
+        rounds["unflagged_z"] = self.measure_syndrome_offline(logical_qubit_indices, "unflagged_z_", self.z_stabilizers)
+        self._record_phase("unflagged_cycle", unflagged_start)
+
+        for q in logical_qubit_indices:
+            self.offline_qec_records[q].append({round_name: measured[q] for round_name, measured in rounds.items()})
+
+    # Applies the lookup table decoder by flipping the Pauli frame with a single classical store per logical qubit
+    #   - pf_ind: Pauli frame bit to update, 0 for the x_stabilizers and 1 for the z_stabilizers, which must be given for codes whose
+    #             stabilizers are not all X-type or Z-type (e.g. the [[5,1,3]] code); by default it is guessed from the first stabilizer
+    def apply_decoding(self, logical_qubit_indices, stabilizer_indices, with_flagged, pf_ind=None):
+        if pf_ind is None:
             pf_ind = 0 if 'X' in self.stabilizer_tableau[stabilizer_indices[0]] else 1
 
-            # Decoding sequence with flagged syndrome
-            if with_flagged:
-                flag_diff = [self.flagged_syndrome_diff_cregs[q][x] for x in stabilizer_indices]
-                with super().if_test(expr.bit_and(self.cbit_and(flag_diff, [1, 0, 0]), self.cbit_and(syn_diff, [0, 1, 0]))):
-                    self.cbit_not(self.pauli_frame_cregs[q][pf_ind])
-                with super().if_test(expr.bit_and(self.cbit_and(flag_diff, [1, 0, 0]), self.cbit_and(syn_diff, [0, 0, 1]))):
-                    self.cbit_not(self.pauli_frame_cregs[q][pf_ind])
-                with super().if_test(expr.bit_and(self.cbit_and(flag_diff, [0, 1, 1]), self.cbit_and(syn_diff, [0, 0, 1]))):
-                    self.cbit_not(self.pauli_frame_cregs[q][pf_ind])
-
-            # Unflagged decoding sequence
-            else:
-                with super().if_test(self.cbit_and(syn_diff, [0, 1, 0])):
-                    self.cbit_not(self.pauli_frame_cregs[q][pf_ind])
-                with super().if_test(self.cbit_and(syn_diff, [0, 1, 1])):
-                    self.cbit_not(self.pauli_frame_cregs[q][pf_ind])
-                with super().if_test(self.cbit_and(syn_diff, [0, 0, 1])):
-                    self.cbit_not(self.pauli_frame_cregs[q][pf_ind])
+        for q in logical_qubit_indices:
+            syn_diff = [self.unflagged_syndrome_diff_cregs[q][x] for x in stabilizer_indices]
+            flag_diff = [self.flagged_syndrome_diff_cregs[q][x] for x in stabilizer_indices]
+
+            # The decoder provides minimized (flag pattern, syndrome pattern) conditions under which the frame is flipped
+            condition = None
+            for flag_pattern, syndrome_pattern in self.decoder.decoding_conditions(stabilizer_indices, pf_ind, with_flagged=with_flagged):
+                term = self.cbit_and(syn_diff, syndrome_pattern)
+                if flag_pattern is not None:
+                    term = expr.bit_and(self.cbit_and(flag_diff, flag_pattern), term)
+                condition = term if condition is None else expr.bit_or(condition, term)
+
+            if condition is not None:
+                self.cbit_not(self.pauli_frame_cregs[q][pf_ind], condition=condition)
 
     def measure(self, logical_qubit_indices, cbit_indices, with_error_correction=True):
         if not hasattr(logical_qubit_indices, "__iter__"):
@@ -546,59 +865,85 @@ class LogicalCircuit(QuantumCircuit):
         if len(logical_qubit_indices) != len(cbit_indices):
             raise ValueError("Number of qubits should equal number of classical bits")
 
+        start = len(self.data)
+
         for q, c in zip(logical_qubit_indices, cbit_indices):
             # Measurement of state
             for n in range(self.n_physical_qubits):
                 # super().measure(self.logical_qregs[q][n], self.final_measurement_cregs[q][n])
                 super().append(Measure(), [self.logical_qregs[q][n]], [self.final_measurement_cregs[q][n]], copy=False)
 
-            # @TODO - use LogicalXVector instead
-            with super().if_test(self.cbit_xor([self.final_measurement_cregs[q][x] for x in [4,5,6]])):
-                self.set_cbit(self.output_creg[c], 1)
+            # Logical output and final correction are computed after sampling
+            if self.offline_decoding:
+                self.offline_measure_records.append((q, c, with_error_correction))
+                continue
+
+            # Logical Z parity, using the same representative of the logical operator as the decoder
+            logical_z_support = [x for x in range(self.n_physical_qubits) if self.LogicalZVector[1][0][x] == 1]
+            self.set_cbit(self.output_creg[c], self.cbit_xor([self.final_measurement_cregs[q][x] for x in logical_z_support]))
 
             if with_error_correction:
-                # Final syndrome
-                for n in range(self.n_ancilla_qubits):
-                    stabilizer = self.stabilizer_tableau[self.z_stabilizers[n]]
-                    s_indices = []
-                    for i in range(len(stabilizer)):
-                        if stabilizer[i] == 'Z':
-                            s_indices.append(i)
-
-                    with super().if_test(self.cbit_xor([self.final_measurement_cregs[q][z] for z in s_indices])):
-                        self.set_cbit(self.curr_syndrome_cregs[q][n], 1)
-
-                # Final syndrome diff
-                for n in range(self.n_ancilla_qubits):
-                    with super().if_test(self.cbit_xor([self.curr_syndrome_cregs[q][n], self.prev_syndrome_cregs[q][self.z_stabilizers[n]]])) as _else:
-                        self.set_cbit(self.unflagged_syndrome_diff_cregs[q][self.z_stabilizers[n]], 1)
-                    with _else:
-                        self.set_cbit(self.unflagged_syndrome_diff_cregs[q][self.z_stabilizers[n]], 0)
-
-                # Final correction
-                self.apply_decoding([q], self.z_stabilizers, with_flagged=False)
-                with super().if_test(expr.lift(self.pauli_frame_cregs[q][1])):
-                    self.cbit_not(self.output_creg[c])
+                # The final syndrome of the Z-type stabilizers can only be read off the measured data of CSS codes,
+                # otherwise (e.g. for the [[5,1,3]] code) only the Pauli frame of the QEC cycles is applied
+                if self.is_css:
+                    # Final syndrome diff
+                    for z in self.z_stabilizers:
+                        support = [x for x in range(self.n_physical_qubits) if self.stabilizer_tableau[z][x] == 'Z']
+                        self.set_cbit(self.unflagged_syndrome_diff_cregs[q][z], self.cbit_xor([self.final_measurement_cregs[q][x] for x in support] + [self.prev_syndrome_cregs[q][z]]))
+
+                    # Final correction
+                    self.apply_decoding([q], self.z_stabilizers, with_flagged=False, pf_ind=1)
+                self.cbit_not(self.output_creg[c], condition=self.pauli_frame_cregs[q][1])
+
+        self._record_phase("measure", start)
 
     def measure_all(self, with_error_correction=True):
         self.measure(range(self.n_logical_qubits), range(self.n_logical_qubits))
 
-    def get_logical_output_counts(self, outputs, logical_qubit_indices=None):
+    # Names of the classical registers from which the logical outputs are computed, e.g. for Experiments.benchmark_noise(registers=...)
+    # Offline decoding reads the raw syndrome and final measurement records, and hence needs every register
+    def logical_output_registers(self):
+        if self.offline_decoding:
+            return [creg.name for creg in self.cregs]
+
+        return [self.output_creg.name]
+
+    # Logical outputs of every shot as an (n_shots, n_logical_qubits) array, from shot memory (result.get_memory()) or an (n_shots, n_clbits) bit array
+    # If the outputs only cover some registers (e.g. benchmark_noise(registers=logical_output_registers())), registers names them,
+    # and their bits are taken to be those of the named registers in circuit order; offline decoding needs every register
+    def get_logical_outputs(self, outputs, registers=None):
+        names = [creg.name for creg in self.cregs]
+        if registers is not None:
+            registers = {creg if isinstance(creg, str) else creg.name for creg in registers}
+            if not registers.issubset(names):
+                raise ValueError(f"Unknown classical registers {sorted(registers - set(names))}; the circuit has registers {names}")
+            names = [name for name in names if name in registers]
+
+        if self.offline_decoding:
+            if len(names) != len(self.cregs):
+                raise ValueError("Offline decoding needs the outputs of every register, see logical_output_registers")
+            return decode_memory(self, outputs)
+
+        bits = memory_to_array(outputs)
+        if registers is None:
+            return bits[:, [self.find_bit(clbit).index for clbit in self.output_creg]]
+
+        if self.output_creg.name not in names:
+            raise ValueError(f"The outputs do not cover the output register '{self.output_creg.name}'")
+
+        # Column of the first bit of the output register among the bits of the covered registers
+        start = sum(len(creg) for creg in self.cregs[:self.cregs.index(self.output_creg)] if creg.name in names)
+        return bits[:, start:start + len(self.output_creg)]
+
+    # Counts logical outputs from shot memory (result.get_memory()), decoding all shots at once in offline mode
+    def get_logical_output_counts(self, outputs, logical_qubit_indices=None, registers=None):
         if logical_qubit_indices == None:
             logical_qubit_indices = range(self.n_logical_qubits)
 
-        counts = {}
-        for n in range(len(outputs)):
-            output = ''
-            for l in logical_qubit_indices:
-                output += outputs[n][self.n_logical_qubits-1-l]
-
-            if output not in counts:
-                counts[output] = 1
-            else:
-                counts[output] += 1
+        output_bits = self.get_logical_outputs(outputs, registers=registers)[:, list(logical_qubit_indices)]
 
-        return counts
+        # Logical qubit 0 is the leftmost character of the outputs
+        return EncodedCounts.from_bits(output_bits[:, ::-1]).to_dict()
 
     ######################################
     ##### Logical quantum operations #####
@@ -608,7 +953,7 @@ class LogicalCircuit(QuantumCircuit):
 
     # called when you do lqc.h() or self.h() inside lqc
     # if you do super().h
-    def h(self, *targets, method="LCU"):
+    def h(self, *targets):
         """
         Logical Hadamard gate
         """
@@ -616,16 +961,9 @@ class LogicalCircuit(QuantumCircuit):
         if len(targets) == 1 and hasattr(targets[0], "__iter__"):
             targets = targets[0]
 
-        if method == "LCU":
-            for t in targets:
-                super().append(self.LogicalHGate_LCU, [self.logical_op_qregs[t][0]] + self.logical_qregs[t][:])
-
-            # @TODO - perform resets after main operation is complete to allow for faster(?) parallel operation
-            # for t in targets:
-                # @TODO - determine whether extra reset is necessary at the end
-                # super().reset(self.logical_op_qregs[t])
-        else:
-            raise ValueError(f"'{method}' is not a valid method for the logical Hadamard gate")
+        # Transversal for self-dual CSS codes, otherwise built from rotations about the logical operators (see construct_code)
+        for t in targets:
+            super().append(self.LogicalHGate, self.logical_qregs[t])
 
     def x(self, *targets):
         """
@@ -668,10 +1006,9 @@ class LogicalCircuit(QuantumCircuit):
         if len(targets) == 1 and hasattr(targets[0], "__iter__"):
             targets = targets[0]
 
+        # Transversal for self-dual CSS codes where possible, otherwise a rotation about the logical Z operator (see construct_code)
         for t in targets:
-            super().s(self.logical_qregs[t][4])
-            super().s(self.logical_qregs[t][5])
-            super().s(self.logical_qregs[t][6])
+            super().append(self.LogicalSGate, self.logical_qregs[t])
 
     def cx(self, control, *_targets):
         """
@@ -683,9 +1020,19 @@ class LogicalCircuit(QuantumCircuit):
         else:
             targets = [_targets]
 
-        # @TODO - implement a better, more generalized CNOT gate
+        # CSS codes have a transversal CX, which acts pairwise on the physical qubits of the control and target blocks
+        if self.is_css:
+            for t in targets:
+                super().append(self.TransversalCXGate, self.logical_qregs[control][:] + self.logical_qregs[t][:], copy=False)
+            return
+
+        # @TODO - implement a better, more generalized CNOT gate for non-CSS codes
+        # Constructing the controlled gate is expensive, so it is only done once per circuit
+        if self._controlled_logical_x_gate is None:
+            self._controlled_logical_x_gate = self.LogicalXGate.control(self.n_physical_qubits)
+
         for t in targets:
-            super().append(self.LogicalXGate.control(7), self.logical_qregs[control][:] + self.logical_qregs[t][:])
+            super().append(self._controlled_logical_x_gate, self.logical_qregs[control][:] + self.logical_qregs[t][:], copy=False)
 
     def mcmt(self, controls, targets):
         """
@@ -698,6 +1045,12 @@ class LogicalCircuit(QuantumCircuit):
         if len(targets) == 1 and hasattr(targets[0], "__iter__"):
             targets = targets[0]
 
+        # A single control on a CSS code is a fan-out of transversal CX gates
+        if self.is_css and len(controls) == 1:
+            assert controls[0] not in targets, "Qubit(s) specified as both control and target"
+            self.cx(controls[0], *targets)
+            return
+
         control_qubits = [self.logical_qregs[c][:] for c in controls]
         target_qubits = [self.logical_qregs[t][:] for t in targets]
 
@@ -705,57 +1058,9 @@ class LogicalCircuit(QuantumCircuit):
 
         super().append(self.LogicalXGate.control(len(controls)), control_qubits + target_qubits)
 
-    # Input could be: 1. (CircuitInstruction(name="...", qargs="...", cargs="..."), qargs=None, cargs=None)
-    #                 2. (Instruction(name="..."), qargs=[..], cargs=[...])
-    def append(self, instruction, qargs=None, cargs=None, copy=True):
-        if isinstance(instruction, str):
-            operation = instruction
-        elif hasattr(instruction, "name"):
-            operation = instruction.name.lower()
-        else:
-            raise ValueError(f"Instruction could not be parsed: {instruction}")
-
-        # @TODO - copy.deepcopy fails for some instructions (such as IfElseOp), figure out a fix
-        if copy and not isinstance(instruction, bool):
-            try:
-                instruction = copy.deepcopy(instruction)
-            except:
-                pass
-                #print(f"WARNING: LogicalCircuit does not support append-by-copy for instruction '{operation}', ignoring")
-
-        if qargs is None:
-            if hasattr(instruction, "qubits"):
-                qargs = instruction.qubits
-                qubits = [qubit._index for qubit in instruction.qubits]
-        else:
-            if all([isinstance(qarg, int) for qarg in qargs]):
-                qubits = qargs
-            elif all([isinstance(qarg, Bit) for qarg in qargs]):
-                qubits = [qarg._index for qarg in qargs]
-            elif hasattr(instruction, "qubits"):
-                qubits = [qubit._index for qubit in instruction.qubits]
-            elif all([isinstance(qarg, QuantumRegister) for qarg in qargs]):
-                qubits = [qubit._index for qarg in qargs for qubit in qarg]
-            else:
-                raise ValueError(f"At least one of the following quantum arguments to operation '{operation}' are unrecognized: {qargs}")
-
-        if cargs is None:
-            if hasattr(instruction, "clbits"):
-                cargs = instruction.clbits
-                clbits = [clbit._index for clbit in instruction.clbits]
-        else:
-            if all([isinstance(carg, int) for carg in cargs]):
-                clbits = cargs
-            elif all([isinstance(carg, Bit) for carg in cargs]):
-                qubits = [carg._index for carg in cargs]
-            elif hasattr(instruction, "clbits"):
-                clbits = [clbit._index for clbit in instruction.clbits]
-            elif all([isinstance(carg, ClassicalRegister) for carg in cargs]):
-                clbits = [clbit._index for carg in cargs for qubit in carg]
-            else:
-                raise ValueError(f"At least one of the following classical arguments to operation '{operation}' are unrecognized: {cargs}")
-
-        match operation:
+    # Applies the logical counterpart of an operation to logical qubits and output bits given by index
+    def _apply_logical_operation(self, operation, qubits, clbits, with_error_correction=True):
+        match operation.name:
             case "h":
                 self.h(qubits)
             case "x":
@@ -767,25 +1072,45 @@ class LogicalCircuit(QuantumCircuit):
             case "s":
                 self.s(qubits)
             case "cx":
-                control_qubit = instruction.qubits[0]._index
-                target_qubit = instruction.qubits[1]._index
-                self.cx(control_qubit, target_qubit)
-            case "mcmt":
-                raise NotImplementedError(f"Physical operation 'MCMT' does not have physical gate conversion implemented!")
+                self.cx(qubits[0], qubits[1])
+            case "id":
+                pass
+            case "barrier":
+                super().barrier(*[qubit for q in qubits for qubit in self.logical_qregs[q]])
+            case "reset":
+                self.encode(*qubits)
             case "measure":
                 # If classical bits for measurement aren't specified, default to match logical qubit indices
-                if clbits is None:
-                    clbits = qubits
-                
-                # @TODO - decide best default behavior here (maybe we should ask during from_physical_circuit)
-                self.measure(qubits, clbits, with_error_correction=True)
+                self.measure(qubits, clbits if len(clbits) > 0 else qubits, with_error_correction=with_error_correction)
+            case "mcmt":
+                raise NotImplementedError(f"Physical operation 'MCMT' does not have physical gate conversion implemented!")
             case _:
-                # @TODO - identify a better way of providing these warnings
-                # print(f"WARNING: Physical operation '{operation.upper()}' does not have a logical counterpart implemented! Defaulting to physical operation.")
+                raise ValueError(f"Physical operation '{operation.name}' does not have a logical counterpart implemented")
+
+    # Input could be: 1. (CircuitInstruction(name="...", qargs="...", cargs="..."), qargs=None, cargs=None)
+    #                 2. (Instruction(name="..."), qargs=[..], cargs=[...])
+    # Integer qargs (and cargs) are logical qubit (and output bit) indices, to which the logical counterpart of the instruction is applied.
+    # Bits of this circuit address physical qubits directly, which is also how QuantumCircuit itself appends barriers, resets and control flow.
+    def append(self, instruction, qargs=None, cargs=None, copy=True):
+        if isinstance(instruction, CircuitInstruction):
+            operation = instruction.operation
+            logical_qargs = instruction.qubits if qargs is None else qargs
+            logical_cargs = instruction.clbits if cargs is None else cargs
+        elif hasattr(instruction, "name"):
+            operation = instruction
+            logical_qargs = [] if qargs is None else qargs
+            logical_cargs = [] if cargs is None else cargs
+        else:
+            raise ValueError(f"Instruction could not be parsed: {instruction}")
 
-                instruction = super().append(instruction, qargs, cargs, copy=copy)
+        if len(logical_qargs) > 0 and all(isinstance(qarg, (int, np.integer)) for qarg in logical_qargs):
+            if not all(isinstance(carg, (int, np.integer)) for carg in logical_cargs):
+                raise ValueError(f"Classical arguments of logical operation '{operation.name}' must be output bit indices: {logical_cargs}")
 
-        return instruction
+            self._apply_logical_operation(operation, [int(q) for q in logical_qargs], [int(c) for c in logical_cargs])
+            return None
+
+        return super().append(instruction, qargs, cargs, copy=copy)
 
     ###########################
     ##### Utility methods #####
@@ -798,30 +1123,33 @@ class LogicalCircuit(QuantumCircuit):
         if error_type == 'Z':
             super().z(self.logical_qregs[l_ind][p_ind])
 
-    # @TODO - find alternative to classical methods, possibly by implementing upstream
+    # Classical bits are written with purely classical Store instructions, so no quantum state is touched
 
-    # Set values of classical bits
+    # Set values of classical bits, where value is either a constant (0 or 1) or a classical expression
     def set_cbit(self, cbit, value):
-        if value == 0:
-            # super().measure(self.cbit_setter_qreg[0], cbit)
-            super().append(Measure(), [self.cbit_setter_qreg[0]], [cbit], copy=False)
+        if isinstance(value, (int, bool, np.integer)):
+            value = expr.lift(bool(value))
         else:
-            # super().measure(self.cbit_setter_qreg[1], cbit)
-            super().append(Measure(), [self.cbit_setter_qreg[1]], [cbit], copy=False)
+            value = expr.lift(value)
 
-    # Performs a NOT statement on a classical bit
-    def cbit_not(self, cbit):
-        with self.if_test(expr.lift(cbit)) as _else:
-            self.set_cbit(cbit, 0)
-        with _else:
-            self.set_cbit(cbit, 1)
+        super().append(Store(expr.lift(cbit), value), [], [], copy=False)
 
-    # Performs AND and NOT statements on multiple classical bits, e.g. (~c[0] & ~c[1] & c[2])
+    # Performs a NOT statement on a classical bit, optionally only when a classical condition holds (c ^= condition)
+    def cbit_not(self, cbit, condition=None):
+        if condition is None:
+            self.set_cbit(cbit, expr.bit_not(cbit))
+        else:
+            self.set_cbit(cbit, expr.bit_xor(cbit, condition))
+
+    # Performs AND and NOT statements on multiple classical bits, e.g. (~c[0] & ~c[1] & c[2]), where bits with value None are ignored
     def cbit_and(self, cbits, values):
-        result = expr.bit_not(cbits[0]) if values[0] == 0 else expr.lift(cbits[0])
-        for n in range(len(cbits)-1):
-            result = expr.bit_and(result, expr.bit_not(cbits[n+1])) if values[n+1] == 0 else expr.bit_and(result, cbits[n+1])
-        return result
+        result = None
+        for cbit, value in zip(cbits, values):
+            if value is None:
+                continue
+            term = expr.bit_not(cbit) if value == 0 else expr.lift(cbit)
+            result = term if result is None else expr.bit_and(result, term)
+        return expr.lift(True) if result is None else result
 
     # XOR multiple classical bits
     def cbit_xor(self, cbits):
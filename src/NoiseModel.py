@@ -1,10 +1,74 @@
+import copy
+import json
+import hashlib
+from collections import OrderedDict
+
 from qiskit_aer.noise import NoiseModel, depolarizing_error, thermal_relaxation_error, ReadoutError
 
 gates_1q = ["x", "y", "z", "h", "s", "t", "rx", "ry", "rz"]
 gates_2q = ["cx", "cy", "cz", "ch"]
 
-# General function for constructing a Qiskit NoiseModel
-def construct_noise_model(basis_gates, n_qubits=None, qubits=None, ignore_qubits=None, **noise_params):
+# Finished noise models, keyed by (basis_gates, noisy qubits, noise_params)
+_noise_model_cache = OrderedDict()
+max_cached_noise_models = 64
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    if isinstance(value, (list, tuple, range)):
+        return tuple(_freeze(v) for v in value)
+
+    return value
+
+"""
+    Noise model memoized by construct_noise_model. It is shared by all callers, and by the simulators cached for it, so it cannot be modified:
+    copy.deepcopy returns a modifiable NoiseModel with the same errors.
+"""
+class SharedNoiseModel(NoiseModel):
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Memoized noise models are shared and cannot be modified, use copy.deepcopy or construct_noise_model(..., use_cache=False) instead")
+
+    reset = add_basis_gates = add_all_qubit_quantum_error = add_quantum_error = add_all_qubit_readout_error = add_readout_error = _immutable
+
+    # Shared model with the errors of a finished noise model, which takes over its state (the add methods above cannot be used to build it)
+    @classmethod
+    def from_noise_model(cls, noise_model):
+        shared = cls.__new__(cls)
+        shared.__dict__.update(noise_model.__dict__)
+        return shared
+
+    def __deepcopy__(self, memo):
+        noise_model = NoiseModel.__new__(NoiseModel)
+        memo[id(self)] = noise_model
+        noise_model.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return noise_model
+
+# Registers an error on all qubits (or ordered qubit pairs) at once if qubit_args is None, and otherwise on each given qubit (pair)
+def _add_error(noise_model, error, instructions, qubit_args):
+    if qubit_args is None:
+        noise_model.add_all_qubit_quantum_error(error, instructions, warnings=False)
+    else:
+        for qubit_arg in qubit_args:
+            noise_model.add_quantum_error(error, instructions, qubit_arg, warnings=False)
+
+"""
+    General function for constructing a Qiskit NoiseModel.
+    Errors which act uniformly on every qubit (qubits and ignore_qubits not given) are registered once as all-qubit errors instead of once per qubit (pair),
+    each error is only constructed once and shared between all instructions and qubits, and finished models are memoized.
+    Parameters:
+        - basis_gates: Basis gates of the noise model
+        - n_qubits, qubits, ignore_qubits: Qubits which the errors act on
+        - use_cache: If true, an identical model built earlier is returned, as an immutable SharedNoiseModel
+        - noise_params: Error probabilities and times, e.g. depolarizing_error_1q or t1
+    Returns:
+        - noise_model: Qiskit Aer NoiseModel
+"""
+def construct_noise_model(basis_gates=None, n_qubits=None, qubits=None, ignore_qubits=None, use_cache=True, **noise_params):
+    # Errors are uniform across qubits unless the qubits are restricted explicitly
+    uniform = qubits is None and not ignore_qubits
+
     if qubits is None and n_qubits is None:
         qubits = [0]
         n_qubits = 1
@@ -16,31 +80,29 @@ def construct_noise_model(basis_gates, n_qubits=None, qubits=None, ignore_qubits
     ignore_qubits = set(ignore_qubits or [])
     used_qubits   = sorted(set(qubits) - ignore_qubits)
 
+    key = (_freeze(basis_gates), None if uniform else tuple(used_qubits), _freeze(noise_params))
+    if use_cache and key in _noise_model_cache:
+        _noise_model_cache.move_to_end(key)
+        return _noise_model_cache[key]
+
+    qubits_1q = None if uniform else [[q] for q in used_qubits]
+    qubits_2q = None if uniform else [[q1, q2] for q1 in used_qubits for q2 in used_qubits if q1 != q2]
+
     noise_model = NoiseModel(basis_gates=basis_gates) # @todo - check if basis gates are really being used
 
     # Depolarizing errors: Simulates decay into random mixed state
     for gate in ["x", "y", "z", "h"]:
         if f"depolarizing_error_{gate}" in noise_params and "depolarizing_error_1q" in noise_params:
-            depolarizing_error_gate = depolarizing_error(noise_params[f"depolarizing_error_{gate}"], 1)
-            for q in used_qubits:
-                noise_model.add_quantum_error(depolarizing_error_gate, [gate], [q], warnings=False)
+            _add_error(noise_model, depolarizing_error(noise_params[f"depolarizing_error_{gate}"], 1), [gate], qubits_1q)
 
         if f"depolarizing_error_c{gate}" in noise_params:
-            depolarizing_error_cgate = depolarizing_error(noise_params[f"depolarizing_error_c{gate}"], 2)
-            for q in used_qubits:
-                noise_model.add_quantum_error(depolarizing_error_cgate, [f"c{gate}"], [q], warnings=False)
+            _add_error(noise_model, depolarizing_error(noise_params[f"depolarizing_error_c{gate}"], 2), [f"c{gate}"], qubits_2q)
 
     if "depolarizing_error_1q" in noise_params:
-        depolarizing_error_1q = depolarizing_error(noise_params[f"depolarizing_error_1q"], 1)
-        for q in used_qubits:
-            noise_model.add_quantum_error(depolarizing_error_1q, gates_1q, [q], warnings=False)
+        _add_error(noise_model, depolarizing_error(noise_params[f"depolarizing_error_1q"], 1), gates_1q, qubits_1q)
 
     if "depolarizing_error_2q" in noise_params:
-        depolarizing_error_2q = depolarizing_error(noise_params[f"depolarizing_error_2q"], 2)
-        for q1 in used_qubits:
-            for q2 in used_qubits:
-                if q1 != q2:
-                    noise_model.add_quantum_error(depolarizing_error_2q, gates_2q, [q1, q2], warnings=False)
+        _add_error(noise_model, depolarizing_error(noise_params[f"depolarizing_error_2q"], 2), gates_2q, qubits_2q)
 
     # Readout errors: models errors in qubit measurement.
     if "readout_error_01" in noise_params:
@@ -48,8 +110,11 @@ def construct_noise_model(basis_gates, n_qubits=None, qubits=None, ignore_qubits
         p1given0 = noise_params["readout_error_1|1"]
 
         readout_error = ReadoutError([[1 - p1given0, p1given0], [p0given1, 1 - p0given1]])
-        for q in used_qubits:
-            noise_model.add_quantum_error(readout_error, [q], warnings=False)
+        if uniform:
+            noise_model.add_all_qubit_readout_error(readout_error, warnings=False)
+        else:
+            for q in used_qubits:
+                noise_model.add_readout_error(readout_error, [q], warnings=False)
 
     # Thermal relaxation error: Error from releasing energy and settling back to the ground state
     if "thermal_relaxation_error" in noise_params:
@@ -59,23 +124,15 @@ def construct_noise_model(basis_gates, n_qubits=None, qubits=None, ignore_qubits
             gate_time_1q = noise_params["gate_time_1q"]
             gate_time_2q = noise_params["gate_time_2q"]
 
-            thermal_relaxation_error = thermal_relaxation_error(T1, T2, gate_time_1q)
             thermal_relaxation_error_id = thermal_relaxation_error(T1, T2, 0)
             thermal_relaxation_error_1q = thermal_relaxation_error(T1, T2, gate_time_1q)
-            thermal_relaxation_error_2q = thermal_relaxation_error(T1, T2, gate_time_2q)
+            # Both qubits of a two-qubit gate relax for its duration; the error is the same for every pair, so it is tensored only once
+            thermal_relaxation_error_gate_2q = thermal_relaxation_error(T1, T2, gate_time_2q)
+            thermal_relaxation_error_2q = thermal_relaxation_error_gate_2q.tensor(thermal_relaxation_error_gate_2q)
 
-            for q in used_qubits:
-                noise_model.add_quantum_error(thermal_relaxation_error_id, ["id"], [q], warnings=False)
-
-            for gate in gates_1q:
-                for q in used_qubits:
-                    noise_model.add_quantum_error(thermal_relaxation_error, [gate], [q], warnings=False)
-
-            for gate in gates_2q:
-                for q1 in used_qubits:
-                    for q2 in used_qubits:
-                        if q1 != q2:
-                            noise_model.add_quantum_error(thermal_relaxation_error.tensor(thermal_relaxation_error), [gate], [q1, q2], warnings=False)
+            _add_error(noise_model, thermal_relaxation_error_id, ["id"], qubits_1q)
+            _add_error(noise_model, thermal_relaxation_error_1q, gates_1q, qubits_1q)
+            _add_error(noise_model, thermal_relaxation_error_2q, gates_2q, qubits_2q)
 
     # @TODO - implement gate-specific thermal relaxation erorrs
 
@@ -85,9 +142,7 @@ def construct_noise_model(basis_gates, n_qubits=None, qubits=None, ignore_qubits
 
     # Amplituded damping error: Simulates error due to energy dissipation (e.g. spontaneous emission, thermal equilibrium)
     if "amplitude_damping_error_1q" in noise_params:
-        amplitude_damping_error_1q = depolarizing_error(noise_params["amplitude_damping_error_1q"], 1)
-        for q in used_qubits:
-            noise_model.add_quantum_error(amplitude_damping_error_1q, ["x", "y", "z", "h", "s", "t", "rx", "ry", "rz"], [q], warnings=False)
+        _add_error(noise_model, depolarizing_error(noise_params["amplitude_damping_error_1q"], 1), ["x", "y", "z", "h", "s", "t", "rx", "ry", "rz"], qubits_1q)
 
     if "amplitude_damping_error_2q" in noise_params:
         # @TODO - not sure if Qiskit supports these
@@ -103,8 +158,24 @@ def construct_noise_model(basis_gates, n_qubits=None, qubits=None, ignore_qubits
 
     # @TODO - incorporate the missing error types
 
+    if use_cache:
+        noise_model = SharedNoiseModel.from_noise_model(noise_model)
+        _noise_model_cache[key] = noise_model
+        while len(_noise_model_cache) > max_cached_noise_models:
+            _noise_model_cache.popitem(last=False)
+
     return noise_model
 
+# Hash of the basis gates and errors of a noise model, which is equal for noise models with the same errors on the same instructions and qubits
+# (the random ids of the errors are ignored), e.g. to check that a resumed sweep uses the noise of the stored points
+def noise_model_fingerprint(noise_model):
+    errors = sorted(
+        json.dumps({key: value for key, value in error.items() if key != "id"}, sort_keys=True)
+        for error in noise_model.to_dict(serializable=True)["errors"]
+    )
+
+    return hashlib.sha256(json.dumps([sorted(noise_model.basis_gates), errors]).encode()).hexdigest()[:16]
+
 # @TODO - construct pre-made noise models for specific hardware
 #       - wishlist:
 #           - Quantinuum H1-1 (WIP)
@@ -128,5 +199,5 @@ def construct_noise_model_QuantinuumH1_1(n_qubits=None, qubits=None, ignore_qubi
         "amplitude_damping_error_2q": 0.43 * 1E-3, # calculated as a fraction of two-qubit fault probability
     }
 
-    return construct_noise_model(n_qubits=n_qubits, basis_gates=basis_gates, ignore_qubits=ignore_qubits, **noise_params)
+    return construct_noise_model(n_qubits=n_qubits, qubits=qubits, basis_gates=basis_gates, ignore_qubits=ignore_qubits, **noise_params)
 
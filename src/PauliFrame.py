@@ -0,0 +1,794 @@
+import numpy as np
+
+from qiskit.circuit import ControlFlowOp, IfElseOp, ForLoopOp, WhileLoopOp, Clbit, ClassicalRegister
+from qiskit.circuit.classical import expr, types
+
+from Simulation import find_non_pauli_errors
+
+# Pauli-frame sampling in the style of Stim's frame simulator: a noiseless reference run is simulated on a stabilizer tableau,
+# and every shot only tracks the Pauli operator (frame) by which its state differs from the reference. Frames of 64 shots are
+# packed into each uint64 word, so that every Clifford gate and noise channel acts on all shots with a few vectorized bit operations.
+#
+# Classical control flow is handled by splitting the reference run: whenever the shots of a reference disagree on a condition,
+# the reference tableau is copied and each copy follows one branch with its own shots. References which end up in the same
+# stabilizer state afterwards (e.g. after an extra syndrome extraction round, whose ancillas are reset) are merged again.
+
+WORD_BITS = 64
+
+_all_ones = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+def _n_words(shots):
+    return max(1, (shots + WORD_BITS - 1)//WORD_BITS)
+
+# Packed mask of the first `shots` shots
+def _shot_mask(shots):
+    mask = np.full(_n_words(shots), _all_ones, dtype=np.uint64)
+    if shots % WORD_BITS != 0:
+        mask[-1] = (np.uint64(1) << np.uint64(shots % WORD_BITS)) - np.uint64(1)
+    if shots == 0:
+        mask[:] = 0
+
+    return mask
+
+# Packed mask with the bits of the given shot indices set
+def _indices_to_mask(indices, n_words):
+    mask = np.zeros(n_words, dtype=np.uint64)
+    if len(indices) > 0:
+        np.bitwise_or.at(mask, indices >> 6, np.uint64(1) << (indices & 63).astype(np.uint64))
+
+    return mask
+
+def _random_words(rng, n_words):
+    return rng.integers(0, 2**64, size=n_words, dtype=np.uint64, endpoint=False)
+
+# Sorted indices of the shots in which an event of probability p occurs, skipping ahead with geometric gaps when p is small
+def _sample_hits(rng, shots, p):
+    if p <= 0 or shots == 0:
+        return np.zeros(0, dtype=np.int64)
+    if p >= 0.05:
+        return np.flatnonzero(rng.random(shots) < p)
+
+    expected = shots*p
+    hits = []
+    position = -1
+    while True:
+        gaps = rng.geometric(p, size=int(expected + 5*np.sqrt(expected) + 16))
+        positions = position + np.cumsum(gaps)
+        hits.append(positions[positions < shots])
+        if positions[-1] >= shots:
+            break
+        position = positions[-1]
+
+    return np.concatenate(hits)
+
+##########################################
+##### Reference stabilizer simulation #####
+##########################################
+
+# Sign of the product of Pauli row 1 and Pauli row(s) 2, where the phase exponent of i is accumulated per qubit (Aaronson and Gottesman, 2004)
+def _product_phase(x1, z1, r1, x2, z2, r2):
+    x2, z2 = x2.astype(int), z2.astype(int)
+    g = np.where(x1 & z1, z2 - x2, 0)
+    g += np.where(x1 & ~z1, z2*(2*x2 - 1), 0)
+    g += np.where(~x1 & z1, x2*(1 - 2*z2), 0)
+
+    return np.mod(2*np.asarray(r2, dtype=int) + 2*int(r1) + g.sum(axis=-1), 4) == 2
+
+class _Tableau:
+    """
+    Stabilizer tableau with destabilizers (Aaronson and Gottesman, 2004), used for the noiseless reference run
+    """
+
+    def __init__(self, n):
+        self.n = n
+        # Rows 0, ..., n-1 are destabilizers and rows n, ..., 2n-1 stabilizers, starting in |0...0>
+        self.x = np.zeros((2*n, n), dtype=bool)
+        self.z = np.zeros((2*n, n), dtype=bool)
+        self.r = np.zeros(2*n, dtype=bool)
+        self.x[np.arange(n), np.arange(n)] = True
+        self.z[np.arange(n, 2*n), np.arange(n)] = True
+
+    def copy(self):
+        tableau = _Tableau.__new__(_Tableau)
+        tableau.n = self.n
+        tableau.x, tableau.z, tableau.r = self.x.copy(), self.z.copy(), self.r.copy()
+        return tableau
+
+    def h(self, a):
+        self.r ^= self.x[:, a] & self.z[:, a]
+        self.x[:, a], self.z[:, a] = self.z[:, a].copy(), self.x[:, a].copy()
+
+    def s(self, a):
+        self.r ^= self.x[:, a] & self.z[:, a]
+        self.z[:, a] ^= self.x[:, a]
+
+    def cx(self, a, b):
+        self.r ^= self.x[:, a] & self.z[:, b] & ~(self.x[:, b] ^ self.z[:, a])
+        self.x[:, b] ^= self.x[:, a]
+        self.z[:, a] ^= self.z[:, b]
+
+    def pauli(self, x, z, qubits):
+        # Conjugation by a Pauli flips the sign of every row which anticommutes with it
+        self.r ^= ((self.x[:, qubits] & z) ^ (self.z[:, qubits] & x)).sum(axis=1) % 2 == 1
+
+    # Multiplies rows `targets` by row i, keeping track of the phases
+    def _rowsum(self, targets, i):
+        self.r[targets] = _product_phase(self.x[i], self.z[i], self.r[i], self.x[targets], self.z[targets], self.r[targets])
+        self.x[targets] ^= self.x[i]
+        self.z[targets] ^= self.z[i]
+
+    def measure(self, a, rng):
+        n = self.n
+        anticommuting = np.flatnonzero(self.x[n:, a]) + n
+
+        if len(anticommuting) > 0:
+            # Random outcome
+            p = anticommuting[0]
+            others = np.flatnonzero(self.x[:, a])
+            others = others[others != p]
+            if len(others) > 0:
+                self._rowsum(others, p)
+
+            self.x[p-n], self.z[p-n], self.r[p-n] = self.x[p], self.z[p], self.r[p]
+            self.x[p], self.z[p] = False, False
+            self.z[p, a] = True
+            self.r[p] = bool(rng.integers(2))
+            return int(self.r[p])
+
+        # Deterministic outcome, given by the sign of the product of the stabilizers paired with destabilizers that anticommute with Z_a
+        x, z, r = np.zeros(n, dtype=bool), np.zeros(n, dtype=bool), False
+        for i in np.flatnonzero(self.x[:n, a]) + n:
+            r = _product_phase(self.x[i], self.z[i], self.r[i], x, z, r)
+            x, z = x ^ self.x[i], z ^ self.z[i]
+
+        return int(r)
+
+    def reset(self, a, rng):
+        if self.measure(a, rng) == 1:
+            self.pauli(np.array([True]), np.array([False]), [a])
+
+    # Canonical form of the stabilizer group (with signs), which identifies the state
+    def key(self):
+        n = self.n
+        tableau = self.copy()
+        row = n
+        for bits, col in [(tableau.x, c) for c in range(n)] + [(tableau.z, c) for c in range(n)]:
+            candidates = np.flatnonzero(bits[row:, col]) + row
+            if len(candidates) == 0:
+                continue
+
+            pivot = candidates[0]
+            if pivot != row:
+                for array in [tableau.x, tableau.z, tableau.r]:
+                    array[[row, pivot]] = array[[pivot, row]]
+
+            others = np.flatnonzero(bits[n:, col]) + n
+            others = others[others != row]
+            if len(others) > 0:
+                tableau._rowsum(others, row)
+
+            row += 1
+            if row == 2*n:
+                break
+
+        return np.packbits(tableau.x[n:]).tobytes() + np.packbits(tableau.z[n:]).tobytes() + np.packbits(tableau.r[n:]).tobytes()
+
+##################################
+##### Circuit and noise model #####
+##################################
+
+# Gates which act on the frames (Pauli gates only change the reference and leave the frames untouched)
+_frame_gate_names = {"h", "s", "sdg", "sx", "sxdg", "cx", "cy", "cz", "swap"}
+_pauli_gate_names = {"id", "x", "y", "z", "pauli"}
+_ignored_names = {"barrier", "delay"}
+
+def _pauli_label_bits(label, n_qubits):
+    # Pauli labels are little-endian, i.e. the last character acts on the first qubit
+    label = label.lstrip("-i")
+    x = np.array([p in "XY" for p in reversed(label)], dtype=bool)
+    z = np.array([p in "ZY" for p in reversed(label)], dtype=bool)
+    assert len(x) == n_qubits
+    return x, z
+
+def _operation_pauli(operation):
+    if operation.name == "pauli":
+        return _pauli_label_bits(operation.params[0], operation.num_qubits)
+
+    return np.array([operation.name in ["x", "y"]]), np.array([operation.name in ["y", "z"]])
+
+"""
+    Convert a serialized Qiskit Aer QuantumError (an entry of NoiseModel.to_dict()["errors"]) consisting only of Pauli operators into a sampleable channel.
+    Parameters:
+        - error: dict with the "instructions" (one list of instruction dicts per term) and "probabilities" of the error
+        - n_qubits: Number of qubits of the error
+    Returns:
+        - channel: (probability of a non-identity Pauli, conditional probabilities of the non-identity Paulis, their X bits, their Z bits), or None for the identity channel
+"""
+def _compile_quantum_error(error, n_qubits):
+    terms = {}
+    for instructions, probability in zip(error["instructions"], error["probabilities"]):
+        x = np.zeros(n_qubits, dtype=bool)
+        z = np.zeros(n_qubits, dtype=bool)
+        for inst in instructions:
+            name = inst["name"]
+            if name not in _pauli_gate_names:
+                raise ValueError(f"Pauli-frame sampling only supports Pauli errors, but the noise model contains '{name}'")
+
+            qubits = list(inst["qubits"])
+            if name == "pauli":
+                px, pz = _pauli_label_bits(inst["params"][0], len(qubits))
+            else:
+                px, pz = np.array([name in ["x", "y"]]), np.array([name in ["y", "z"]])
+            x[qubits] ^= px
+            z[qubits] ^= pz
+
+        if x.any() or z.any():
+            key = (x.tobytes(), z.tobytes())
+            terms[key] = (terms[key][0] + probability, x, z) if key in terms else (probability, x, z)
+
+    p_total = sum(p for p, _, _ in terms.values())
+    if p_total <= 0:
+        return None
+
+    probabilities = np.array([p for p, _, _ in terms.values()])/p_total
+    return p_total, probabilities, np.array([x for _, x, _ in terms.values()]), np.array([z for _, _, z in terms.values()])
+
+# Number of qubits of a serialized quantum error, taken from its qubits if it is local and from its instructions otherwise
+def _error_qubit_count(error):
+    if "gate_qubits" in error:
+        return len(error["gate_qubits"][0])
+
+    return 1 + max((q for instructions in error["instructions"] for inst in instructions for q in inst["qubits"]), default=0)
+
+class _NoiseLookup:
+    """
+    Noise channels of the instructions of a circuit, read from the serialized noise model (NoiseModel.to_dict(), as in Simulation.find_non_pauli_errors)
+    so that they do not depend on the internal attributes of Aer's NoiseModel
+    """
+
+    def __init__(self, noise_model):
+        self.noise_model = noise_model
+        self._channels = {}
+
+        # Errors on specific qubits take precedence over errors on all qubits, as in Aer
+        self._quantum_errors = {}
+        self._readout_errors = {}
+        for error in ([] if noise_model is None else noise_model.to_dict()["errors"]):
+            errors = self._quantum_errors if error["type"] == "qerror" else self._readout_errors if error["type"] == "roerror" else None
+            if errors is None:
+                continue
+
+            for name in error["operations"]:
+                for qubits in error.get("gate_qubits", [None]):
+                    errors[(name, None if qubits is None else tuple(qubits))] = error
+
+    def quantum_channel(self, name, qubits):
+        key = (name, tuple(qubits))
+        if key not in self._channels:
+            error = self._quantum_errors.get(key, self._quantum_errors.get((name, None)))
+            if error is not None and _error_qubit_count(error) != len(qubits):
+                error = None
+
+            self._channels[key] = None if error is None else _compile_quantum_error(error, len(qubits))
+
+        return self._channels[key]
+
+    # Probabilities of recording 1 when the outcome is 0 and of recording 0 when the outcome is 1
+    def readout_flips(self, qubit):
+        error = self._readout_errors.get(("measure", (qubit,)), self._readout_errors.get(("measure", None)))
+        if error is None:
+            return None
+
+        probabilities = np.asarray(error["probabilities"])
+        return float(probabilities[0, 1]), float(probabilities[1, 0])
+
+# Resolves the classical bits of an expression variable (a Clbit or ClassicalRegister) to circuit clbit indices
+def _var_clbits(var, clbit_map):
+    if isinstance(var, Clbit):
+        return [clbit_map[var]]
+    if isinstance(var, ClassicalRegister):
+        return [clbit_map[bit] for bit in var]
+
+    raise ValueError(f"Pauli-frame sampling does not support classical variables of type {type(var).__name__}")
+
+def _type_width(type_):
+    return 1 if isinstance(type_, types.Bool) else type_.width
+
+# Compiles a classical expression into a tree of tuples with resolved clbit indices
+def _compile_expr(node, clbit_map):
+    if isinstance(node, expr.Var):
+        return ("bits", _var_clbits(node.var, clbit_map))
+    if isinstance(node, expr.Value):
+        return ("const", int(node.value), _type_width(node.type))
+    if isinstance(node, expr.Cast):
+        return ("cast", _compile_expr(node.operand, clbit_map), _type_width(node.type), isinstance(node.type, types.Bool))
+    if isinstance(node, expr.Index) and isinstance(node.index, expr.Value):
+        return ("index", _compile_expr(node.target, clbit_map), int(node.index.value))
+    if isinstance(node, expr.Unary) and node.op in (expr.Unary.Op.BIT_NOT, expr.Unary.Op.LOGIC_NOT):
+        return (node.op.name.lower(), _compile_expr(node.operand, clbit_map))
+    if isinstance(node, expr.Binary) and node.op.name in ["BIT_AND", "BIT_OR", "BIT_XOR", "LOGIC_AND", "LOGIC_OR", "EQUAL", "NOT_EQUAL"]:
+        return (node.op.name.lower(), _compile_expr(node.left, clbit_map), _compile_expr(node.right, clbit_map))
+
+    raise ValueError(f"Pauli-frame sampling does not support the classical expression {node}")
+
+def _compile_condition(condition, clbit_map):
+    if isinstance(condition, tuple):
+        condition = expr.lift_legacy_condition(condition)
+
+    return _compile_expr(condition, clbit_map)
+
+# Registers a fault location (an instruction with a noise channel) and returns its index, or None if the instruction is noiseless
+def _add_location(locations, key, channel):
+    if channel is None:
+        return None
+
+    locations.append((key, channel))
+    return len(locations) - 1
+
+"""
+    Flatten a circuit into a program for the frame sampler, expanding custom gates into their definitions and attaching the noise of each instruction.
+    Every noisy instruction is a fault location, numbered in program order, where the bodies of for loops are numbered once per iteration.
+    Program entries are tuples, whose first element names the operation:
+        - ("gate", name, qubits, channel, location), ("pauli", x, z, qubits, channel, location)
+        - ("measure", qubit, clbit, channel, location, readout_flips, readout_location), ("reset", qubit, channel, location)
+        - ("store", clbits, expression), ("if", condition, true_program, false_program)
+        - ("for", n_iterations, body_program, first_location, n_body_locations), ("while", condition, body_program)
+    Parameters:
+        - locations: list to which the (key, channel) pairs of the fault locations are appended, or None if locations are not numbered (inside while loops)
+"""
+def _compile_program(circuit, qubit_indices, clbit_map, noise, locations, program=None):
+    program = [] if program is None else program
+
+    for circuit_instruction in circuit.data:
+        operation = circuit_instruction.operation
+        name = operation.name
+        qubits = [qubit_indices[q] for q in circuit_instruction.qubits]
+        clbits = [clbit_map[c] for c in circuit_instruction.clbits]
+
+        if isinstance(operation, ControlFlowOp):
+            block_maps = []
+            for block in operation.blocks:
+                block_qubits = dict(zip(block.qubits, qubits))
+                # Expressions inside blocks refer to the bits of the enclosing circuit, so the outer map is kept as a fallback
+                block_clbits = {**clbit_map, **{bit: clbit_map[outer] for bit, outer in zip(block.clbits, circuit_instruction.clbits)}}
+                block_maps.append((block, block_qubits, block_clbits))
+
+            def compile_block(b, block_locations):
+                block, block_qubits, block_clbits = block_maps[b]
+                return _compile_program(block, block_qubits, block_clbits, noise, block_locations)
+
+            if isinstance(operation, IfElseOp):
+                true_program = compile_block(0, locations)
+                false_program = compile_block(1, locations) if operation.blocks[1:] and operation.blocks[1] is not None else None
+                program.append(("if", _compile_condition(operation.condition, clbit_map), true_program, false_program))
+            elif isinstance(operation, ForLoopOp):
+                indexset, _, _ = operation.params
+                body_locations = None if locations is None else []
+                body = compile_block(0, body_locations)
+                if locations is None:
+                    program.append(("for", len(indexset), body, None, None))
+                else:
+                    program.append(("for", len(indexset), body, len(locations), len(body_locations)))
+                    locations += body_locations*len(indexset)
+            elif isinstance(operation, WhileLoopOp):
+                # The number of iterations is only known at runtime, so faults inside while loops are not numbered
+                program.append(("while", _compile_condition(operation.condition, clbit_map), compile_block(0, None)))
+            else:
+                raise ValueError(f"Pauli-frame sampling does not support the control flow operation '{name}'")
+        elif name == "store":
+            if isinstance(operation.lvalue, expr.Index):
+                target = _compile_expr(operation.lvalue, clbit_map)
+                lvalue_clbits = [target[1][1][target[2]]]
+            else:
+                lvalue_clbits = _var_clbits(operation.lvalue.var, clbit_map)
+            program.append(("store", lvalue_clbits, _compile_expr(operation.rvalue, clbit_map)))
+        elif name in _ignored_names:
+            continue
+        elif name in ["measure", "reset"] or name in _frame_gate_names or name in _pauli_gate_names:
+            channel = noise.quantum_channel(name, qubits)
+            location = _add_location(locations, ("quantum", name, tuple(qubits)), channel) if locations is not None else None
+
+            if name == "measure":
+                # Errors on measurements act before the measurement, as in Aer
+                readout_flips = noise.readout_flips(qubits[0])
+                readout_location = _add_location(locations, ("readout", qubits[0]), readout_flips) if locations is not None else None
+                program.append(("measure", qubits[0], clbits[0], channel, location, readout_flips, readout_location))
+            elif name == "reset":
+                program.append(("reset", qubits[0], channel, location))
+            elif name in _frame_gate_names:
+                program.append(("gate", name, qubits, channel, location))
+            else:
+                x, z = _operation_pauli(operation)
+                program.append(("pauli", x, z, qubits, channel, location))
+        elif getattr(operation, "definition", None) is not None:
+            # Custom gates (e.g. the encoding gate or logical operators) are expanded into their definitions
+            definition = operation.definition
+            _compile_program(definition, dict(zip(definition.qubits, qubits)), clbit_map, noise, locations, program)
+        else:
+            raise ValueError(f"Pauli-frame sampling does not support the operation '{name}' (only Clifford gates, measurements and resets)")
+
+    return program
+
+def _has_while_loop(program):
+    for entry in program:
+        if entry[0] == "while":
+            return True
+        if entry[0] == "if" and (_has_while_loop(entry[2]) or (entry[3] is not None and _has_while_loop(entry[3]))):
+            return True
+        if entry[0] == "for" and _has_while_loop(entry[2]):
+            return True
+
+    return False
+
+#################################
+##### Frame sampler         #####
+#################################
+
+class _Branch:
+    """
+    Reference run followed by a subset of the shots (given as a packed mask)
+    """
+
+    def __init__(self, tableau, mask):
+        self.tableau = tableau
+        self.mask = mask
+
+class PauliFrameSampler:
+    """
+    Pauli-frame sampler for Clifford circuits (including LogicalCircuits with classical control flow) subject to Pauli noise.
+    Parameters:
+        - circuit: QuantumCircuit or LogicalCircuit consisting of Clifford gates, measurements, resets, stores and control flow
+        - noise_model: Qiskit Aer NoiseModel containing only Pauli errors and readout errors, or None for noiseless sampling
+        - seed: Seed of the random number generator
+    """
+
+    def __init__(self, circuit, noise_model=None, seed=None):
+        non_pauli_errors = find_non_pauli_errors(noise_model)
+        if len(non_pauli_errors) > 0:
+            raise ValueError(f"Pauli-frame sampling requires a Pauli noise model, but found non-Pauli errors on {sorted({err['instruction'] for err in non_pauli_errors})}")
+
+        self.circuit = circuit
+        self.n_qubits = circuit.num_qubits
+        self.n_clbits = circuit.num_clbits
+        self.rng = np.random.default_rng(seed)
+
+        qubit_indices = {qubit: i for i, qubit in enumerate(circuit.qubits)}
+        clbit_map = {clbit: i for i, clbit in enumerate(circuit.clbits)}
+
+        # Fault locations as (key, channel) pairs, where the key identifies the noisy instruction ("quantum", name, qubits) or ("readout", qubit)
+        self.locations = []
+        self.program = _compile_program(circuit, qubit_indices, clbit_map, _NoiseLookup(noise_model), self.locations)
+        self.has_unnumbered_locations = _has_while_loop(self.program)
+
+        self._faults = None
+
+    #####################
+    ##### Execution #####
+    #####################
+
+    def _active(self, branches):
+        active = np.zeros(self.n_words, dtype=np.uint64)
+        for branch in branches:
+            active |= branch.mask
+        return active
+
+    # Shots in which a fault occurs at a location, either sampled or injected (together with the chosen Pauli terms, if given)
+    def _fault_hits(self, location, p):
+        if self._faults is None:
+            return _sample_hits(self.rng, self.shots, p), None
+        if location is None:
+            return np.zeros(0, dtype=np.int64), None
+
+        return self._faults.get(location, (np.zeros(0, dtype=np.int64), None))
+
+    def _apply_channel(self, channel, qubits, active, location):
+        if channel is None:
+            return
+
+        p_total, probabilities, term_x, term_z = channel
+        hits, terms = self._fault_hits(location, p_total)
+        if len(hits) == 0:
+            return
+
+        if terms is None:
+            terms = self.rng.choice(len(probabilities), size=len(hits), p=probabilities)
+        for j, q in enumerate(qubits):
+            self.x[q] ^= _indices_to_mask(hits[term_x[terms, j]], self.n_words) & active
+            self.z[q] ^= _indices_to_mask(hits[term_z[terms, j]], self.n_words) & active
+
+    def _apply_gate(self, name, qubits, active):
+        x, z = self.x, self.z
+        if name == "h":
+            a = qubits[0]
+            d = (x[a] ^ z[a]) & active
+            x[a] ^= d
+            z[a] ^= d
+        elif name in ["s", "sdg"]:
+            a = qubits[0]
+            z[a] ^= x[a] & active
+        elif name in ["sx", "sxdg"]:
+            a = qubits[0]
+            x[a] ^= z[a] & active
+        elif name == "cx":
+            c, t = qubits
+            x[t] ^= x[c] & active
+            z[c] ^= z[t] & active
+        elif name == "cz":
+            a, b = qubits
+            z[a] ^= x[b] & active
+            z[b] ^= x[a] & active
+        elif name == "cy":
+            c, t = qubits
+            z[t] ^= x[t] & active
+            x[t] ^= x[c] & active
+            z[c] ^= z[t] & active
+            z[t] ^= x[t] & active
+        elif name == "swap":
+            a, b = qubits
+            for bits in [x, z]:
+                d = (bits[a] ^ bits[b]) & active
+                bits[a] ^= d
+                bits[b] ^= d
+
+    @staticmethod
+    def _apply_reference_gate(tableau, name, qubits):
+        if name == "h":
+            tableau.h(qubits[0])
+        elif name == "s":
+            tableau.s(qubits[0])
+        elif name == "sdg":
+            for _ in range(3):
+                tableau.s(qubits[0])
+        elif name in ["sx", "sxdg"]:
+            tableau.h(qubits[0])
+            for _ in range(1 if name == "sx" else 3):
+                tableau.s(qubits[0])
+            tableau.h(qubits[0])
+        elif name == "cx":
+            tableau.cx(*qubits)
+        elif name == "cz":
+            tableau.h(qubits[1])
+            tableau.cx(*qubits)
+            tableau.h(qubits[1])
+        elif name == "cy":
+            for _ in range(3):
+                tableau.s(qubits[1])
+            tableau.cx(*qubits)
+            tableau.s(qubits[1])
+        elif name == "swap":
+            a, b = qubits
+            tableau.cx(a, b)
+            tableau.cx(b, a)
+            tableau.cx(a, b)
+
+    # Evaluates a compiled expression into a list of packed bit planes (least significant bit first)
+    def _evaluate(self, node):
+        kind = node[0]
+        if kind == "bits":
+            return [self.clbits[c] for c in node[1]]
+        if kind == "const":
+            _, value, width = node
+            return [np.full(self.n_words, _all_ones if (value >> i) & 1 else 0, dtype=np.uint64) for i in range(width)]
+        if kind == "cast":
+            planes = self._evaluate(node[1])
+            if node[3]:
+                return [self._nonzero(planes)]
+            zero = np.zeros(self.n_words, dtype=np.uint64)
+            return (planes + [zero]*node[2])[:node[2]]
+        if kind == "index":
+            return [self._evaluate(node[1])[node[2]]]
+        if kind == "bit_not":
+            return [~plane for plane in self._evaluate(node[1])]
+        if kind == "logic_not":
+            return [~self._nonzero(self._evaluate(node[1]))]
+
+        left, right = self._evaluate(node[1]), self._evaluate(node[2])
+        if kind in ["logic_and", "logic_or"]:
+            left, right = [self._nonzero(left)], [self._nonzero(right)]
+            kind = "bit_and" if kind == "logic_and" else "bit_or"
+
+        width = max(len(left), len(right))
+        zero = np.zeros(self.n_words, dtype=np.uint64)
+        left, right = left + [zero]*(width - len(left)), right + [zero]*(width - len(right))
+
+        if kind == "bit_and":
+            return [a & b for a, b in zip(left, right)]
+        if kind == "bit_or":
+            return [a | b for a, b in zip(left, right)]
+        if kind == "bit_xor":
+            return [a ^ b for a, b in zip(left, right)]
+
+        differs = self._nonzero([a ^ b for a, b in zip(left, right)])
+        return [differs] if kind == "not_equal" else [~differs]
+
+    def _nonzero(self, planes):
+        result = np.zeros(self.n_words, dtype=np.uint64)
+        for plane in planes:
+            result |= plane
+        return result
+
+    def _write_clbit(self, c, plane, active):
+        self.clbits[c] = (self.clbits[c] & ~active) | (plane & active)
+
+    @staticmethod
+    def _merge(branches):
+        merged = {}
+        for branch in branches:
+            if not branch.mask.any():
+                continue
+
+            key = branch.tableau.key()
+            if key in merged:
+                merged[key].mask = merged[key].mask | branch.mask
+            else:
+                merged[key] = branch
+
+        return list(merged.values())
+
+    # Splits branches into those whose shots satisfy the condition and those whose shots do not
+    def _split(self, branches, condition):
+        condition = self._nonzero(self._evaluate(condition))
+
+        true_branches, false_branches = [], []
+        for branch in branches:
+            true_mask, false_mask = branch.mask & condition, branch.mask & ~condition
+            if true_mask.any() and false_mask.any():
+                true_branches.append(_Branch(branch.tableau.copy(), true_mask))
+                false_branches.append(_Branch(branch.tableau, false_mask))
+            elif true_mask.any():
+                true_branches.append(branch)
+            else:
+                false_branches.append(branch)
+
+        return true_branches, false_branches
+
+    def _run(self, program, branches, offset=0):
+        # Locations of entries are relative to the first location of the enclosing loop iteration
+        def at(location):
+            return None if location is None else offset + location
+
+        for entry in program:
+            if len(branches) == 0:
+                break
+
+            kind = entry[0]
+            active = self._active(branches) if kind not in ["if", "while", "for"] else None
+
+            if kind == "gate":
+                _, name, qubits, channel, location = entry
+                for branch in branches:
+                    self._apply_reference_gate(branch.tableau, name, qubits)
+                self._apply_gate(name, qubits, active)
+                self._apply_channel(channel, qubits, active, at(location))
+            elif kind == "pauli":
+                _, x, z, qubits, channel, location = entry
+                for branch in branches:
+                    branch.tableau.pauli(x, z, qubits)
+                self._apply_channel(channel, qubits, active, at(location))
+            elif kind == "measure":
+                _, q, c, channel, location, readout_flips, readout_location = entry
+                self._apply_channel(channel, [q], active, at(location))
+
+                reference = np.zeros(self.n_words, dtype=np.uint64)
+                for branch in branches:
+                    if branch.tableau.measure(q, self.rng):
+                        reference |= branch.mask
+                outcome = reference ^ self.x[q]
+
+                if readout_flips is not None and self._faults is None:
+                    p10, p01 = readout_flips
+                    flips_0 = _indices_to_mask(_sample_hits(self.rng, self.shots, p10), self.n_words) & ~outcome
+                    flips_1 = _indices_to_mask(_sample_hits(self.rng, self.shots, p01), self.n_words) & outcome
+                    outcome ^= flips_0 | flips_1
+                elif readout_flips is not None:
+                    # Injected readout faults flip the outcome regardless of its value
+                    outcome ^= _indices_to_mask(self._fault_hits(at(readout_location), None)[0], self.n_words)
+
+                self._write_clbit(c, outcome, active)
+                # The measured qubit is in a Z eigenstate, so a random Z keeps the frame valid while scrambling its phase
+                self.z[q] ^= _random_words(self.rng, self.n_words) & active
+            elif kind == "reset":
+                _, q, channel, location = entry
+                for branch in branches:
+                    branch.tableau.reset(q, self.rng)
+                self.x[q] &= ~active
+                self.z[q] = (self.z[q] & ~active) | (_random_words(self.rng, self.n_words) & active)
+                self._apply_channel(channel, [q], active, at(location))
+            elif kind == "store":
+                _, clbits, value = entry
+                planes = self._evaluate(value)
+                for i, c in enumerate(clbits):
+                    self._write_clbit(c, planes[i] if i < len(planes) else np.zeros(self.n_words, dtype=np.uint64), active)
+            elif kind == "if":
+                _, condition, true_program, false_program = entry
+                true_branches, false_branches = self._split(branches, condition)
+                true_branches = self._run(true_program, true_branches, offset)
+                if false_program is not None:
+                    false_branches = self._run(false_program, false_branches, offset)
+                branches = self._merge(true_branches + false_branches)
+            elif kind == "for":
+                _, n_iterations, body, first_location, n_body_locations = entry
+                for i in range(n_iterations):
+                    branches = self._run(body, branches, None if first_location is None else offset + first_location + i*n_body_locations)
+            elif kind == "while":
+                _, condition, body = entry
+                finished = []
+                while len(branches) > 0:
+                    branches, done = self._split(branches, condition)
+                    finished += done
+                    branches = self._run(body, branches)
+                branches = self._merge(finished)
+
+        return branches
+
+    def _run_batch(self, shots, faults=None):
+        self.shots = shots
+        self._faults = faults
+        self.n_words = _n_words(shots)
+
+        # Every qubit starts in |0>, which is stabilized by Z, so random Z components in the frames leave the state unchanged
+        self.x = np.zeros((self.n_qubits, self.n_words), dtype=np.uint64)
+        self.z = _random_words(self.rng, (self.n_qubits, self.n_words))
+        self.clbits = np.zeros((self.n_clbits, self.n_words), dtype=np.uint64)
+
+        try:
+            self._run(self.program, [_Branch(_Tableau(self.n_qubits), _shot_mask(shots))])
+        finally:
+            self._faults = None
+
+        return self.clbits
+
+    """
+        Sample shots of the circuit.
+        Parameters:
+            - shots: Number of shots
+            - packed: If true, the packed (n_clbits, n_words) uint64 array is returned instead, where shot s is bit s % 64 of word s // 64
+            - faults: If given, no noise is sampled and faults are only injected as specified, as a dict mapping fault location indices (see self.locations)
+                      to (sorted shot indices, indices of the Pauli terms of the channel or None to sample them)
+        Returns:
+            - bits: uint8 array of shape (shots, n_clbits), where column i is the i-th clbit (as produced by Decoding.memory_to_array)
+    """
+    def sample(self, shots, packed=False, faults=None):
+        clbits = self._run_batch(shots, faults)
+        if packed:
+            return clbits
+
+        bits = np.unpackbits(np.ascontiguousarray(clbits, dtype="<u8").view(np.uint8), axis=1, bitorder="little")[:, :shots]
+        return np.ascontiguousarray(bits.T)
+
+# Logical outputs of a LogicalCircuit without noise, which have to be the same in every shot
+def noiseless_logical_output(logical_circuit, seed=None):
+    reference_outputs = logical_circuit.get_logical_outputs(PauliFrameSampler(logical_circuit, seed=seed).sample(WORD_BITS))
+    if (reference_outputs != reference_outputs[0]).any():
+        raise ValueError("The logical outputs of the circuit are not deterministic, please provide the expected_output")
+
+    return reference_outputs[0]
+
+"""
+    Estimate the logical error rate of a LogicalCircuit under Pauli noise with the Pauli-frame sampler.
+    Parameters:
+        - logical_circuit: LogicalCircuit ending in logical measurements (e.g. encode, perform_qec_cycle and measure)
+        - noise_model: Qiskit Aer NoiseModel containing only Pauli errors and readout errors
+        - shots: Number of shots
+        - expected_output: Expected logical outputs (one bit per logical qubit), by default those of a noiseless run
+        - batch_size: Number of shots simulated at once
+        - seed: Seed of the random number generator
+    Returns:
+        - estimate: dict with the number of shots and failures, the logical error rate and its standard error
+"""
+def estimate_logical_error_rate(logical_circuit, noise_model, shots, expected_output=None, batch_size=2**18, seed=None):
+    expected_output = noiseless_logical_output(logical_circuit, seed=seed) if expected_output is None else np.asarray(expected_output, dtype=np.uint8)
+    sampler = PauliFrameSampler(logical_circuit, noise_model=noise_model, seed=seed)
+
+    failures = 0
+    for start in range(0, shots, batch_size):
+        outputs = logical_circuit.get_logical_outputs(sampler.sample(min(batch_size, shots - start)))
+        failures += int((outputs != expected_output).any(axis=1).sum())
+
+    rate = failures/shots
+    return {
+        "shots": shots,
+        "failures": failures,
+        "logical_error_rate": rate,
+        "std_error": np.sqrt(rate*(1 - rate)/shots),
+    }
@@ -0,0 +1,373 @@
+import os
+import time
+import numpy as np
+
+from qiskit import QuantumCircuit, transpile
+from qiskit.circuit import Barrier, Measure, Reset, Store, ControlFlowOp, IfElseOp, ForLoopOp, ClassicalRegister
+from qiskit.circuit.classical import expr
+
+from Simulation import find_non_clifford_instructions, find_non_pauli_errors, _standard_gate_names
+from Scheduling import schedule_instructions
+
+# Phases reported for LogicalCircuits, in the order in which they usually appear; instructions outside of any phase (e.g. logical gates) are reported as "logical_operations"
+phase_names = ["encode", "flagged_cycle", "unflagged_cycle", "qec_cycles", "decode", "measure", "logical_operations"]
+
+# Coarse single-threaded cost model of the Aer simulation methods:
+# every operation of every simulated shot takes overhead + per_element * (number of elements of the simulator state it touches)
+# The default is an example, measured on layered Clifford circuits on one development machine; runtime predictions on any other machine
+# should use a cost model measured there with calibrate_cost_model
+aer_cost_model = {
+    "overhead": 2e-6,
+    "per_element": 1e-8,
+}
+
+# Raised for sweep points which no simulation method can run within the given resource limits
+class ResourceLimitError(Exception):
+    pass
+
+# Gate count, CX count and two-qubit gate count of an operation, recursing into the definitions of custom gates (e.g. the encoding gate)
+def _gate_counts(operation, memo):
+    key = id(operation)
+    if key in memo:
+        return memo[key][0]
+
+    definition = getattr(operation, "definition", None) if operation.name not in _standard_gate_names else None
+    if definition is None:
+        counts = (1, int(operation.name == "cx"), int(operation.num_qubits == 2))
+    else:
+        counts = tuple(sum(values) for values in zip((0, 0, 0), *(_gate_counts(inst.operation, memo) for inst in definition.data)))
+
+    # The operation is kept alive so that its id cannot be reused (see Simulation._is_pauli_operation)
+    memo[key] = (counts, operation)
+    return counts
+
+def _new_phase_report():
+    return {
+        "qubits": set(),
+        "clbits": set(),
+        "gates": 0,
+        "cx": 0,
+        "two_qubit_gates": 0,
+        "depth": 0,
+        "duration": 0,
+        "conditionals": 0,
+        "measurements": 0,
+        "mid_circuit_measurements": 0,
+        "classical_operations": 0,
+    }
+
+# Clbits written by a Store
+def _store_targets(operation):
+    targets = []
+    for var in expr.iter_vars(operation.lvalue):
+        targets.extend(var.var if isinstance(var.var, ClassicalRegister) else [var.var])
+
+    return targets
+
+# Walks instructions in program order (including control flow bodies) and accumulates the costs of each phase
+def _walk(instructions, phase, reports, pending_measurements, decode_clbits, memo):
+    for instruction in instructions:
+        operation = instruction.operation
+
+        # Classical decoding writes the Pauli frame and the previous syndrome, wherever it is emitted
+        instruction_phase = phase
+        if isinstance(operation, Store) and any(clbit in decode_clbits for clbit in _store_targets(operation)):
+            instruction_phase = "decode"
+
+        report = reports.setdefault(instruction_phase, _new_phase_report())
+        report["qubits"].update(instruction.qubits)
+        report["clbits"].update(instruction.clbits)
+
+        if isinstance(operation, ControlFlowOp):
+            if isinstance(operation, IfElseOp):
+                report["conditionals"] += 1
+
+            # The body of a for loop is walked once per iteration, so that its costs and mid-circuit measurements are counted in full
+            n_iterations = len(operation.params[0]) if isinstance(operation, ForLoopOp) else 1
+
+            branch_pending = []
+            for block in operation.blocks:
+                block_pending = dict(pending_measurements)
+                for _ in range(n_iterations):
+                    _walk(block.data, phase, reports, block_pending, decode_clbits, memo)
+                branch_pending.append(block_pending)
+
+            # Measurements still pending after any branch remain pending after the control flow operation
+            pending_measurements.clear()
+            for block_pending in branch_pending:
+                pending_measurements.update(block_pending)
+            continue
+
+        if isinstance(operation, Store):
+            report["classical_operations"] += 1
+            report["clbits"].update(_store_targets(operation))
+            continue
+
+        if isinstance(operation, Barrier):
+            continue
+
+        # A measurement is mid-circuit if its qubit is acted on again afterwards
+        for qubit in instruction.qubits:
+            if qubit in pending_measurements:
+                reports[pending_measurements.pop(qubit)]["mid_circuit_measurements"] += 1
+
+        if isinstance(operation, Measure):
+            report["measurements"] += 1
+            pending_measurements[instruction.qubits[0]] = instruction_phase
+        elif not isinstance(operation, Reset):
+            gates, cx, two_qubit_gates = _gate_counts(operation, memo)
+            report["gates"] += gates
+            report["cx"] += cx
+            report["two_qubit_gates"] += two_qubit_gates
+
+# Phase of each top-level instruction of a circuit, from the phase spans recorded by LogicalCircuit
+def _instruction_phases(circuit):
+    phases = ["logical_operations"] * len(circuit.data)
+    for phase, start, stop in getattr(circuit, "phase_spans", []):
+        phases[start:stop] = [phase] * (stop - start)
+
+    return phases
+
+def _default_memory_limit():
+    # Aer itself limits its memory to half of the physical memory by default
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+"""
+    Predicted memory and runtime of the Aer simulation methods for a circuit, from its totals as reported by estimate_resources.
+    Shots are simulated one by one whenever the circuit is noisy or contains mid-circuit measurements or conditionals, and otherwise sampled from a single run.
+    Parameters:
+        - total: Totals of the circuit as reported by estimate_resources
+        - noisy: If true, the circuit is simulated with a non-trivial noise model
+        - shots: Number of shots
+        - methods: Aer methods to predict
+        - cost_model: dict with the overhead and per_element times of aer_cost_model
+    Returns:
+        - predictions: dict[method, dict] with the memory in bytes and the runtime in seconds of each method
+"""
+def predict_method_costs(total, noisy, shots, methods=("stabilizer", "statevector", "density_matrix"), cost_model=None):
+    cost_model = aer_cost_model if cost_model is None else cost_model
+
+    n = total["qubits"]
+    per_shot = noisy or total["mid_circuit_measurements"] > 0 or total["conditionals"] > 0
+    runs = shots if per_shot else 1
+    operations = total["gates"] + total["measurements"] + total["resets"]
+
+    predictions = {}
+    for method in methods:
+        if method == "stabilizer":
+            # Tableau of 2n stabilizer and destabilizer rows, where gates update a column and measurements may touch the whole tableau
+            memory = (2*n)*(2*n + 1)/8
+            elements = operations*n + total["measurements"]*n**2
+        elif method == "statevector":
+            memory = 16*2.0**n
+            elements = operations*2.0**n
+        elif method == "density_matrix":
+            memory = 16*4.0**n
+            elements = operations*4.0**n
+        else:
+            raise ValueError(f"No cost model for Aer method '{method}'")
+
+        runtime = runs*(operations*cost_model["overhead"] + elements*cost_model["per_element"])
+        if not per_shot:
+            runtime += shots*n*cost_model["per_element"]
+
+        predictions[method] = {"memory": float(memory), "runtime": float(runtime)}
+
+    return predictions
+
+# Layered random Clifford circuit of the kind the cost model is calibrated on
+def _calibration_circuit(n_qubits, depth, rng):
+    circuit = QuantumCircuit(n_qubits)
+    for _ in range(depth):
+        for q in range(n_qubits):
+            [circuit.h, circuit.s, circuit.x][rng.integers(3)](q)
+        order = rng.permutation(n_qubits)
+        for a, b in zip(order[::2], order[1::2]):
+            circuit.cx(int(a), int(b))
+    circuit.measure_all()
+
+    return circuit
+
+"""
+    Measure the cost model of the Aer simulation methods on this machine, by timing single-threaded simulations of layered Clifford circuits
+    and fitting the overhead and per_element times of predict_method_costs to them by least squares.
+    Parameters:
+        - qubit_counts: Qubit counts of the calibration circuits, which should include small (overhead-bound) and large (state-bound) ones
+        - depth: Number of layers of the calibration circuits
+        - shots: Number of shots of each calibration run
+        - methods: Aer methods to time
+        - repeats: Number of timed runs per circuit, of which the fastest is used
+        - seed: Seed of the random calibration circuits
+    Returns:
+        - cost_model: dict with the overhead and per_element times, to be passed as cost_model to estimate_resources and select_feasible_method
+"""
+def calibrate_cost_model(qubit_counts=(4, 8, 12, 16, 18), depth=20, shots=16, methods=("stabilizer", "statevector"), repeats=3, seed=None):
+    from qiskit_aer import AerSimulator
+
+    rng = np.random.default_rng(seed)
+    rows, runtimes = [], []
+    for method in methods:
+        simulator = AerSimulator(method=method, max_parallel_threads=1)
+        for n_qubits in qubit_counts:
+            circuit = transpile(_calibration_circuit(n_qubits, depth, rng), simulator, optimization_level=0)
+            total = estimate_resources(circuit, shots=shots, methods=(method,), cost_model={"overhead": 0, "per_element": 0})["total"]
+
+            # Predicted runtimes are linear in the overhead and per_element times
+            rows.append([
+                predict_method_costs(total, False, shots, methods=(method,), cost_model={"overhead": 1, "per_element": 0})[method]["runtime"],
+                predict_method_costs(total, False, shots, methods=(method,), cost_model={"overhead": 0, "per_element": 1})[method]["runtime"],
+            ])
+
+            simulator.run(circuit, shots=shots).result()
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                simulator.run(circuit, shots=shots).result()
+                timings.append(time.perf_counter() - start)
+            runtimes.append(min(timings))
+
+    # Rows are scaled to relative errors, so that the fast and the slow runs are fitted equally well
+    rows, runtimes = np.array(rows), np.array(runtimes)
+    (overhead, per_element), *_ = np.linalg.lstsq(rows / runtimes[:, None], np.ones(len(runtimes)), rcond=None)
+
+    return {
+        "overhead": float(max(overhead, 0.0)),
+        "per_element": float(max(per_element, 0.0)),
+    }
+
+def _count_resets(instructions):
+    resets = 0
+    for instruction in instructions:
+        if isinstance(instruction.operation, ControlFlowOp):
+            n_iterations = len(instruction.operation.params[0]) if isinstance(instruction.operation, ForLoopOp) else 1
+            resets += n_iterations * sum(_count_resets(block.data) for block in instruction.operation.blocks)
+        elif isinstance(instruction.operation, Reset):
+            resets += 1
+
+    return resets
+
+"""
+    Static resource estimate of a circuit, computed without simulating it.
+    LogicalCircuits are broken down into the phases in which they were built (see phase_names), where control flow bodies are walked
+    recursively and classical decoding inside them is attributed to the decode phase. Other circuits are reported as a single phase.
+    The memory and runtime of each Aer method are predicted from the totals, and the fastest method which fits into the limits is recommended.
+    Parameters:
+        - circuit: QuantumCircuit or LogicalCircuit
+        - noise_model: Qiskit Aer NoiseModel, or None for noiseless simulation
+        - shots: Number of shots the prediction is made for
+        - methods: Aer methods to consider
+        - memory_limit: Maximum memory in bytes, defaulting to half of the physical memory
+        - max_runtime: Maximum predicted runtime in seconds, or None for no limit
+        - durations: Instruction durations used for the duration of each phase, as in Scheduling.default_durations
+        - cost_model: dict with the overhead and per_element times, e.g. from calibrate_cost_model, defaulting to the example aer_cost_model
+    Returns:
+        - report: dict with
+            - phases: dict[phase, dict] with the qubits, clbits, gates, cx, two_qubit_gates, depth, duration, conditionals, measurements,
+                      mid_circuit_measurements and classical_operations of each phase
+            - total: the same for the whole circuit, together with its resets and whether its phases were recorded
+            - methods: dict[method, dict] with the predicted memory and runtime, whether the method is feasible and why not
+            - recommended_method: fastest feasible method, or None if none is feasible
+"""
+def estimate_resources(circuit, noise_model=None, shots=1024, methods=("stabilizer", "statevector", "density_matrix"), memory_limit=None, max_runtime=None, durations=None, cost_model=None):
+    decode_clbits = {
+        clbit
+        for creg in getattr(circuit, "pauli_frame_cregs", []) + getattr(circuit, "prev_syndrome_cregs", [])
+        for clbit in creg
+    }
+
+    instruction_phases = _instruction_phases(circuit)
+
+    reports = {}
+    pending_measurements = {}
+    memo = {}
+    for instruction, phase in zip(circuit.data, instruction_phases):
+        _walk([instruction], phase, reports, pending_measurements, decode_clbits, memo)
+
+    # Depth and duration add up over the consecutive runs of top-level instructions of each phase
+    run_start = 0
+    for i in range(1, len(circuit.data) + 1):
+        if i == len(circuit.data) or instruction_phases[i] != instruction_phases[run_start]:
+            depth, duration = schedule_instructions(circuit.data[run_start:i], durations=durations)
+            report = reports.setdefault(instruction_phases[run_start], _new_phase_report())
+            report["depth"] += depth
+            report["duration"] += duration
+            run_start = i
+
+    phases = {}
+    for phase in phase_names + sorted(set(reports) - set(phase_names)):
+        if phase in reports:
+            report = reports[phase]
+            phases[phase] = dict(report, qubits=len(report["qubits"]), clbits=len(report["clbits"]))
+
+    depth, duration = schedule_instructions(circuit.data, durations=durations)
+    total = {
+        "qubits": circuit.num_qubits,
+        "clbits": circuit.num_clbits,
+        "depth": depth,
+        "duration": duration,
+        "resets": _count_resets(circuit.data),
+        "phases_recorded": len(getattr(circuit, "phase_spans", [])) > 0,
+    }
+    for key in ["gates", "cx", "two_qubit_gates", "conditionals", "measurements", "mid_circuit_measurements", "classical_operations"]:
+        total[key] = sum(report[key] for report in phases.values())
+
+    noisy = noise_model is not None and not noise_model.is_ideal()
+    predictions = predict_method_costs(total, noisy, shots, methods=methods, cost_model=cost_model)
+
+    memory_limit = _default_memory_limit() if memory_limit is None else memory_limit
+    stabilizer_reasons = None
+    for method, prediction in predictions.items():
+        reasons = []
+        if method == "stabilizer":
+            if stabilizer_reasons is None:
+                stabilizer_reasons = []
+                if len(find_non_clifford_instructions(circuit)) > 0:
+                    stabilizer_reasons.append("non-Clifford instructions")
+                if len(find_non_pauli_errors(noise_model)) > 0:
+                    stabilizer_reasons.append("non-Pauli noise")
+            reasons += stabilizer_reasons
+
+        if memory_limit is not None and prediction["memory"] > memory_limit:
+            reasons.append(f"requires {prediction['memory']/2**30:.3g} GiB of memory")
+        if max_runtime is not None and prediction["runtime"] > max_runtime:
+            reasons.append(f"predicted runtime of {prediction['runtime']:.3g} s")
+
+        prediction["feasible"] = len(reasons) == 0
+        prediction["reasons"] = reasons
+
+    feasible_methods = [method for method, prediction in predictions.items() if prediction["feasible"]]
+    recommended_method = min(feasible_methods, key=lambda method: predictions[method]["runtime"]) if len(feasible_methods) > 0 else None
+
+    return {
+        "phases": phases,
+        "total": total,
+        "methods": predictions,
+        "recommended_method": recommended_method,
+    }
+
+"""
+    Selects the method for simulating a circuit within resource limits, rerouting to the recommended method if the requested one is not feasible.
+    Parameters:
+        - circuit, noise_model, shots, memory_limit, max_runtime, cost_model: As for estimate_resources
+        - method: Requested Aer method, or "automatic" for the recommended one
+    Returns:
+        - method: Method to simulate the circuit with
+        - report: Resource report returned by estimate_resources
+    Raises:
+        - ResourceLimitError: If no method is feasible
+"""
+def select_feasible_method(circuit, noise_model=None, method="automatic", shots=1024, memory_limit=None, max_runtime=None, cost_model=None):
+    report = estimate_resources(circuit, noise_model=noise_model, shots=shots, memory_limit=memory_limit, max_runtime=max_runtime, cost_model=cost_model)
+
+    # Methods without a cost model (e.g. matrix_product_state) cannot be checked and are used as requested
+    if method != "automatic" and (method not in report["methods"] or report["methods"][method]["feasible"]):
+        return method, report
+
+    if report["recommended_method"] is None:
+        reasons = "; ".join(f"{name}: {', '.join(prediction['reasons'])}" for name, prediction in report["methods"].items())
+        raise ResourceLimitError(f"No simulation method can run the circuit within the resource limits ({reasons})")
+
+    return report["recommended_method"], report
@@ -0,0 +1,334 @@
+import os
+import json
+import numpy as np
+
+from Counts import n_outcome_words, encode_counts, decode_counts
+
+"""
+    Append-only store for the points of a parameter sweep, written as one JSON record per line.
+    Every finished point is appended and flushed to disk immediately, so that a crashed or interrupted sweep loses at most the
+    points which were still running, and can be resumed by skipping the points which are already stored.
+    Parameters:
+        - path: Path of the JSON lines file, which is created if it does not exist
+"""
+class SweepResultStore:
+    def __init__(self, path):
+        self.path = path
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, record):
+        line = json.dumps(record, separators=(",", ":"))
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        with open(self.path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash while writing can leave a truncated last line, whose point is simply run again
+                    continue
+
+        return records
+
+    # Latest record of each (n_qubits, circuit_length) point, where later records (e.g. a successful retry) override earlier ones
+    def latest_records(self):
+        return {(record["n_qubits"], record["circuit_length"]): record for record in self.records()}
+
+    def completed_points(self):
+        return {point for point, record in self.latest_records().items() if record.get("status") == "ok"}
+
+    """
+        Load the stored sweep in the format returned by circuit_scaling_experiment.
+        Returns:
+            - data: dict[n_qubits, dict[circuit_length, (None, counts)]], where results are not stored on disk
+    """
+    def to_data(self):
+        data = {}
+        for (n_qubits, circuit_length), record in sorted(self.latest_records().items()):
+            if record.get("status") == "ok":
+                data.setdefault(n_qubits, {})[circuit_length] = None, record["counts"]
+
+        return data
+
+# Statuses of sweep points, stored by index in the columnar store
+statuses = ["ok", "error", "skipped"]
+
+# Columns with one entry per stored record, where strings (methods, errors, register layouts and settings) are indices into the string table
+point_columns = {
+    "n_qubits": np.int64,
+    "circuit_length": np.int64,
+    "status": np.int8,
+    "method": np.int32,
+    "error": np.int32,
+    "shots": np.int64,
+    "time_taken": np.float64,
+    # Tally of the target quantity of adaptive sweeps (see Analysis.target_tally), with tally_binary = -1 if there is none
+    "tally_shots": np.int64,
+    "tally_sum": np.float64,
+    "tally_sum_sq": np.float64,
+    "tally_binary": np.int8,
+    # Outcome histogram of the record: rows hist_start, ..., hist_start + hist_count - 1 of the histogram columns,
+    # whose outcomes take n_words = ceil(n_bits/64) consecutive entries of outcome_words each, starting at word_start
+    "hist_start": np.int64,
+    "hist_count": np.int64,
+    "word_start": np.int64,
+    "n_bits": np.int64,
+    "layout": np.int32,
+    # Settings the point was run with (see Experiments.circuit_scaling_experiment), or -1 if there are none
+    "config": np.int32,
+}
+
+# Columns with one entry per histogram row (frequency) or per 64-bit word of the integer-encoded outcomes (outcome_words)
+histogram_columns = {
+    "frequency": np.int64,
+    "outcome_words": np.uint64,
+}
+
+# Concatenation of the index ranges [start, start + length) of all given starts and lengths
+def concatenated_ranges(starts, lengths):
+    starts, lengths = np.asarray(starts, dtype=np.int64), np.asarray(lengths, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum(), dtype=np.int64) + np.repeat(starts - offsets, lengths)
+
+"""
+    Histogram rows and outcome words of the given records of a columnar store.
+    Parameters:
+        - columns: Columns as returned by ColumnarSweepStore.columns or latest_columns
+        - rows: Indices of the records
+    Returns:
+        - hist_rows: Indices into the histogram columns of the outcomes of all records, in record order
+        - record_of_row: Position in rows of the record of each outcome
+        - word_indices: Indices into outcome_words of the words of all outcomes, in outcome order
+        - row_of_word: Position in hist_rows of the outcome of each word
+"""
+def histogram_indices(columns, rows):
+    hist_count = np.asarray(columns["hist_count"][rows], dtype=np.int64)
+    hist_rows = concatenated_ranges(columns["hist_start"][rows], hist_count)
+    record_of_row = np.repeat(np.arange(len(hist_count)), hist_count)
+
+    n_words = n_outcome_words(columns["n_bits"][rows])[record_of_row]
+    local_rows = hist_rows - np.repeat(np.asarray(columns["hist_start"][rows], dtype=np.int64), hist_count)
+    word_indices = concatenated_ranges(np.asarray(columns["word_start"][rows], dtype=np.int64)[record_of_row] + local_rows*n_words, n_words)
+    row_of_word = np.repeat(np.arange(len(hist_rows)), n_words)
+
+    return hist_rows, record_of_row, word_indices, row_of_word
+
+"""
+    Append-only columnar store for the points of a parameter sweep, with the same interface as SweepResultStore.
+    The store is a directory with one raw binary file per column (see point_columns and histogram_columns), which are appended to
+    for every finished point and read back as memory-mapped arrays, and a JSON lines table of the strings referenced by the columns.
+    Outcome histograms are stored integer-encoded, so that sweeps can be reloaded and analysed on the columns without building counts dicts.
+    Every append writes the histogram and strings of a point before its row in the point columns, so that a crashed sweep leaves at most
+    a partially written row, which is ignored (and the point run again when resuming).
+    Parameters:
+        - path: Directory of the store, which is created if it does not exist
+"""
+class ColumnarSweepStore(SweepResultStore):
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.strings = []
+        strings_path = self._column_path("strings", extension="jsonl")
+        if os.path.exists(strings_path):
+            with open(strings_path, "rb") as f:
+                content = f.read()
+            # A truncated last line is dropped, so that new strings are appended after the last complete one
+            complete = content[:content.rfind(b"\n") + 1]
+            if len(complete) < len(content):
+                with open(strings_path, "wb") as f:
+                    f.write(complete)
+            self.strings = [json.loads(line) for line in complete.decode().splitlines()]
+        self._string_indices = {json.dumps(string): i for i, string in enumerate(self.strings)}
+
+    def _column_path(self, name, extension="bin"):
+        return os.path.join(self.path, f"{name}.{extension}")
+
+    def _string_index(self, string, new_strings):
+        key = json.dumps(string)
+        if key not in self._string_indices:
+            self._string_indices[key] = len(self.strings)
+            self.strings.append(string)
+            new_strings.append(key)
+
+        return self._string_indices[key]
+
+    def _n_entries(self, name, dtype):
+        path = self._column_path(name)
+        return os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+
+    # Number of complete records, i.e. of rows written to all point columns
+    def _n_records(self):
+        return min(self._n_entries(name, dtype) for name, dtype in point_columns.items())
+
+    # Appends to a column, after dropping the entries beyond the first n_entries (or any partially written entry)
+    def _write(self, name, values, extension="bin", n_entries=None):
+        mode = "a" if extension == "jsonl" else "ab"
+        with open(self._column_path(name, extension=extension), mode) as f:
+            if extension == "jsonl":
+                f.write("".join(value + "\n" for value in values))
+            else:
+                f.truncate((f.tell() // values.itemsize if n_entries is None else n_entries) * values.itemsize)
+                f.write(values.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, record):
+        new_strings = []
+        counts = record.get("counts", {}) if record.get("status") == "ok" else {}
+        words, frequencies, n_bits, layout = encode_counts(counts)
+        tally = record.get("tally")
+
+        row = {
+            "n_qubits": record["n_qubits"],
+            "circuit_length": record["circuit_length"],
+            "status": statuses.index(record.get("status", "ok")),
+            "method": self._string_index(record.get("method"), new_strings),
+            "error": self._string_index(record["error"], new_strings) if "error" in record else -1,
+            "shots": record.get("shots", 0),
+            "time_taken": record.get("time_taken", np.nan),
+            "tally_shots": tally["shots"] if tally is not None else 0,
+            "tally_sum": tally["sum"] if tally is not None else 0.0,
+            "tally_sum_sq": tally["sum_sq"] if tally is not None else 0.0,
+            "tally_binary": int(tally["binary"]) if tally is not None else -1,
+            "hist_start": self._n_entries("frequency", histogram_columns["frequency"]),
+            "hist_count": len(frequencies),
+            "word_start": self._n_entries("outcome_words", histogram_columns["outcome_words"]),
+            "n_bits": n_bits,
+            "layout": self._string_index(list(layout), new_strings),
+            "config": self._string_index(record["config"], new_strings) if "config" in record else -1,
+        }
+
+        self._write("frequency", frequencies)
+        self._write("outcome_words", words.reshape(-1))
+        if len(new_strings) > 0:
+            self._write("strings", new_strings, extension="jsonl")
+        # Entries of a partially written row of an earlier crash are overwritten
+        n_records = self._n_records()
+        for name, dtype in point_columns.items():
+            self._write(name, np.array([row[name]], dtype=dtype), n_entries=n_records)
+
+    """
+        Memory-mapped columns of the store.
+        Returns:
+            - columns: dict with an array for each of point_columns (one entry per complete record, in the order of appending) and histogram_columns
+    """
+    def columns(self):
+        n_records = self._n_records()
+
+        columns = {}
+        for name, dtype in list(point_columns.items()) + list(histogram_columns.items()):
+            n_entries = n_records if name in point_columns else self._n_entries(name, dtype)
+            columns[name] = np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(n_entries,)) if n_entries > 0 else np.zeros(0, dtype=dtype)
+
+        return columns
+
+    # Index of the latest record of each (n_qubits, circuit_length) point, where later records override earlier ones
+    def latest_rows(self, columns=None):
+        columns = self.columns() if columns is None else columns
+        points = np.stack([columns["n_qubits"], columns["circuit_length"]], axis=1)
+        _, last_from_end = np.unique(points[::-1], axis=0, return_index=True)
+
+        return np.sort(len(points) - 1 - last_from_end)
+
+    """
+        Columns of the latest successful record of every point, as used by the analysis functions (e.g. Analysis.circuit_scaling_bar3d).
+        Returns:
+            - columns: dict as returned by columns, with the point columns restricted to the latest successful records
+    """
+    def latest_columns(self):
+        columns = self.columns()
+        rows = self.latest_rows(columns)
+        rows = rows[columns["status"][rows] == statuses.index("ok")]
+
+        return {name: (np.asarray(column[rows]) if name in point_columns else column) for name, column in columns.items()}
+
+    def records(self):
+        columns = self.columns()
+
+        records = []
+        for i in range(len(columns["n_qubits"])):
+            record = {
+                "n_qubits": int(columns["n_qubits"][i]),
+                "circuit_length": int(columns["circuit_length"][i]),
+                "method": self.strings[columns["method"][i]],
+                "shots": int(columns["shots"][i]),
+                "status": statuses[columns["status"][i]],
+            }
+            if columns["config"][i] >= 0:
+                record["config"] = self.strings[columns["config"][i]]
+
+            if record["status"] != "ok":
+                record["error"] = self.strings[columns["error"][i]]
+                records.append(record)
+                continue
+
+            start, count = columns["hist_start"][i], columns["hist_count"][i]
+            n_words = int(n_outcome_words(columns["n_bits"][i]))
+            words = columns["outcome_words"][columns["word_start"][i]:columns["word_start"][i] + count*n_words]
+            record["counts"] = decode_counts(words, columns["frequency"][start:start+count], int(columns["n_bits"][i]), self.strings[columns["layout"][i]])
+            record["time_taken"] = float(columns["time_taken"][i])
+            if columns["tally_binary"][i] >= 0:
+                record["tally"] = {
+                    "shots": int(columns["tally_shots"][i]),
+                    "sum": float(columns["tally_sum"][i]),
+                    "sum_sq": float(columns["tally_sum_sq"][i]),
+                    "binary": bool(columns["tally_binary"][i]),
+                }
+            records.append(record)
+
+        return records
+
+"""
+    Columns of sweep data held in memory, in the format of ColumnarSweepStore.latest_columns.
+    Parameters:
+        - data: dict[n_qubits, dict[circuit_length, (result, counts)]], as returned by circuit_scaling_experiment
+    Returns:
+        - columns: dict with the point columns (of the n_qubits, circuit_length, hist_start, hist_count, word_start and n_bits) and histogram columns
+"""
+def columns_from_data(data):
+    rows = {name: [] for name in ["n_qubits", "circuit_length", "hist_start", "hist_count", "word_start", "n_bits"]}
+    frequencies, words = [], []
+    hist_start = word_start = 0
+    for n_qubits, sub_data in data.items():
+        for circuit_length, (_, counts) in sub_data.items():
+            point_words, point_frequencies, n_bits, _ = encode_counts(counts)
+            for name, value in zip(rows, [n_qubits, circuit_length, hist_start, len(point_frequencies), word_start, n_bits]):
+                rows[name].append(value)
+
+            frequencies.append(point_frequencies)
+            words.append(point_words.reshape(-1))
+            hist_start += len(point_frequencies)
+            word_start += point_words.size
+
+    columns = {name: np.array(values, dtype=point_columns[name]) for name, values in rows.items()}
+    columns["frequency"] = np.concatenate(frequencies) if len(frequencies) > 0 else np.zeros(0, dtype=np.int64)
+    columns["outcome_words"] = np.concatenate(words) if len(words) > 0 else np.zeros(0, dtype=np.uint64)
+
+    return columns
+
+# Results store for a path: JSON lines files (*.jsonl) use SweepResultStore, and directories (existing ones or paths without a suffix)
+# are ColumnarSweepStores; any other path raises a ValueError instead of silently picking a format
+def open_result_store(path):
+    path = os.fspath(path)
+    if path.endswith(".jsonl"):
+        return SweepResultStore(path)
+
+    if os.path.isdir(path) or (not os.path.exists(path) and os.path.splitext(path.rstrip(os.sep))[1] == ""):
+        return ColumnarSweepStore(path)
+
+    raise ValueError(f"Unknown results store '{path}', expected a JSON lines file (*.jsonl) or a columnar store directory (without a suffix)")
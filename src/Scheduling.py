@@ -0,0 +1,97 @@
+from qiskit.circuit import Barrier, Store, ControlFlowOp, ForLoopOp, ClassicalRegister
+from qiskit.circuit.classical import expr
+
+# Default instruction durations in nanoseconds, looked up by instruction name and otherwise by the number of qubits ("1q", "2q")
+# Classical instructions (e.g. Store) and barriers take no time
+default_durations = {
+    "1q": 50,
+    "2q": 300,
+    "measure": 1000,
+    "reset": 1000,
+}
+
+def instruction_duration(operation, n_qubits, durations=None):
+    durations = default_durations if durations is None else durations
+
+    if isinstance(operation, (Barrier, Store)) or n_qubits == 0:
+        return 0
+
+    if operation.name in durations:
+        return durations[operation.name]
+
+    return durations["1q"] if n_qubits == 1 else durations["2q"]
+
+# Wires read or written by an instruction, where Store instructions act on the clbits of their expressions rather than on their arguments
+def _instruction_wires(instruction):
+    wires = list(instruction.qubits) + list(instruction.clbits)
+
+    if isinstance(instruction.operation, Store):
+        for node in (instruction.operation.lvalue, instruction.operation.rvalue):
+            for var in expr.iter_vars(node):
+                wires.extend(var.var if isinstance(var.var, ClassicalRegister) else [var.var])
+
+    return wires
+
+"""
+    Critical path of a sequence of instructions scheduled as soon as possible.
+    Only quantum instructions add to the depth and duration, while classical instructions and barriers only order the wires they act on.
+    Control flow counts as a single instruction with the depth and duration of its longest branch (for loops multiply their body by the number of iterations, while loops count a single iteration).
+    Parameters:
+        - instructions: Iterable of CircuitInstructions, e.g. circuit.data or a slice of it
+        - durations: dict of instruction durations as in default_durations
+    Returns:
+        - depth: Number of quantum layers on the critical path
+        - duration: Duration of the critical path
+"""
+def schedule_instructions(instructions, durations=None):
+    depths = {}
+    times = {}
+
+    for instruction in instructions:
+        operation = instruction.operation
+        wires = _instruction_wires(instruction)
+
+        if isinstance(operation, ControlFlowOp):
+            body_schedules = [schedule_instructions(block.data, durations=durations) for block in operation.blocks]
+            depth, duration = max((schedule[0] for schedule in body_schedules), default=0), max((schedule[1] for schedule in body_schedules), default=0)
+
+            if isinstance(operation, ForLoopOp):
+                n_iterations = len(operation.params[0])
+                depth, duration = n_iterations*depth, n_iterations*duration
+        else:
+            depth = 0 if isinstance(operation, (Barrier, Store)) or len(instruction.qubits) == 0 else 1
+            duration = instruction_duration(operation, len(instruction.qubits), durations=durations)
+
+        start_depth = max((depths.get(wire, 0) for wire in wires), default=0)
+        start_time = max((times.get(wire, 0) for wire in wires), default=0)
+        for wire in wires:
+            depths[wire] = start_depth + depth
+            times[wire] = start_time + duration
+
+    return max(depths.values(), default=0), max(times.values(), default=0)
+
+"""
+    Splits the instructions of a circuit into layers which can be applied at the same time, scheduling each instruction as soon as possible.
+    Parameters:
+        - circuit: QuantumCircuit without control flow
+    Returns:
+        - layers: list of layers, each a list of (operation, qubit indices, clbit indices)
+"""
+def asap_layers(circuit):
+    layers = []
+    levels = {}
+
+    for instruction in circuit.data:
+        qubits = [circuit.find_bit(qubit).index for qubit in instruction.qubits]
+        clbits = [circuit.find_bit(clbit).index for clbit in instruction.clbits]
+        wires = [("q", q) for q in qubits] + [("c", c) for c in clbits]
+
+        level = max((levels.get(wire, 0) for wire in wires), default=0)
+        if level == len(layers):
+            layers.append([])
+
+        layers[level].append((instruction.operation, qubits, clbits))
+        for wire in wires:
+            levels[wire] = level + 1
+
+    return layers
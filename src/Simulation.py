@@ -0,0 +1,323 @@
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+from qiskit import QuantumCircuit, transpile
+from qiskit.circuit import ControlledGate, ControlFlowOp, Store
+from qiskit.circuit.library import get_standard_gate_name_mapping
+from qiskit_aer import AerSimulator
+
+# Gates which map Pauli operators to Pauli operators and can therefore be run on a stabilizer (tableau) simulator
+clifford_gate_names = {
+    "id", "x", "y", "z", "h", "s", "sdg", "sx", "sxdg", "pauli",
+    "cx", "cy", "cz", "swap", "iswap", "ecr", "dcx",
+}
+pauli_gate_names = {"id", "x", "y", "z", "pauli"}
+
+# Single-parameter rotations which are Clifford whenever their angle is a multiple of pi/2
+clifford_rotation_names = {"rx", "ry", "rz", "p", "u1"}
+
+# Non-unitary and classical instructions which the stabilizer simulator handles natively
+stabilizer_compatible_names = {
+    "measure", "reset", "barrier", "delay", "store", "break_loop", "continue_loop",
+}
+
+# Noise instructions which keep a noise model within the Pauli (plus reset) channel family
+pauli_noise_names = pauli_gate_names | {"reset"}
+
+def _is_clifford_angle(angle):
+    try:
+        angle = float(angle)
+    except TypeError:
+        # Unbound parameters cannot be checked
+        return False
+
+    return np.isclose(np.mod(angle, np.pi/2), 0) or np.isclose(np.mod(angle, np.pi/2), np.pi/2)
+
+# Checks whether an operation only consists of Pauli gates, e.g. LogicalXGate or LogicalZGate
+def _is_pauli_operation(operation, memo):
+    key = ("pauli", id(operation))
+    if key in memo:
+        return memo[key][0]
+
+    if operation.name in pauli_gate_names:
+        is_pauli = True
+    elif getattr(operation, "definition", None) is not None and not isinstance(operation, ControlledGate):
+        is_pauli = all(_is_pauli_operation(inst.operation, memo) for inst in operation.definition.data)
+    else:
+        is_pauli = False
+
+    # Qiskit may build a new operation object on every access to circuit.data, so the memo keeps the operation alive to keep its id from being reused
+    memo[key] = (is_pauli, operation)
+    return is_pauli
+
+# Checks whether a (non control flow) operation is Clifford, recursing into custom gate definitions
+def _is_clifford_operation(operation, memo):
+    key = ("clifford", id(operation))
+    if key in memo:
+        return memo[key][0]
+
+    if operation.name in clifford_gate_names or operation.name in stabilizer_compatible_names:
+        is_clifford = True
+    elif operation.name in clifford_rotation_names:
+        is_clifford = _is_clifford_angle(operation.params[0])
+    elif isinstance(operation, ControlledGate):
+        # A singly-controlled Pauli product (e.g. a controlled logical operator) is
+        # Clifford, whereas any multiply-controlled non-trivial operation (e.g. LogicalXGate.control(7)) is not
+        is_clifford = operation.num_ctrl_qubits == 1 and _is_pauli_operation(operation.base_gate, memo)
+    elif getattr(operation, "definition", None) is not None:
+        is_clifford = all(_is_clifford_operation(inst.operation, memo) for inst in operation.definition.data)
+    else:
+        is_clifford = False
+
+    # The operation is kept alive as in _is_pauli_operation
+    memo[key] = (is_clifford, operation)
+    return is_clifford
+
+"""
+    Find all instructions of a circuit which prevent it from being run on a stabilizer simulator.
+    Control flow blocks (e.g. the IfElseOps emitted by LogicalCircuit) are searched recursively, while custom gates (e.g. LogicalHGate) are reported as a whole.
+    Parameters:
+        - circuit: QuantumCircuit or LogicalCircuit to inspect
+    Returns:
+        - non_clifford_instructions: list of dicts with the name, label, qubit indices and control flow location of each offending instruction
+"""
+def find_non_clifford_instructions(circuit, _root=None, _location=None, _memo=None):
+    root = circuit if _root is None else _root
+    location = [] if _location is None else _location
+    memo = {} if _memo is None else _memo
+
+    non_clifford_instructions = []
+    for i, circuit_instruction in enumerate(circuit.data):
+        operation = circuit_instruction.operation
+
+        if isinstance(operation, ControlFlowOp):
+            for b, block in enumerate(operation.blocks):
+                non_clifford_instructions += find_non_clifford_instructions(block, root, location + [(i, operation.name, b)], memo)
+        elif not _is_clifford_operation(operation, memo):
+            try:
+                qubits = [root.find_bit(qubit).index for qubit in circuit_instruction.qubits]
+            except Exception:
+                qubits = [circuit.find_bit(qubit).index for qubit in circuit_instruction.qubits]
+
+            label = getattr(operation, "label", None)
+            if label is None and isinstance(operation, ControlledGate) and operation.base_gate.label is not None:
+                label = f"C^{operation.num_ctrl_qubits}({operation.base_gate.label})"
+
+            non_clifford_instructions.append({
+                "name": operation.name,
+                "label": label,
+                "qubits": qubits,
+                "location": location + [(i, operation.name, None)],
+            })
+
+    return non_clifford_instructions
+
+"""
+    Find all errors of a noise model which are not Pauli (or reset) channels.
+    Parameters:
+        - noise_model: Qiskit Aer NoiseModel to inspect
+    Returns:
+        - non_pauli_errors: list of dicts with the instruction name, qubits (None for all-qubit errors) and offending error operations
+"""
+def find_non_pauli_errors(noise_model):
+    if noise_model is None:
+        return []
+
+    non_pauli_errors = []
+
+    # The serialized noise model lists every quantum error with the instructions it applies to, and the qubits for local errors
+    checked = {}
+    for error in noise_model.to_dict()["errors"]:
+        if error["type"] != "qerror":
+            continue
+
+        # Noise models typically share the same QuantumError across many qubits, so each error is only inspected once
+        if error["id"] not in checked:
+            checked[error["id"]] = sorted({
+                inst["name"] for circuit in error["instructions"] for inst in circuit
+                if inst["name"] not in pauli_noise_names
+            })
+
+        if len(checked[error["id"]]) > 0:
+            for name in error["operations"]:
+                for qubits in error.get("gate_qubits", [None]):
+                    non_pauli_errors.append({"instruction": name, "qubits": qubits, "error_ops": checked[error["id"]]})
+
+    return non_pauli_errors
+
+"""
+    Select the Aer simulation method for a circuit and noise model.
+    Circuits which only contain Clifford operations, measurements, resets and classical control flow, subject to Pauli noise, are routed to the stabilizer (tableau) simulator, whose cost scales polynomially with the number of qubits.
+    Parameters:
+        - circuit: QuantumCircuit or LogicalCircuit to be simulated
+        - noise_model: Qiskit Aer NoiseModel, or None for noiseless simulation
+        - fallback_method: Aer method used whenever the stabilizer simulator cannot be used
+        - verbose: If true, the instructions and errors forcing a fallback are printed
+    Returns:
+        - method: Name of the selected Aer simulation method
+        - report: dict with the selected method and the offending instructions and errors
+"""
+def select_simulation_method(circuit, noise_model=None, fallback_method="statevector", verbose=False):
+    non_clifford_instructions = find_non_clifford_instructions(circuit)
+    non_pauli_errors = find_non_pauli_errors(noise_model)
+
+    method = "stabilizer" if len(non_clifford_instructions) == 0 and len(non_pauli_errors) == 0 else fallback_method
+
+    if verbose and method != "stabilizer":
+        print(f"Circuit cannot be run with the stabilizer method, falling back to '{fallback_method}':")
+        summary = {}
+        for inst in non_clifford_instructions:
+            key = inst["name"] if inst["label"] is None else f"{inst['name']} ({inst['label']})"
+            summary[key] = summary.get(key, 0) + 1
+        for key, count in summary.items():
+            print(f"    - non-Clifford instruction '{key}' x{count}")
+        for error_ops in sorted({tuple(err["error_ops"]) for err in non_pauli_errors}):
+            print(f"    - non-Pauli noise consisting of {list(error_ops)}")
+
+    report = {
+        "method": method,
+        "non_clifford_instructions": non_clifford_instructions,
+        "non_pauli_errors": non_pauli_errors,
+    }
+
+    return method, report
+
+# Names of Qiskit standard gates, which are fully identified by their name and parameters
+_standard_gate_names = set(get_standard_gate_name_mapping())
+
+def _operation_structure(operation, memo):
+    key = id(operation)
+    if key in memo:
+        return memo[key][0]
+
+    params = tuple(repr(param) for param in operation.params if not isinstance(param, QuantumCircuit))
+    structure = (operation.name, operation.num_qubits, operation.num_clbits, params, getattr(operation, "label", None))
+
+    if isinstance(operation, ControlFlowOp):
+        structure += tuple(circuit_structure_hash(block, memo) for block in operation.blocks)
+        structure += (repr(getattr(operation, "condition", None)),)
+    elif operation.name == "store":
+        structure += (repr(operation.lvalue), repr(operation.rvalue))
+    elif operation.name not in _standard_gate_names and getattr(operation, "definition", None) is not None:
+        # Custom gates (e.g. logical gates) may share a name with different definitions
+        structure += (circuit_structure_hash(operation.definition, memo),)
+
+    # The operation is kept alive as in _is_pauli_operation
+    memo[key] = (structure, operation)
+    return structure
+
+"""
+    Hash of the structure of a circuit, i.e. its registers, instructions, operands and parameters, such that structurally identical circuits built separately share a hash.
+    Parameters:
+        - circuit: QuantumCircuit or LogicalCircuit
+    Returns:
+        - structure_hash: hex digest
+"""
+def circuit_structure_hash(circuit, _memo=None):
+    memo = {} if _memo is None else _memo
+
+    digest = hashlib.sha256()
+    digest.update(repr((
+        circuit.num_qubits, circuit.num_clbits, repr(circuit.global_phase),
+        [(creg.name, creg.size) for creg in circuit.cregs],
+    )).encode())
+
+    for circuit_instruction in circuit.data:
+        digest.update(repr((
+            _operation_structure(circuit_instruction.operation, memo),
+            [circuit.find_bit(qubit).index for qubit in circuit_instruction.qubits],
+            [circuit.find_bit(clbit).index for clbit in circuit_instruction.clbits],
+        )).encode())
+
+    return digest.hexdigest()
+
+# Aer simulation methods which apply gate fusion
+fusion_methods = {"automatic", "statevector", "density_matrix", "unitary", "superop", "tensor_network"}
+
+# Whether a circuit writes classical bits with Store instructions, including inside control flow bodies
+def has_classical_stores(circuit):
+    for circuit_instruction in circuit.data:
+        operation = circuit_instruction.operation
+        if isinstance(operation, Store):
+            return True
+        if isinstance(operation, ControlFlowOp) and any(has_classical_stores(block) for block in operation.blocks if block is not None):
+            return True
+
+    return False
+
+"""
+    Options to pass to AerSimulator.run for a circuit.
+    With gate fusion enabled, Aer only allocates classical memory up to the highest clbit written by a measurement, so Store instructions
+    writing a higher clbit fail with "invalid cbit index" (e.g. the output register of a LogicalCircuit with several logical qubits).
+    Fusion is therefore disabled for circuits with stores, which only affects the methods that fuse gates.
+    Parameters:
+        - circuit: QuantumCircuit or LogicalCircuit to be simulated
+        - method: Aer simulation method
+    Returns:
+        - options: dict of run options
+"""
+def aer_run_options(circuit, method):
+    if method in fusion_methods and has_classical_stores(circuit):
+        return {"fusion_enable": False}
+
+    return {}
+
+"""
+    Simulation session which keeps AerSimulators and transpiled circuits alive between benchmark runs.
+    Simulators are kept per (method, noise model) and transpiled circuits per circuit structure and transpilation target, so that
+    sweeps which only vary shots or noise strength do not pay for transpilation again.
+    Parameters:
+        - max_simulators: Maximum number of cached simulators
+        - max_transpiled_circuits: Maximum number of cached transpiled circuits
+"""
+class SimulationSession:
+    def __init__(self, max_simulators=16, max_transpiled_circuits=128):
+        self.max_simulators = max_simulators
+        self.max_transpiled_circuits = max_transpiled_circuits
+
+        self._simulators = OrderedDict()
+        self._transpiled_circuits = OrderedDict()
+
+        self.transpile_cache_hits = 0
+        self.transpile_cache_misses = 0
+
+    @staticmethod
+    def _evict(cache, max_size):
+        while max_size is not None and len(cache) > max_size:
+            cache.popitem(last=False)
+
+    def simulator(self, method="automatic", noise_model=None):
+        # Noise models are keyed by identity, and kept alive by the cache entry so that their id cannot be reused
+        key = (method, id(noise_model))
+        if key in self._simulators:
+            self._simulators.move_to_end(key)
+        else:
+            self._simulators[key] = (AerSimulator(method=method, noise_model=noise_model), noise_model)
+            self._evict(self._simulators, self.max_simulators)
+
+        return self._simulators[key][0]
+
+    # The simulator target is already fully coupled, whereas passing a coupling map alongside it lays the circuit out over every qubit
+    # the simulator supports, which makes each stabilizer shot allocate a tableau over thousands of qubits
+    def transpile(self, circuit, simulator, optimization_level=0):
+        noise_model = simulator.options.noise_model
+        basis_gates = tuple(sorted(noise_model.basis_gates)) if noise_model is not None else None
+        key = (circuit_structure_hash(circuit), simulator.options.method, basis_gates, optimization_level)
+
+        if key in self._transpiled_circuits:
+            self._transpiled_circuits.move_to_end(key)
+            self.transpile_cache_hits += 1
+        else:
+            self._transpiled_circuits[key] = transpile(circuit, simulator, optimization_level=optimization_level)
+            self._evict(self._transpiled_circuits, self.max_transpiled_circuits)
+            self.transpile_cache_misses += 1
+
+        return self._transpiled_circuits[key]
+
+    def clear(self):
+        self._simulators.clear()
+        self._transpiled_circuits.clear()
+
+# Session used by benchmark_noise when none is given, which is separate for each (worker) process
+default_session = SimulationSession()
@@ -0,0 +1,277 @@
+import math
+import itertools
+import numpy as np
+
+from PauliFrame import PauliFrameSampler, _NoiseLookup, noiseless_logical_output
+
+# Subset sampling (Bravyi and Vargo, 2013): the fault locations of a circuit are grouped into classes of identical channels, and the logical
+# error rate is written as a sum over fault configurations w = (w_1, ..., w_C), with w_c faults among the N_c locations of class c:
+#
+#     P_L(p) = sum_w  prod_c Binom(w_c; N_c, p_c) * A_w
+#
+# where A_w is the failure rate given exactly those fault counts, which does not depend on the physical error rates p. Each A_w is
+# estimated by injecting w_c faults at uniformly chosen locations of each class, so that one set of stratum runs yields the logical
+# error rate (and a confidence interval) for any physical error rates by reweighting analytically.
+#
+# Locations inside conditionally executed blocks (e.g. the unflagged syndrome extraction) are counted whether or not a shot executes them,
+# which keeps the fault variables of all locations independent and the estimate unbiased: a fault in a block that is skipped has no effect.
+
+def _log_binomial_pmf(w, N, p):
+    if p <= 0:
+        return 0.0 if w == 0 else -math.inf
+    if p >= 1:
+        return 0.0 if w == N else -math.inf
+
+    return math.lgamma(N + 1) - math.lgamma(w + 1) - math.lgamma(N - w + 1) + w*math.log(p) + (N - w)*math.log1p(-p)
+
+# Draws w distinct indices out of range(N) for each shot, as an (n_shots, w) array
+def _choose_distinct(rng, n_shots, N, w):
+    choices = rng.integers(N, size=(n_shots, w))
+    while True:
+        sorted_choices = np.sort(choices, axis=1)
+        duplicate = (sorted_choices[:, 1:] == sorted_choices[:, :-1]).any(axis=1)
+        if not duplicate.any():
+            return choices
+        choices[duplicate] = rng.integers(N, size=(int(duplicate.sum()), w))
+
+# Fault configurations w with at most max_faults faults in total and at most N_c faults in class c, generated from the multisets of at most
+# max_faults class indices, so that the work grows with the number of such configurations instead of with (max_faults+1)^n_classes
+def _fault_configurations(class_sizes, max_faults):
+    for total in range(max_faults + 1):
+        for classes in itertools.combinations_with_replacement(range(len(class_sizes)), total):
+            w = [0]*len(class_sizes)
+            for c in classes:
+                w[c] += 1
+            if all(w_c <= N_c for w_c, N_c in zip(w, class_sizes)):
+                yield tuple(w)
+
+# Groups (location, shot, term) triples into the fault injection format of PauliFrameSampler.sample
+def _faults_by_location(locations, shots, terms=None):
+    order = np.lexsort((shots, locations))
+    locations, shots = locations[order], shots[order]
+    terms = None if terms is None else terms[order]
+
+    boundaries = np.flatnonzero(np.diff(locations)) + 1
+    starts, stops = np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(locations)]])
+
+    return {
+        int(locations[start]): (shots[start:stop], None if terms is None else terms[start:stop])
+        for start, stop in zip(starts, stops) if stop > start
+    }
+
+class SubsetSampler:
+    """
+    Fault-count-stratified estimator of the logical error rate of a LogicalCircuit under Pauli noise.
+    Parameters:
+        - logical_circuit: LogicalCircuit ending in logical measurements (e.g. encode, perform_qec_cycle and measure)
+        - noise_model: Qiskit Aer NoiseModel containing only Pauli errors and symmetric readout errors, which defines the fault locations and
+                       the distribution of Pauli errors at each location (the error rates themselves only enter through reweighting)
+        - expected_output: Expected logical outputs (one bit per logical qubit), by default those of a noiseless run
+        - seed: Seed of the random number generator
+    """
+
+    def __init__(self, logical_circuit, noise_model, expected_output=None, seed=None):
+        self.logical_circuit = logical_circuit
+        self.sampler = PauliFrameSampler(logical_circuit, noise_model=noise_model, seed=seed)
+        self.rng = self.sampler.rng
+
+        if self.sampler.has_unnumbered_locations:
+            raise ValueError("Subset sampling requires a fixed set of fault locations, but the circuit contains while loops")
+
+        self.expected_output = noiseless_logical_output(logical_circuit, seed=seed) if expected_output is None else np.asarray(expected_output, dtype=np.uint8)
+
+        # Locations with identical channels form a class
+        classes = {}
+        self.location_classes = np.zeros(len(self.sampler.locations), dtype=np.int64)
+        for l, (key, channel) in enumerate(self.sampler.locations):
+            class_key = self._class_key(key, channel)
+            if class_key not in classes:
+                classes[class_key] = len(classes)
+            self.location_classes[l] = classes[class_key]
+
+        self.class_keys = list(classes)
+        self.class_locations = [np.flatnonzero(self.location_classes == c) for c in range(len(classes))]
+        self.class_sizes = [len(locations) for locations in self.class_locations]
+        self.class_instructions = [sorted({self.sampler.locations[l][0][1] if self.sampler.locations[l][0][0] == "quantum" else "readout" for l in locations}) for locations in self.class_locations]
+
+    @staticmethod
+    def _class_key(key, channel):
+        if key[0] == "readout":
+            p10, p01 = channel
+            if not np.isclose(p10, p01):
+                raise ValueError("Subset sampling only supports symmetric readout errors")
+            return ("readout", p10)
+
+        # Conditional probabilities are rounded, since channels built for different error rates differ in the last digits
+        p_total, probabilities, term_x, term_z = channel
+        return ("quantum", p_total, np.round(probabilities, 12).tobytes(), term_x.tobytes(), term_z.tobytes())
+
+    # Failures among shots with the given faults injected
+    def _count_failures(self, shots, faults, weights=None):
+        outputs = self.logical_circuit.get_logical_outputs(self.sampler.sample(shots, faults=faults))
+        failed = (outputs != self.expected_output).any(axis=1)
+        return float(failed.sum()) if weights is None else float(weights[failed].sum())
+
+    def _sample_stratum(self, w, shots, batch_size):
+        failures = 0.0
+        for start in range(0, shots, batch_size):
+            n = min(batch_size, shots - start)
+
+            locations, shot_indices = [], []
+            for c, w_c in enumerate(w):
+                if w_c == 0:
+                    continue
+                choices = _choose_distinct(self.rng, n, self.class_sizes[c], w_c)
+                locations.append(self.class_locations[c][choices].ravel())
+                shot_indices.append(np.repeat(np.arange(n), w_c))
+
+            failures += self._count_failures(n, _faults_by_location(np.concatenate(locations), np.concatenate(shot_indices)))
+
+        return failures
+
+    # Exact failure rate of single faults of a class, by injecting every Pauli term at every location once
+    def _enumerate_single_faults(self, c, batch_size):
+        locations, terms, weights = [], [], []
+        for l in self.class_locations[c]:
+            key, channel = self.sampler.locations[l]
+            probabilities = np.ones(1) if key[0] == "readout" else channel[1]
+            locations.append(np.full(len(probabilities), l))
+            terms.append(np.arange(len(probabilities)))
+            weights.append(probabilities/self.class_sizes[c])
+        locations, terms, weights = np.concatenate(locations), np.concatenate(terms), np.concatenate(weights)
+
+        failure_rate = 0.0
+        for start in range(0, len(locations), batch_size):
+            stop = min(start + batch_size, len(locations))
+            shot_indices = np.arange(stop - start)
+            failure_rate += self._count_failures(stop - start, _faults_by_location(locations[start:stop], shot_indices, terms[start:stop]), weights[start:stop])
+
+        return failure_rate
+
+    """
+        Estimate the failure rate of every fault configuration with at most max_faults faults.
+        Parameters:
+            - max_faults: Largest total number of faults which is sampled, higher configurations only enter through the truncation bound
+            - shots_per_stratum: Number of shots per sampled fault configuration
+            - enumerate_single_faults: If true, configurations with a single fault are enumerated exactly instead of sampled
+            - batch_size: Number of shots simulated at once
+        Returns:
+            - result: SubsetSamplingResult
+    """
+    def run(self, max_faults=3, shots_per_stratum=10**4, enumerate_single_faults=True, batch_size=2**16):
+        strata = {}
+
+        for w in _fault_configurations(self.class_sizes, max_faults):
+            total = sum(w)
+            if total == 0:
+                # Without faults, the circuit always produces the expected output
+                strata[w] = {"shots": 1, "failures": 0.0, "exact": True}
+            elif total == 1 and enumerate_single_faults:
+                strata[w] = {"shots": 1, "failures": self._enumerate_single_faults(w.index(1), batch_size), "exact": True}
+            else:
+                strata[w] = {"shots": shots_per_stratum, "failures": self._sample_stratum(w, shots_per_stratum, batch_size), "exact": False}
+
+        return SubsetSamplingResult(self, strata, max_faults)
+
+    """
+        Fault probability of each class under a noise model of the same structure as the one used for sampling.
+        Parameters:
+            - noise_model: Qiskit Aer NoiseModel, whose errors must have the same Pauli distribution (given a fault) as the sampled model
+        Returns:
+            - fault_probabilities: list with the probability of a fault at a location of each class
+    """
+    def fault_probabilities(self, noise_model):
+        noise = _NoiseLookup(noise_model)
+        fault_probabilities = []
+        for c, locations in enumerate(self.class_locations):
+            probabilities = set()
+            for l in locations:
+                key = self.sampler.locations[l][0]
+                if key[0] == "readout":
+                    channel = noise.readout_flips(key[1])
+                    p = 0.0 if channel is None else channel[0]
+                    class_key = None if channel is None else ("readout", p)
+                else:
+                    channel = noise.quantum_channel(key[1], list(key[2]))
+                    p = 0.0 if channel is None else channel[0]
+                    class_key = None if channel is None else self._class_key(key, channel)
+
+                if class_key is not None and class_key[2:] != self.class_keys[c][2:]:
+                    raise ValueError(f"The noise model changes the distribution of errors on {self.class_instructions[c]}, which cannot be reweighted")
+                probabilities.add(round(p, 15))
+
+            if len(probabilities) > 1:
+                raise ValueError(f"The noise model assigns different error rates to the locations of class {c} ({self.class_instructions[c]})")
+            fault_probabilities.append(probabilities.pop())
+
+        return fault_probabilities
+
+class SubsetSamplingResult:
+    """
+    Stratum estimates of a SubsetSampler, which are reweighted into logical error rates for any physical error rates
+    """
+
+    def __init__(self, subset_sampler, strata, max_faults):
+        self.subset_sampler = subset_sampler
+        self.strata = strata
+        self.max_faults = max_faults
+        self.class_sizes = subset_sampler.class_sizes
+        self.class_instructions = subset_sampler.class_instructions
+
+    """
+        Logical error rate for the given physical error rates.
+        Parameters:
+            - noise_model: Qiskit Aer NoiseModel of the same structure as the sampled one (e.g. built with different parameters by construct_noise_model)
+            - fault_probabilities: Alternatively, the fault probability of each class (see SubsetSampler.fault_probabilities)
+            - z: Number of standard errors covered by the confidence interval
+        Returns:
+            - estimate: dict with the logical error rate, its standard error, the probability of unsampled fault configurations and the
+                        confidence interval, whose upper bound assumes that all unsampled configurations fail
+    """
+    def logical_error_rate(self, noise_model=None, fault_probabilities=None, z=1.96):
+        if fault_probabilities is None:
+            if noise_model is None:
+                raise ValueError("Either noise_model or fault_probabilities must be provided")
+            fault_probabilities = self.subset_sampler.fault_probabilities(noise_model)
+
+        rate, variance, sampled_weight = 0.0, 0.0, 0.0
+        for w, stratum in self.strata.items():
+            weight = math.exp(sum(_log_binomial_pmf(w_c, N_c, p_c) for w_c, N_c, p_c in zip(w, self.class_sizes, fault_probabilities)))
+            sampled_weight += weight
+
+            failure_rate = stratum["failures"]/stratum["shots"]
+            rate += weight*failure_rate
+            if not stratum["exact"]:
+                # Laplace smoothing keeps strata without observed failures from claiming zero variance
+                smoothed = (stratum["failures"] + 1)/(stratum["shots"] + 2)
+                variance += weight**2*smoothed*(1 - smoothed)/stratum["shots"]
+
+        truncation = max(0.0, 1.0 - sampled_weight)
+        std_error = math.sqrt(variance)
+
+        return {
+            "logical_error_rate": rate,
+            "std_error": std_error,
+            "truncation": truncation,
+            "lower": max(0.0, rate - z*std_error),
+            "upper": min(1.0, rate + z*std_error + truncation),
+        }
+
+    # Logical error rates over a sweep of noise models, e.g. [construct_noise_model(depolarizing_error_2q=p, ...) for p in ps]
+    def sweep(self, noise_models, z=1.96):
+        return [self.logical_error_rate(noise_model=noise_model, z=z) for noise_model in noise_models]
+
+"""
+    Estimate logical error rates of a LogicalCircuit with subset sampling.
+    Parameters:
+        - logical_circuit: LogicalCircuit ending in logical measurements
+        - noise_model: Qiskit Aer NoiseModel defining the fault locations and error distributions
+        - max_faults, shots_per_stratum, enumerate_single_faults, batch_size: See SubsetSampler.run
+        - expected_output: Expected logical outputs, by default those of a noiseless run
+        - seed: Seed of the random number generator
+    Returns:
+        - result: SubsetSamplingResult, to be evaluated with result.logical_error_rate(noise_model) or result.sweep(noise_models)
+"""
+def subset_sample(logical_circuit, noise_model, max_faults=3, shots_per_stratum=10**4, enumerate_single_faults=True, batch_size=2**16, expected_output=None, seed=None):
+    subset_sampler = SubsetSampler(logical_circuit, noise_model, expected_output=expected_output, seed=seed)
+    return subset_sampler.run(max_faults=max_faults, shots_per_stratum=shots_per_stratum, enumerate_single_faults=enumerate_single_faults, batch_size=batch_size)
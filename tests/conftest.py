@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules in src are imported flat, as in the notebooks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# Stabilizer tableau of the Steane [[7,1,3]] code
+STEANE_TABLEAU = ["XXXXIII", "IXXIXXI", "IIXXIXX", "ZZZZIII", "IZZIZZI", "IIZZIZZ"]
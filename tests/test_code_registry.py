@@ -0,0 +1,53 @@
+import pytest
+
+import CodeRegistry
+from CodeRegistry import CodeRegistry as Registry
+
+LABEL, TABLEAU = (2, 0, 2), ["XX", "ZZ"]
+
+class Factory:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+def test_registry_evicts_least_recently_used_codes():
+    registry = Registry(max_codes=2)
+    for n in range(3):
+        registry.get((n, 0, 2), TABLEAU, "code", Factory(n))
+    registry.get((1, 0, 2), TABLEAU, "code", Factory(1))
+    registry.get((3, 0, 2), TABLEAU, "code", Factory(3))
+
+    assert len(registry) == 2
+    assert ((1, 0, 2), TABLEAU) in registry and ((3, 0, 2), TABLEAU) in registry
+
+def test_registry_values_are_shared_and_read_only():
+    registry = Registry()
+    factory = Factory({"gate": 1})
+    value = registry.get(LABEL, TABLEAU, "gates", factory)
+
+    assert registry.get(LABEL, TABLEAU, "gates", factory) is value and factory.calls == 1
+    with pytest.raises(TypeError):
+        value["gate"] = 2
+
+def test_registry_persists_to_disk(tmp_path):
+    Registry(cache_dir=str(tmp_path)).get(LABEL, TABLEAU, "decoder", Factory([1, 2]), persist=True)
+
+    # A fresh registry (e.g. in another process) loads the object instead of building it
+    factory = Factory([3])
+    assert Registry(cache_dir=str(tmp_path)).get(LABEL, TABLEAU, "decoder", factory, persist=True) == [1, 2]
+    assert factory.calls == 0
+
+    # Entries are not persisted without persist and are rebuilt for another tableau
+    assert Registry(cache_dir=str(tmp_path)).get(LABEL, ["ZZ", "XX"], "decoder", factory, persist=True) == [3]
+
+def test_registry_rebuilds_entries_of_other_versions(tmp_path, monkeypatch):
+    Registry(cache_dir=str(tmp_path)).get(LABEL, TABLEAU, "decoder", Factory([1]), persist=True)
+
+    monkeypatch.setattr(CodeRegistry, "cache_format_version", CodeRegistry.cache_format_version + 1)
+    factory = Factory([2])
+    assert Registry(cache_dir=str(tmp_path)).get(LABEL, TABLEAU, "decoder", factory, persist=True) == [2]
+    assert factory.calls == 1
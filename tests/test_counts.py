@@ -0,0 +1,34 @@
+import numpy as np
+
+from Counts import EncodedCounts, encode_counts, decode_counts, pack_bits, unpack_bits
+
+# Outputs of three registers, the widest of which spans two outcome words
+COUNTS = {"101 " + "0"*69 + "1 01": 3, "000 " + "1"*70 + " 10": 5, "111 " + "0"*70 + " 00": 2}
+
+def test_counts_round_trip():
+    words, frequencies, n_bits, layout = encode_counts(COUNTS)
+
+    assert words.shape == (3, 2) and n_bits == 75 and layout == (3, 70, 2)
+    assert decode_counts(words, frequencies, n_bits, layout) == COUNTS
+    assert EncodedCounts.from_counts(COUNTS).to_dict() == COUNTS
+
+def test_pack_bits_round_trip():
+    bits = np.random.default_rng(0).integers(0, 2, size=(10, 130), dtype=np.uint8)
+    assert np.array_equal(unpack_bits(pack_bits(bits), 130), bits)
+
+def test_marginal_counts():
+    counts = EncodedCounts.from_counts({"1 01": 3, "1 11": 1, "0 01": 4}, register_names=["syndrome", "output"])
+
+    assert counts.marginal(["output"]).to_dict() == {"1": 4, "0": 4}
+    assert counts.marginal(["syndrome"]).to_dict() == {"01": 7, "11": 1}
+    # Clbits form a single register in the given order
+    assert counts.marginal([2, 1]).to_dict() == {"01": 3, "11": 1, "00": 4}
+
+def test_counts_statistics():
+    counts = EncodedCounts.from_counts({"11": 1, "10": 2, "00": 1})
+
+    assert counts.shots == 4
+    assert counts.exp_val() == 1.0
+    assert counts.parity() == 0.0
+    assert counts.parity([1]) == -0.5
+    assert counts.probability("10") == 0.5
@@ -0,0 +1,72 @@
+import itertools
+import numpy as np
+from qiskit.circuit.library import IGate
+from qiskit_aer.noise import NoiseModel, depolarizing_error
+
+from conftest import STEANE_TABLEAU
+from Decoding import pauli_symplectic, symplectic_product
+from Logical import LogicalCircuit
+from PauliFrame import PauliFrameSampler
+
+def test_lookup_table_corrects_single_qubit_errors():
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    decoder = circuit.decoder
+    stabilizers = list(range(len(STEANE_TABLEAU)))
+    corrections = decoder.corrections(stabilizers)
+
+    assert len(corrections) == 2**len(STEANE_TABLEAU)
+    for j in range(decoder.n):
+        for pauli in ["X", "Y", "Z"]:
+            error = np.zeros(2*decoder.n, dtype=np.uint8)
+            error[j], error[decoder.n+j] = pauli_symplectic[pauli]
+            residual = error ^ corrections[decoder.syndrome(error, stabilizers)]
+
+            # The correction leaves a stabilizer, which commutes with the stabilizers and logical operators
+            assert not any(symplectic_product(decoder.S, residual.reshape(1, -1)).ravel())
+            assert all(int(symplectic_product(residual, logical)) == 0 for logical in decoder.logicals)
+
+# Every data qubit gets an identity before each QEC cycle, at which single-qubit errors are injected
+def identity_faults_circuit(offline_decoding, n_cycles=2):
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU, offline_decoding=offline_decoding)
+    circuit.encode(0)
+    for _ in range(n_cycles):
+        for qubit in circuit.logical_qregs[0]:
+            circuit.append(IGate(), [qubit])
+        circuit.perform_qec_cycle()
+    circuit.measure([0], [0])
+    return circuit
+
+# Injects all 196 pairs of single-qubit X or Z data errors, each followed by a QEC cycle, and checks that offline and online decoding
+# both correct every pair
+def test_offline_decoding_matches_online_decoding():
+    noise_model = NoiseModel()
+    noise_model.add_all_qubit_quantum_error(depolarizing_error(0.1, 1), ["id"])
+    errors = [(j, pauli) for j in range(7) for pauli in ["X", "Z"]]
+    pairs = list(itertools.product(errors, repeat=2))
+
+    outputs = {}
+    for offline_decoding in [False, True]:
+        circuit = identity_faults_circuit(offline_decoding)
+        sampler = PauliFrameSampler(circuit, noise_model)
+
+        # Identity locations in program order, i.e. one layer of the data qubits per QEC cycle
+        locations = [l for l, (key, _) in enumerate(sampler.locations) if key[:2] == ("quantum", "id")]
+        data_qubits = [circuit.find_bit(qubit).index for qubit in circuit.logical_qregs[0]]
+        assert len(locations) == 2*len(data_qubits)
+
+        faults = {}
+        for shot, pair in enumerate(pairs):
+            for cycle, (j, pauli) in enumerate(pair):
+                location = locations[cycle*len(data_qubits) + j]
+                assert sampler.locations[location][0][2] == (data_qubits[j],)
+                _, _, term_x, term_z = sampler.locations[location][1]
+                term = [t for t in range(len(term_x)) if (term_x[t, 0], term_z[t, 0]) == tuple(pauli_symplectic[pauli])][0]
+
+                shots, terms = faults.get(location, ([], []))
+                faults[location] = (shots + [shot], terms + [term])
+
+        faults = {location: (np.array(shots), np.array(terms)) for location, (shots, terms) in faults.items()}
+        outputs[offline_decoding] = circuit.get_logical_outputs(sampler.sample(len(pairs), faults=faults))[:, 0]
+
+    assert np.all(outputs[False] == 0)
+    assert np.all(outputs[True] == outputs[False])
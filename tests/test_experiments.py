@@ -0,0 +1,83 @@
+import pytest
+from qiskit import QuantumCircuit
+
+import Experiments
+from Experiments import benchmark_noise, circuit_scaling_experiment
+from NoiseModel import construct_noise_model
+from ResultStore import open_result_store
+
+# Circuit whose expectation value is exactly 0, so that a relative precision can never be reached
+def zero_circuit(n_qubits, circuit_length):
+    circuit = QuantumCircuit(n_qubits)
+    circuit.id(range(n_qubits))
+    circuit.measure_all()
+    return circuit
+
+def noiseless_model(n_qubits):
+    return construct_noise_model(n_qubits=n_qubits, depolarizing_error_1q=0.0, depolarizing_error_2q=0.0)
+
+def test_benchmark_noise_precision_requires_bound():
+    with pytest.raises(ValueError):
+        benchmark_noise(zero_circuit(2, 1), noise_model=noiseless_model(2), method="stabilizer", precision=0.1)
+
+def test_benchmark_noise_relative_precision_of_zero_estimate_terminates():
+    _, counts = benchmark_noise(zero_circuit(2, 1), noise_model=noiseless_model(2), method="stabilizer", shots=16,
+                                target="exp_val", precision=0.1, relative_precision=True, max_shots=100)
+
+    assert counts == {"00": 100}
+
+def test_circuit_scaling_experiment_precision_requires_bound():
+    with pytest.raises(ValueError):
+        circuit_scaling_experiment(zero_circuit, noiseless_model, 1, 1, 1, 1, method="stabilizer", with_mp=False, precision=0.1)
+
+def test_circuit_scaling_experiment_relative_precision_of_zero_estimate_terminates():
+    data = circuit_scaling_experiment(zero_circuit, noiseless_model, 1, 2, 1, 1, method="stabilizer", shots=8, with_mp=False,
+                                      precision=0.1, relative_precision=True, shot_budget=64)
+
+    assert sum(sum(counts.values()) for points in data.values() for _, counts in points.values()) == 64
+
+def test_sequential_sweep_clears_worker_state():
+    circuit_scaling_experiment(zero_circuit, noiseless_model, 1, 2, 1, 2, method="stabilizer", shots=4, with_mp=False)
+
+    assert Experiments._sweep_worker_state == {}
+
+def test_multiprocessing_requires_picklable_factories():
+    with pytest.raises(ValueError):
+        circuit_scaling_experiment(lambda n_qubits, circuit_length: zero_circuit(n_qubits, circuit_length), noiseless_model, 1, 1, 1, 1, with_mp=True)
+
+def test_worker_noise_models_are_bounded():
+    built = []
+    def noise_model_factory(n_qubits):
+        built.append(n_qubits)
+        return noiseless_model(n_qubits)
+
+    with Experiments._sequential_sweep_worker(zero_circuit, noise_model_factory):
+        for n_qubits in range(1, Experiments.max_worker_noise_models + 2):
+            Experiments._worker_noise_model(n_qubits)
+        assert len(Experiments._sweep_worker_state["noise_models"]) == Experiments.max_worker_noise_models
+
+        # Qubit count 1 was the least recently used and has been evicted, while the most recent one is reused
+        Experiments._worker_noise_model(Experiments.max_worker_noise_models + 1)
+        Experiments._worker_noise_model(1)
+        assert built == list(range(1, Experiments.max_worker_noise_models + 2)) + [1]
+
+@pytest.mark.parametrize("name", ["sweep.jsonl", "sweep"])
+def test_resume_reruns_points_with_other_settings(tmp_path, name):
+    path = str(tmp_path / name)
+    def sweep(shots=4, noise_model_factory=noiseless_model):
+        return circuit_scaling_experiment(zero_circuit, noise_model_factory, 1, 2, 1, 1, method="stabilizer", shots=shots, with_mp=False, results_path=path)
+
+    sweep()
+    n_records = len(open_result_store(path).records())
+    assert n_records == 2
+
+    # The same settings resume every point, while other shots or another noise model run them again
+    sweep()
+    assert len(open_result_store(path).records()) == n_records
+
+    data = sweep(shots=8)
+    assert len(open_result_store(path).records()) == 2*n_records
+    assert all(sum(counts.values()) == 8 for points in data.values() for _, counts in points.values())
+
+    sweep(shots=8, noise_model_factory=lambda n_qubits: construct_noise_model(n_qubits=n_qubits, depolarizing_error_1q=0.01))
+    assert len(open_result_store(path).records()) == 3*n_records
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from conftest import STEANE_TABLEAU
+from Experiments import benchmark_noise
+from FlagSynthesis import get_flag_schedules
+from Logical import LogicalCircuit
+from NoiseModel import construct_noise_model
+from PauliFrame import PauliFrameSampler
+
+FIVE_QUBIT_TABLEAU = ["XZZXI", "IXZZX", "XIXZZ", "ZXIXZ"]
+# Shor code, which has more Z-type stabilizers than ancillas, so its unflagged rounds are measured in batches
+SHOR_TABLEAU = ["ZZIIIIIII", "IZZIIIIII", "IIIZZIIII", "IIIIZZIII", "IIIIIIZZI", "IIIIIIIZZ", "XXXXXXIII", "IIIXXXXXX"]
+
+@pytest.mark.parametrize("label, tableau", [((7, 1, 3), STEANE_TABLEAU), ((5, 1, 3), FIVE_QUBIT_TABLEAU), ((9, 1, 3), SHOR_TABLEAU)])
+def test_distance_3_codes_run_end_to_end(label, tableau):
+    circuit = LogicalCircuit(1, label, tableau)
+    circuit.encode(0, initial_states=[1])
+    circuit.perform_qec_cycle()
+    circuit.measure_all()
+
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.0)
+    _, counts = benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=20, registers=circuit.logical_output_registers())
+    assert counts == {"1": 20}
+
+def logical_circuit(label, tableau, initial_state, qec_cycle=True, measure=True):
+    circuit = LogicalCircuit(1, label, tableau)
+    circuit.encode(0, initial_states=[initial_state])
+    if qec_cycle:
+        circuit.perform_qec_cycle()
+    if measure:
+        circuit.measure([0], [0])
+    return circuit
+
+# Injects every single Pauli fault after every gate of one QEC cycle, one fault per shot, and checks that none of them flips the logical output
+@pytest.mark.parametrize("label, tableau", [((7, 1, 3), STEANE_TABLEAU), ((9, 1, 3), SHOR_TABLEAU)])
+@pytest.mark.parametrize("initial_state", [0, 1])
+def test_qec_cycle_tolerates_every_single_fault(label, tableau, initial_state):
+    circuit = logical_circuit(label, tableau, initial_state)
+    assert all(schedule is not None for schedule in circuit.flag_schedules)
+
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=1e-3, depolarizing_error_2q=1e-3)
+    sampler = PauliFrameSampler(circuit, noise_model)
+
+    # Fault locations are numbered in program order, so those of the cycle lie between the locations of the encoding and of the measurement
+    n_encoding = len(PauliFrameSampler(logical_circuit(label, tableau, initial_state, qec_cycle=False, measure=False), noise_model).locations)
+    n_measurement = len(PauliFrameSampler(logical_circuit(label, tableau, initial_state, qec_cycle=False), noise_model).locations) - n_encoding
+
+    faults = {}
+    shots = 0
+    for location in range(n_encoding, len(sampler.locations) - n_measurement):
+        n_terms = len(sampler.locations[location][1][1])
+        faults[location] = (np.arange(shots, shots + n_terms), np.arange(n_terms))
+        shots += n_terms
+
+    outputs = circuit.get_logical_outputs(sampler.sample(shots, faults=faults))
+    assert shots > 0 and np.all(outputs == initial_state)
+
+def test_larger_distances_are_not_flagged():
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    schedules = get_flag_schedules(
+        (7, 1, 5), STEANE_TABLEAU, [circuit.flagged_stabilizers_1, circuit.flagged_stabilizers_2],
+        circuit.LogicalXVector, circuit.LogicalZVector, [(circuit.x_stabilizers, 0), (circuit.z_stabilizers, 1)], circuit.n_ancilla_qubits,
+    )
+    assert schedules == [None, None]
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import GF2 as gf2
+from conftest import STEANE_TABLEAU
+from Decoding import symplectic_product, tableau_to_symplectic
+
+# Parity checks of the [7,4] Hamming code
+HAMMING = np.array([
+    [1, 0, 1, 0, 1, 0, 1],
+    [0, 1, 1, 0, 0, 1, 1],
+    [0, 0, 0, 1, 1, 1, 1],
+])
+
+def test_pack_rows_round_trip_over_several_words():
+    matrix = np.random.default_rng(1).integers(0, 2, size=(5, 130))
+    packed = gf2.pack_rows(matrix)
+
+    assert packed.shape == (5, 3) and packed.dtype == np.uint64
+    assert np.array_equal(gf2.unpack_rows(packed, 130), matrix)
+
+def test_row_reduce():
+    packed = gf2.pack_rows([[0, 1, 1], [1, 1, 0], [1, 0, 1]])
+    assert gf2.row_reduce(packed) == [0, 1]
+    assert gf2.unpack_rows(packed, 3).tolist() == [[1, 0, 1], [0, 1, 1], [0, 0, 0]]
+
+    # Columns are eliminated in the given order
+    packed = gf2.pack_rows([[0, 1, 1], [1, 1, 0], [1, 0, 1]])
+    assert gf2.row_reduce(packed, columns=[2, 1, 0]) == [2, 1]
+    assert gf2.unpack_rows(packed, 3).tolist() == [[1, 0, 1], [1, 1, 0], [0, 0, 0]]
+
+    # Rows before start_row are left alone
+    packed = gf2.pack_rows([[1, 1, 0], [1, 1, 0], [0, 1, 1]])
+    assert gf2.row_reduce(packed, start_row=1) == [0, 1]
+    assert gf2.unpack_rows(packed, 3).tolist() == [[1, 1, 0], [1, 0, 1], [0, 1, 1]]
+
+@pytest.mark.parametrize("matrix, expected_rank", [
+    (HAMMING, 3),
+    (np.ones((2, 2), dtype=int), 1),
+    (np.zeros((3, 4), dtype=int), 0),
+    (np.eye(70, dtype=int), 70),
+    (np.concatenate([HAMMING, HAMMING[:1] ^ HAMMING[1:2]]), 3),
+])
+def test_rank(matrix, expected_rank):
+    assert gf2.rank(matrix) == expected_rank
+
+def test_nullspace():
+    basis = gf2.nullspace(HAMMING)
+    assert basis.shape == (4, 7)
+    assert not (HAMMING @ basis.T % 2).any()
+    assert gf2.rank(basis) == 4
+
+    assert gf2.nullspace(np.eye(3, dtype=int)).shape == (0, 3)
+
+    # Spread over several words, the nullspace of [I | I] pairs column j with column 64 + j
+    matrix = np.concatenate([np.eye(64, dtype=int), np.eye(64, dtype=int)], axis=1)
+    basis = gf2.nullspace(matrix)
+    assert basis.shape == (64, 128)
+    assert np.array_equal(basis, matrix)
+
+def test_symplectic_product():
+    def packed(*paulis):
+        return gf2.pack_symplectic(tableau_to_symplectic(list(paulis)))
+
+    assert gf2.symplectic_product(packed("X"), packed("Z")).tolist() == [[1]]
+    assert gf2.symplectic_product(packed("XX"), packed("ZZ", "ZI", "YY")).tolist() == [[0, 1, 0]]
+
+    # The Z half starts at a new word, so operators on more than 64 qubits anticommute as well
+    x, z = ["I"]*70, ["I"]*70
+    x[69], z[69] = "X", "Z"
+    assert gf2.symplectic_product(packed("".join(x)), packed("".join(z), "".join(x))).tolist() == [[1, 0]]
+
+    S = packed(*STEANE_TABLEAU)
+    assert not gf2.symplectic_product(S, S).any()
+
+# Decoding takes unpacked operators and returns products in the shape of a @ b.T, as before it was computed with GF2
+def test_decoding_symplectic_product_shapes():
+    rng = np.random.default_rng(2)
+    a, b = rng.integers(0, 2, size=(6, 14)), rng.integers(0, 2, size=(4, 14))
+    expected = (a[:, :7] @ b[:, 7:].T + a[:, 7:] @ b[:, :7].T) % 2
+
+    assert np.array_equal(symplectic_product(a, b), expected)
+    assert np.array_equal(symplectic_product(a, b[0]), expected[:, 0])
+    assert symplectic_product(a[0], b[0]).shape == () and int(symplectic_product(a[0], b[0])) == expected[0, 0]
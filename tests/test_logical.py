@@ -0,0 +1,190 @@
+import numpy as np
+import pytest
+from qiskit import QuantumCircuit
+from qiskit.circuit.library import XGate
+from qiskit.quantum_info import Pauli, StabilizerState
+
+from conftest import STEANE_TABLEAU
+from Analysis import target_tally
+from Experiments import benchmark_noise
+from Logical import LogicalCircuit
+from NoiseModel import construct_noise_model
+
+def prepared_circuit(offline_decoding=False):
+    circuit = LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU, offline_decoding=offline_decoding)
+    circuit.encode(0, 1, initial_states=[1, 0])
+    circuit.measure([0, 1], [0, 1])
+    return circuit
+
+def test_logical_outputs_of_full_and_restricted_outputs():
+    circuit = prepared_circuit()
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.0)
+    registers = circuit.logical_output_registers()
+
+    _, counts = benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=8)
+    _, output_counts = benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=8, registers=registers)
+
+    assert np.all(circuit.get_logical_outputs(list(counts)) == [1, 0])
+    assert np.all(circuit.get_logical_outputs(list(output_counts), registers=registers) == [1, 0])
+    assert target_tally(output_counts, ("logical_error_rate", [1, 0]), circuit=circuit, registers=registers)["sum"] == 0
+
+def test_logical_outputs_reject_missing_registers():
+    with pytest.raises(ValueError):
+        prepared_circuit().get_logical_outputs(["0"], registers=["unknown"])
+
+    # Offline decoding replays the syndrome history, so the outputs of the output register alone are not enough
+    with pytest.raises(ValueError):
+        prepared_circuit(offline_decoding=True).get_logical_outputs(["01"], registers=["output"])
+
+def run_output(circuit, shots=10):
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.0)
+    _, counts = benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=shots, registers=circuit.logical_output_registers())
+    return counts
+
+@pytest.mark.parametrize("loop", [True, False])
+def test_qec_cycles_as_loop_or_unrolled(loop):
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, initial_states=[1])
+    circuit.perform_qec_cycles(3, loop=loop)
+    circuit.measure_all()
+
+    assert any(instruction.operation.name == "for_loop" for instruction in circuit.data) == loop
+    assert run_output(circuit) == {"1": 10}
+
+def test_shared_ancilla_pool():
+    circuit = LogicalCircuit(3, (7, 1, 3), STEANE_TABLEAU, n_ancilla_blocks=1)
+    assert len(circuit.ancilla_pool) == 1
+    assert circuit.num_qubits < LogicalCircuit(3, (7, 1, 3), STEANE_TABLEAU).num_qubits
+
+    circuit.encode(0, 1, 2, initial_states=[1, 1, 0])
+    circuit.perform_qec_cycle()
+    circuit.measure_all()
+    assert run_output(circuit) == {"011": 10}
+
+def test_ancilla_blocks_must_be_positive():
+    with pytest.raises(ValueError):
+        LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU, n_ancilla_blocks=0)
+
+@pytest.mark.parametrize("control_state, target_state", [(0, 0), (0, 1), (1, 0), (1, 1)])
+def test_transversal_cx_truth_table(control_state, target_state):
+    circuit = LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, 1, initial_states=[control_state, target_state])
+    circuit.cx(0, 1)
+    circuit.measure_all()
+
+    # Logical qubit 0 is the rightmost character of the counts
+    assert run_output(circuit) == {f"{control_state ^ target_state}{control_state}": 10}
+
+# Codes without a transversal CX control the logical X of the target on every physical qubit of the control block
+def test_cx_of_non_css_code_controls_every_physical_qubit():
+    circuit = LogicalCircuit(2, (5, 1, 3), ["XZZXI", "IXZZX", "XIXZZ", "ZXIXZ"])
+    circuit.cx(0, 1)
+
+    instruction = circuit.data[-1]
+    assert instruction.operation.num_ctrl_qubits == 5
+    assert list(instruction.qubits) == circuit.logical_qregs[0][:] + circuit.logical_qregs[1][:]
+
+SHOR_TABLEAU = ["ZZIIIIIII", "IZZIIIIII", "IIIZZIIII", "IIIIZZIII", "IIIIIIZZI", "IIIIIIIZZ", "XXXXXXIII", "IIIXXXXXX"]
+
+# Logical Pauli of a single logical qubit as a qiskit Pauli, whose labels have qubit 0 on the right
+def logical_pauli(circuit, vector):
+    return Pauli("".join("IXZY"[x + 2*z] for x, z in zip(vector[0, 0], vector[1, 0]))[::-1])
+
+# Expectation values of the logical X, Y and Z after encoding |0> and applying the given logical gates
+def logical_expectations(circuit, gates):
+    state = QuantumCircuit(circuit.n)
+    state.append(circuit.encoding_gate, range(circuit.n))
+    for gate in gates:
+        state.append(gate, range(circuit.n))
+
+    logical_x, logical_z = logical_pauli(circuit, circuit.LogicalXVector), logical_pauli(circuit, circuit.LogicalZVector)
+    logical_y = 1j*logical_x.dot(logical_z)
+    state = StabilizerState(state)
+    return tuple(round(state.expectation_value(pauli)) for pauli in [logical_x, logical_y, logical_z])
+
+# H maps |0> to |+>, and S maps |+> to |+i> (a transversal Sdg on the Steane code, a transversal S would give |-i>), so S.S maps |+> to |->
+@pytest.mark.parametrize("label, tableau", [((7, 1, 3), STEANE_TABLEAU), ((9, 1, 3), SHOR_TABLEAU)])
+def test_logical_h_and_s_act_on_logical_paulis(label, tableau):
+    circuit = LogicalCircuit(1, label, tableau)
+    H, S = circuit.LogicalHGate, circuit.LogicalSGate
+
+    assert logical_expectations(circuit, []) == (0, 0, 1)
+    assert logical_expectations(circuit, [H]) == (1, 0, 0)
+    assert logical_expectations(circuit, [H, S]) == (0, 1, 0)
+    assert logical_expectations(circuit, [H, S, S]) == (-1, 0, 0)
+    assert logical_expectations(circuit, [H, S, S, H]) == (0, 0, -1)
+
+def test_steane_uses_transversal_h_and_sdg():
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+
+    assert [instruction.operation.name for instruction in circuit.LogicalHGate.definition.data] == ["h"]*7
+    assert [instruction.operation.name for instruction in circuit.LogicalSGate.definition.data] == ["sdg"]*7
+
+@pytest.mark.parametrize("initial_state", [0, 1])
+def test_logical_outputs_after_h_and_s(initial_state):
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, initial_states=[initial_state])
+    circuit.h(0)
+    circuit.h(0)
+    circuit.measure_all()
+    assert run_output(circuit) == {str(initial_state): 10}
+
+    # H.S.S.H = H.Z.H = X
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, initial_states=[initial_state])
+    circuit.h(0)
+    circuit.s(0)
+    circuit.s(0)
+    circuit.h(0)
+    circuit.measure_all()
+    assert run_output(circuit) == {str(1 - initial_state): 10}
+
+    # A single H gives both outputs
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, initial_states=[initial_state])
+    circuit.h(0)
+    circuit.measure_all()
+    assert set(run_output(circuit, shots=64)) == {"0", "1"}
+
+# Integer qargs of append are logical qubits, while bits of the circuit are physical qubits
+def test_append_maps_integer_qargs_to_logical_operations():
+    circuit = LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, 1)
+
+    circuit.append(XGate(), [1])
+    assert circuit.data[-1].operation is circuit.LogicalXGate
+    assert list(circuit.data[-1].qubits) == circuit.logical_qregs[1][:]
+
+    physical_qubit = circuit.logical_qregs[0][3]
+    circuit.append(XGate(), [physical_qubit])
+    assert circuit.data[-1].operation.name == "x"
+    assert list(circuit.data[-1].qubits) == [physical_qubit]
+
+    # The physical X is a correctable error on logical qubit 0
+    circuit.perform_qec_cycle()
+    circuit.measure_all()
+    assert run_output(circuit) == {"10": 10}
+
+    with pytest.raises(ValueError):
+        circuit.append(XGate(), [0], [circuit.output_creg[0]])
+
+def test_from_physical_circuit_inserts_qec_cycles():
+    physical_circuit = QuantumCircuit(2, 2)
+    for _ in range(3):
+        physical_circuit.x(0)
+        physical_circuit.barrier()
+        physical_circuit.cx(0, 1)
+    physical_circuit.measure([0, 1], [0, 1])
+
+    # Without an interval, no QEC cycles are inserted
+    circuit = LogicalCircuit.from_physical_circuit(physical_circuit, (7, 1, 3), STEANE_TABLEAU)
+    assert not any(phase == "flagged_cycle" for phase, _, _ in circuit.phase_spans)
+    assert run_output(circuit) == {"01": 10}
+
+    # Seven logical layers including the measurement (barriers do not count), with a cycle before layers 3, 5 and 7
+    circuit = LogicalCircuit.from_physical_circuit(physical_circuit, (7, 1, 3), STEANE_TABLEAU, qec_cycle_interval=2)
+    assert sum(phase == "flagged_cycle" for phase, _, _ in circuit.phase_spans) == 3
+    assert run_output(circuit) == {"01": 10}
+
+    circuit = LogicalCircuit.from_physical_circuit(physical_circuit, (7, 1, 3), STEANE_TABLEAU, qec_cycle_interval=1)
+    assert sum(phase == "flagged_cycle" for phase, _, _ in circuit.phase_spans) == 6
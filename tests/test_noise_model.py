@@ -0,0 +1,57 @@
+import copy
+import numpy as np
+import pytest
+from qiskit import QuantumCircuit, transpile
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel
+
+from NoiseModel import SharedNoiseModel, construct_noise_model
+
+noise_params = {
+    "depolarizing_error_1q": 0.01,
+    "depolarizing_error_2q": 0.05,
+    "thermal_relaxation_error": True,
+    "t1": 1e5,
+    "t2": 5e4,
+    "gate_time_1q": 50,
+    "gate_time_2q": 300,
+}
+
+def noisy_probabilities(noise_model):
+    circuit = QuantumCircuit(3)
+    circuit.h(0)
+    circuit.x(2)
+    circuit.cx(0, 1)
+    circuit.cz(2, 1)
+    circuit.h(2)
+    circuit.cx(1, 0)
+    circuit.save_probabilities()
+
+    simulator = AerSimulator(method="density_matrix", noise_model=noise_model)
+    return simulator.run(transpile(circuit, simulator, optimization_level=0)).result().data()["probabilities"]
+
+# Uniform errors are registered once for all qubits, which must act as the errors registered on every qubit (pair) when the qubits are given
+def test_all_qubit_errors_match_errors_per_qubit():
+    all_qubit_model = construct_noise_model(n_qubits=3, use_cache=False, **noise_params)
+    local_model = construct_noise_model(qubits=[0, 1, 2], use_cache=False, **noise_params)
+
+    assert not any("gate_qubits" in error for error in all_qubit_model.to_dict()["errors"])
+    assert all("gate_qubits" in error for error in local_model.to_dict()["errors"])
+    assert set(all_qubit_model.noise_instructions) == set(local_model.noise_instructions)
+    assert np.allclose(noisy_probabilities(all_qubit_model), noisy_probabilities(local_model))
+
+def test_memoized_noise_models_are_shared_and_immutable():
+    noise_model = construct_noise_model(n_qubits=3, **noise_params)
+    assert isinstance(noise_model, SharedNoiseModel)
+    assert construct_noise_model(n_qubits=3, **noise_params) is noise_model
+    assert construct_noise_model(n_qubits=3, use_cache=False, **noise_params) is not noise_model
+
+    with pytest.raises(TypeError):
+        noise_model.add_basis_gates(["u"])
+
+    # Copies are plain noise models with the same errors, which can be modified
+    copied = copy.deepcopy(noise_model)
+    assert type(copied) is NoiseModel
+    assert np.allclose(noisy_probabilities(copied), noisy_probabilities(noise_model))
+    copied.add_basis_gates(["u"])
+    assert "u" not in noise_model.basis_gates
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from qiskit.circuit.library import XGate
+
+from conftest import STEANE_TABLEAU
+from Experiments import benchmark_noise
+from Logical import LogicalCircuit
+from NoiseModel import construct_noise_model
+from PauliFrame import PauliFrameSampler, estimate_logical_error_rate
+
+def qec_circuit(rounds, loop=True, data_errors=()):
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0)
+    for qubits in data_errors:
+        for qubit in qubits:
+            circuit.append(XGate(), [circuit.logical_qregs[0][qubit]])
+        circuit.perform_qec_cycle()
+    circuit.perform_qec_cycles(rounds, loop=loop)
+    circuit.measure([0], [0])
+    return circuit
+
+# Compares the logical error rate of the Pauli-frame sampler with Aer, for QEC cycles emitted as a loop and unrolled
+@pytest.mark.parametrize("loop", [True, False])
+def test_logical_error_rate_matches_aer(loop):
+    circuit = qec_circuit(3, loop=loop)
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=3e-3, depolarizing_error_2q=3e-3)
+
+    shots = 4000
+    _, counts = benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=shots, registers=circuit.logical_output_registers())
+    outputs = circuit.get_logical_outputs(list(counts), registers=circuit.logical_output_registers())
+    aer_rate = sum(frequency for output, frequency in zip(outputs[:, 0], counts.values()) if output != 0)/shots
+    aer_std_error = np.sqrt(max(aer_rate, 1/shots)*(1-aer_rate)/shots)
+
+    estimate = estimate_logical_error_rate(circuit, noise_model, 100000, expected_output=[0], seed=3)
+    assert estimate["logical_error_rate"] > 0
+    assert abs(estimate["logical_error_rate"] - aer_rate) < 4*np.hypot(estimate["std_error"], aer_std_error)
+
+# Data errors injected before a QEC cycle are corrected if there is one per cycle, and flip the logical output if there are two
+@pytest.mark.parametrize("data_errors, expected_output", [([(2,), (5,)], 0), ([(1, 6)], 1)])
+def test_injected_data_errors_match_aer(data_errors, expected_output):
+    circuit = qec_circuit(1, data_errors=data_errors)
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.0)
+
+    _, counts = benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=8, registers=circuit.logical_output_registers())
+    assert np.all(circuit.get_logical_outputs(list(counts), registers=circuit.logical_output_registers()) == expected_output)
+
+    outputs = circuit.get_logical_outputs(PauliFrameSampler(circuit, noise_model=noise_model, seed=0).sample(8))
+    assert np.all(outputs == expected_output)
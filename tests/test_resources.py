@@ -0,0 +1,72 @@
+import pytest
+from qiskit import QuantumCircuit
+
+from conftest import STEANE_TABLEAU
+from Logical import LogicalCircuit
+from Resources import calibrate_cost_model, estimate_resources, select_feasible_method, ResourceLimitError
+
+def test_calibrate_cost_model():
+    cost_model = calibrate_cost_model(qubit_counts=(2, 6), depth=2, shots=4, repeats=1, seed=1)
+
+    assert set(cost_model) == {"overhead", "per_element"}
+    assert all(value >= 0 for value in cost_model.values())
+
+def test_select_feasible_method_uses_cost_model():
+    circuit = QuantumCircuit(2)
+    circuit.h(0)
+    circuit.t(0)
+    circuit.cx(0, 1)
+    circuit.measure_all()
+
+    # A prohibitive cost model leaves no method within the runtime limit, while a free one leaves the requested method feasible
+    method, _ = select_feasible_method(circuit, method="statevector", max_runtime=1.0, cost_model={"overhead": 0.0, "per_element": 0.0})
+    assert method == "statevector"
+
+    with pytest.raises(ResourceLimitError):
+        select_feasible_method(circuit, method="statevector", max_runtime=1.0, cost_model={"overhead": 1e3, "per_element": 0.0})
+
+def steane_qec_circuit(rounds=1):
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0)
+    circuit.perform_qec_cycles(rounds)
+    circuit.measure([0], [0])
+    return circuit
+
+def test_estimate_resources_per_phase():
+    circuit = steane_qec_circuit()
+    report = estimate_resources(circuit)
+    phases = report["phases"]
+    assert list(phases) == ["encode", "flagged_cycle", "unflagged_cycle", "decode", "measure"]
+
+    # Both flagged rounds (gates as in their extraction circuits and one measured ancilla per stabilizer) are counted, the second one being conditioned on the first one raising no flag
+    flagged_rounds = [
+        circuit.syndrome_extraction_circuit(circuit.flagged_stabilizers_1, flag_round=0).count_ops(),
+        circuit.syndrome_extraction_circuit(circuit.flagged_stabilizers_2, flag_round=1).count_ops(),
+    ]
+    assert phases["flagged_cycle"]["cx"] == sum(ops["cx"] for ops in flagged_rounds)
+    assert phases["flagged_cycle"]["gates"] == sum(sum(ops.values()) for ops in flagged_rounds)
+    assert phases["flagged_cycle"]["measurements"] == len(circuit.flagged_stabilizers_1) + len(circuit.flagged_stabilizers_2)
+    assert phases["flagged_cycle"]["conditionals"] == 1
+
+    # The unflagged X and Z rounds run in a single conditional, and measure one ancilla per stabilizer
+    assert phases["unflagged_cycle"]["conditionals"] == 1
+    assert phases["unflagged_cycle"]["measurements"] == len(STEANE_TABLEAU)
+
+    # Ancillas are reset and reused after every measurement, whereas the final measurement of the data qubits ends the circuit
+    for phase in ["encode", "flagged_cycle", "unflagged_cycle"]:
+        assert phases[phase]["mid_circuit_measurements"] == phases[phase]["measurements"] > 0
+    assert phases["measure"]["measurements"] == 7
+    assert phases["measure"]["mid_circuit_measurements"] == 0
+
+    assert phases["encode"]["conditionals"] == 0
+    assert phases["decode"]["gates"] == 0 and phases["decode"]["classical_operations"] > 0
+    for key in ["gates", "cx", "measurements", "mid_circuit_measurements", "conditionals", "classical_operations"]:
+        assert report["total"][key] == sum(phase[key] for phase in phases.values())
+
+# The body of a loop of QEC cycles is counted once per iteration
+def test_estimate_resources_of_looped_cycles():
+    cycle = estimate_resources(steane_qec_circuit())["phases"]
+    looped = estimate_resources(steane_qec_circuit(rounds=3))["phases"]
+
+    for key in ["gates", "measurements", "mid_circuit_measurements", "conditionals"]:
+        assert looped["qec_cycles"][key] == 3*(cycle["flagged_cycle"][key] + cycle["unflagged_cycle"][key])
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pytest
+
+from Analysis import column_exp_vals
+from ResultStore import ColumnarSweepStore, SweepResultStore, open_result_store
+
+def sweep_records():
+    return [
+        {"n_qubits": 2, "circuit_length": 1, "method": "stabilizer", "shots": 4, "status": "ok", "counts": {"00": 3, "11": 1}, "time_taken": 0.5},
+        {"n_qubits": 2, "circuit_length": 2, "method": "stabilizer", "shots": 4, "status": "skipped", "error": "Too large"},
+        {"n_qubits": 2, "circuit_length": 1, "method": "statevector", "shots": 4, "status": "ok", "counts": {"01": 4}, "time_taken": 0.25,
+         "tally": {"shots": 4, "sum": 4.0, "sum_sq": 4.0, "binary": True}, "config": {"method": "statevector", "shots": 4}},
+    ]
+
+def test_open_result_store(tmp_path):
+    assert type(open_result_store(tmp_path / "sweep.jsonl")) is SweepResultStore
+    assert type(open_result_store(tmp_path / "sweep")) is ColumnarSweepStore
+    with pytest.raises(ValueError):
+        open_result_store(tmp_path / "sweep.json")
+
+def test_columnar_store_round_trip(tmp_path):
+    store = ColumnarSweepStore(str(tmp_path / "sweep"))
+    for record in sweep_records():
+        store.append(record)
+
+    assert ColumnarSweepStore(store.path).records() == sweep_records()
+
+    # Only the latest successful record of each point is kept
+    columns = store.latest_columns()
+    assert list(columns["n_qubits"]) == [2] and list(columns["circuit_length"]) == [1]
+    assert np.allclose(column_exp_vals(columns), [1.0])
+
+def test_columnar_store_ignores_partial_rows(tmp_path):
+    store = ColumnarSweepStore(str(tmp_path / "sweep"))
+    records = sweep_records()
+    store.append(records[0])
+
+    # A crash while writing the point columns leaves some of them one entry longer
+    with open(os.path.join(store.path, "n_qubits.bin"), "ab") as f:
+        f.write(np.array([7], dtype=store.columns()["n_qubits"].dtype).tobytes())
+    with open(os.path.join(store.path, "strings.jsonl"), "a") as f:
+        f.write('"trunc')
+
+    store = ColumnarSweepStore(store.path)
+    assert store.records() == records[:1]
+
+    store.append(records[2])
+    assert store.records() == [records[0], records[2]]
@@ -0,0 +1,44 @@
+import pytest
+from qiskit import QuantumCircuit
+
+from conftest import STEANE_TABLEAU
+from Logical import LogicalCircuit
+from Scheduling import asap_layers, schedule_instructions
+
+def test_asap_layers():
+    circuit = QuantumCircuit(3, 1)
+    circuit.h(0)
+    circuit.h(2)
+    circuit.cx(0, 1)
+    circuit.measure(2, 0)
+    circuit.x(1)
+    circuit.x(2)
+
+    layers = [[(operation.name, qubits, clbits) for operation, qubits, clbits in layer] for layer in asap_layers(circuit)]
+    assert layers == [
+        [("h", [0], []), ("h", [2], [])],
+        [("cx", [0, 1], []), ("measure", [2], [0])],
+        [("x", [1], []), ("x", [2], [])],
+    ]
+
+def test_schedule_instructions_of_loops_and_barriers():
+    body = QuantumCircuit(2)
+    body.h(0)
+    body.cx(0, 1)
+
+    circuit = QuantumCircuit(2)
+    circuit.barrier()
+    circuit.for_loop(range(3), None, body, [0, 1], [])
+    circuit.measure_all(add_bits=True)
+
+    assert schedule_instructions(circuit.data) == (3*2 + 1, 3*(50 + 300) + 1000)
+
+# The QEC rounds of all logical qubits run in parallel, so the schedule of a cycle does not grow with the number of logical qubits
+@pytest.mark.parametrize("n_logical_qubits", [1, 2, 4])
+def test_qec_cycle_schedule_is_independent_of_logical_qubits(n_logical_qubits):
+    circuit = LogicalCircuit(n_logical_qubits, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(*range(n_logical_qubits))
+
+    assert circuit.perform_qec_cycle() == {"depth": 41, "duration": 16600}
+    assert circuit.perform_qec_cycles(2, loop=True) == {"depth": 82, "duration": 33200}
+    assert circuit.perform_qec_cycles(2, loop=False) == {"depth": 82, "duration": 33200}
@@ -0,0 +1,118 @@
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit_aer.noise import NoiseModel, amplitude_damping_error
+
+from conftest import STEANE_TABLEAU
+from Experiments import benchmark_noise
+from Logical import LogicalCircuit
+from NoiseModel import construct_noise_model
+from Simulation import SimulationSession, aer_run_options, find_non_clifford_instructions, has_classical_stores, select_simulation_method
+
+def test_aer_run_options_disable_fusion_only_for_stores():
+    circuit = LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, 1)
+    circuit.measure([0, 1], [0, 1])
+
+    assert has_classical_stores(circuit)
+    assert aer_run_options(circuit, "statevector") == {"fusion_enable": False}
+    assert aer_run_options(circuit, "stabilizer") == {}
+
+    plain = QuantumCircuit(2, 2)
+    plain.h(0)
+    plain.measure([0, 1], [0, 1])
+    assert not has_classical_stores(plain)
+    assert aer_run_options(plain, "statevector") == {}
+
+# The output register of a LogicalCircuit with several logical qubits is only written by stores, which failed with "invalid cbit index"
+def test_statevector_runs_two_logical_qubits():
+    circuit = LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, 1, initial_states=[1, 0])
+    circuit.measure([0, 1], [0, 1])
+
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.0)
+    _, counts = benchmark_noise(circuit, noise_model=noise_model, method="statevector", shots=5, registers=circuit.logical_output_registers())
+
+    assert counts == {"01": 5}
+
+def steane_zero_circuit():
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0)
+    circuit.measure([0], [0])
+    return circuit
+
+def test_session_reuses_simulators_and_transpiled_circuits():
+    session = SimulationSession()
+    circuit = steane_zero_circuit()
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.001, use_cache=False)
+
+    benchmark_noise(circuit, noise_model=noise_model, method="stabilizer", shots=4, session=session)
+    simulator = session.simulator("stabilizer", noise_model)
+    (transpiled,) = session._transpiled_circuits.values()
+    assert (session.transpile_cache_hits, session.transpile_cache_misses) == (0, 1)
+
+    # Changing the shots, or rebuilding a structurally identical circuit, reuses both the simulator and the transpiled circuit
+    _, counts = benchmark_noise(steane_zero_circuit(), noise_model=noise_model, method="stabilizer", shots=8, session=session)
+    assert sum(counts.values()) == 8
+    assert session.simulator("stabilizer", noise_model) is simulator
+    assert (session.transpile_cache_hits, session.transpile_cache_misses) == (1, 1)
+    assert session.transpile(circuit, simulator) is transpiled
+
+    # Another noise model gets its own simulator, but shares the transpiled circuit as long as its basis gates are the same
+    other_noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.01, use_cache=False)
+    benchmark_noise(circuit, noise_model=other_noise_model, method="stabilizer", shots=4, session=session)
+    assert len(session._simulators) == 2
+    assert session.simulator("stabilizer", other_noise_model) is not simulator
+    assert session.transpile_cache_misses == 1 and len(session._transpiled_circuits) == 1
+
+    # Another method is transpiled separately
+    benchmark_noise(circuit, noise_model=noise_model, method="statevector", shots=4, session=session)
+    assert session.transpile_cache_misses == 2
+
+# Transpiling with a coupling map alongside the simulator used to widen circuits to every qubit the simulator supports
+def test_session_keeps_circuit_width():
+    session = SimulationSession()
+    circuit = steane_zero_circuit()
+    simulator = session.simulator("stabilizer", construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=0.0))
+
+    assert session.transpile(circuit, simulator).num_qubits == circuit.num_qubits
+
+def test_logical_clifford_circuits_are_routed_to_stabilizer():
+    circuit = LogicalCircuit(2, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0, 1)
+    circuit.h(0)
+    circuit.s(1)
+    circuit.cx(0, 1)
+    circuit.perform_qec_cycles(2)
+    circuit.measure_all()
+
+    noise_model = construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=1e-3, depolarizing_error_2q=1e-3)
+    method, report = select_simulation_method(circuit, noise_model=noise_model)
+    assert method == "stabilizer"
+    assert report["non_clifford_instructions"] == [] and report["non_pauli_errors"] == []
+
+    # Non-Pauli noise forces the fallback even for Clifford circuits
+    noise_model = NoiseModel()
+    noise_model.add_all_qubit_quantum_error(amplitude_damping_error(0.01), ["h", "x"])
+    method, report = select_simulation_method(circuit, noise_model=noise_model, fallback_method="density_matrix")
+    assert method == "density_matrix" and report["non_pauli_errors"]
+
+def branching_circuit(else_gate):
+    circuit = QuantumCircuit(2, 1)
+    circuit.h(0)
+    circuit.rz(np.pi/2, 1)
+    circuit.measure(0, 0)
+    with circuit.if_test((circuit.clbits[0], 1)) as else_:
+        circuit.x(1)
+    with else_:
+        getattr(circuit, else_gate)(1)
+    return circuit
+
+# The t gate used to be reported as Clifford, as it got the id of the freed x gate of the other branch, whose result was memoized
+def test_non_clifford_gate_in_control_flow_forces_fallback():
+    (instruction,) = find_non_clifford_instructions(branching_circuit("t"))
+    assert instruction["name"] == "t" and instruction["qubits"] == [1]
+    assert instruction["location"] == [(3, "if_else", 1), (0, "t", None)]
+    assert select_simulation_method(branching_circuit("t"))[0] == "statevector"
+
+    assert find_non_clifford_instructions(branching_circuit("s")) == []
+    assert select_simulation_method(branching_circuit("s"))[0] == "stabilizer"
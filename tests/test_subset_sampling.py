@@ -0,0 +1,50 @@
+import itertools
+import pytest
+from qiskit_aer.noise import NoiseModel, pauli_error
+
+from conftest import STEANE_TABLEAU
+from Logical import LogicalCircuit
+from NoiseModel import construct_noise_model, gates_1q, gates_2q
+from PauliFrame import estimate_logical_error_rate
+from SubsetSampling import SubsetSampler, _fault_configurations, subset_sample
+
+def steane_qec_circuit():
+    circuit = LogicalCircuit(1, (7, 1, 3), STEANE_TABLEAU)
+    circuit.encode(0)
+    circuit.perform_qec_cycle()
+    circuit.measure([0], [0])
+    return circuit
+
+def depolarizing_model(circuit, p):
+    return construct_noise_model(n_qubits=circuit.num_qubits, depolarizing_error_1q=p, depolarizing_error_2q=p)
+
+@pytest.mark.parametrize("class_sizes, max_faults", [([66, 24], 3), ([3, 1, 2, 0], 4), ([5], 2)])
+def test_fault_configurations_are_bounded_by_max_faults(class_sizes, max_faults):
+    expected = {w for w in itertools.product(*[range(min(max_faults, N) + 1) for N in class_sizes]) if sum(w) <= max_faults}
+    configurations = list(_fault_configurations(class_sizes, max_faults))
+
+    assert len(configurations) == len(expected) and set(configurations) == expected
+
+# Sampling once and reweighting to another physical error rate agrees with direct sampling at that rate, up to the unsampled weight
+@pytest.mark.parametrize("p", [1e-2, 3e-3])
+def test_reweighted_rate_matches_direct_sampling(p):
+    circuit = steane_qec_circuit()
+    result = subset_sample(circuit, depolarizing_model(circuit, 1e-3), max_faults=3, shots_per_stratum=2000, seed=1)
+
+    estimate = result.logical_error_rate(depolarizing_model(circuit, p))
+    direct = estimate_logical_error_rate(circuit, depolarizing_model(circuit, p), 200000, seed=2)
+
+    tolerance = 4*(estimate["std_error"]**2 + direct["std_error"]**2)**0.5
+    assert direct["logical_error_rate"] - estimate["truncation"] - tolerance <= estimate["logical_error_rate"] <= direct["logical_error_rate"] + tolerance
+
+def test_fault_probabilities_reject_other_error_distributions():
+    circuit = steane_qec_circuit()
+    sampler = SubsetSampler(circuit, depolarizing_model(circuit, 1e-3))
+    assert sorted(sampler.fault_probabilities(depolarizing_model(circuit, 1e-2))) == pytest.approx([3/4*1e-2, 15/16*1e-2])
+
+    # Bit flips on the same instructions give the same fault locations, but another distribution of errors at each of them
+    bit_flips = NoiseModel()
+    bit_flips.add_all_qubit_quantum_error(pauli_error([("X", 1e-3), ("I", 1 - 1e-3)]), gates_1q)
+    bit_flips.add_all_qubit_quantum_error(pauli_error([("XX", 1e-3), ("II", 1 - 1e-3)]), gates_2q)
+    with pytest.raises(ValueError):
+        sampler.fault_probabilities(bit_flips)